@@ -2,8 +2,12 @@
 Comic Generator Flask Application
 Main entry point - registers all Blueprints
 """
+import os
+import time
 import logging
-from flask import Flask
+import importlib
+import threading
+from flask import Flask, g, request
 from flask_cors import CORS
 
 # Configure logging
@@ -15,20 +19,166 @@ logging.basicConfig(
     ]
 )
 
+logger = logging.getLogger(__name__)
 
-# Configure Flask with explicit static folder
-app = Flask(__name__, static_folder='static', static_url_path='/static')
-CORS(app)  # Enable CORS for frontend requests
+# SDKs the services import on first use; COMIC_PREWARM=1 loads them in the
+# background after startup so the first generation request does not wait
+PREWARM_MODULES = (
+    'google.genai',
+    'openai',
+    'langchain_openai',
+    'langchain_core.messages',
+    'requests',
+    'PIL.Image',
+    'services.comic_service',
+    'services.image_service',
+    'services.social_media_service',
+)
+
+
+def create_app() -> Flask:
+    """Build the Flask application with every blueprint registered"""
+    # Configure Flask with explicit static folder
+    app = Flask(__name__, static_folder='static', static_url_path='/static')
+    CORS(app)  # Enable CORS for frontend requests
+
+    # Register blueprints
+    from controllers import comic_bp, image_bp, social_bp, job_bp, system_bp, export_bp
+
+    app.register_blueprint(comic_bp)
+    app.register_blueprint(image_bp)
+    app.register_blueprint(social_bp)
+    app.register_blueprint(job_bp)
+    app.register_blueprint(system_bp)
+    app.register_blueprint(export_bp)
+
+    from utils.metrics import observe_request
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            # Keyed by URL rule, not path, so label cardinality stays bounded
+            rule = request.url_rule.rule if request.url_rule else None
+            observe_request(rule, request.method, response.status_code, time.perf_counter() - started)
+        return response
+
+    return app
+
+
+def warm_up_shared() -> None:
+    """
+    Load state that is safe to share across forked workers
+
+    Called once in the master before forking: imports, decoders and the
+    memoized prompt templates end up in copy-on-write memory.
+    """
+    from PIL import Image
+    from utils.prompt_registry import prompt_registry
+
+    Image.init()
+    rendered = prompt_registry.warm()
+    logger.info(f"Pre-rendered {rendered} prompts")
+
+
+def prewarm_imports() -> None:
+    """Import the modules in PREWARM_MODULES, logging how long each took"""
+    started = time.perf_counter()
+    for name in PREWARM_MODULES:
+        module_started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"Pre-warm could not import {name}: {e}")
+            continue
+        logger.debug(f"Pre-warmed {name} in {time.perf_counter() - module_started:.3f}s")
+    logger.info(f"Pre-warmed {len(PREWARM_MODULES)} modules in {time.perf_counter() - started:.2f}s")
+
+
+def _warm_up_clients() -> None:
+    from utils.client_pool import get_genai_client, get_chat_model
+
+    google_api_key = os.getenv('GOOGLE_API_KEY') or os.getenv('GEMINI_API_KEY')
+    if google_api_key:
+        get_genai_client(google_api_key)
+    openai_api_key = os.getenv('OPENAI_API_KEY')
+    if openai_api_key:
+        get_chat_model(
+            openai_api_key,
+            os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1'),
+            os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+        )
+
+
+def warm_up_worker() -> None:
+    """
+    Build per-process clients ahead of the first request
+
+    Called in each worker after forking, since HTTP connection pools must
+    not be shared between processes. Only keys configured in the
+    environment can be warmed; per-request keys are pooled on first use.
+    Runs on a background thread so the worker starts serving immediately;
+    with COMIC_PREWARM=1 it also imports the SDKs up front. Also starts the
+    image retention sweeper when a retention limit is configured,
+    re-queues images a previous process staged but never stored, and
+    publishes metrics to COMIC_METRICS_DIR when it is set.
+    """
+    def run():
+        try:
+            if os.getenv('COMIC_PREWARM', '0').lower() in ('1', 'true', 'yes', 'on'):
+                prewarm_imports()
+            _warm_up_clients()
+        except Exception as e:
+            logger.warning(f"Worker warm-up failed: {e}")
+        try:
+            from comic_generator import get_image_storage, get_image_writer
+
+            get_image_storage().start_sweeper()
+            get_image_writer().recover()
+        except Exception as e:
+            logger.warning(f"Image storage warm-up failed: {e}")
+        try:
+            from controllers.system_controller import collect_stats
+            from utils.metrics import metrics, shared_metrics
+
+            if shared_metrics is not None:
+                shared_metrics.start(metrics, collect_stats)
+        except Exception as e:
+            logger.warning(f"Metrics publishing failed to start: {e}")
+
+    threading.Thread(target=run, name='comic-prewarm', daemon=True).start()
+
+
+def shutdown() -> None:
+    """Let background jobs finish before the process exits"""
+    from comic_generator import stop_image_storage
+    from services.export_service import shutdown_export_executor
+    from utils.jobs import shutdown_job_manager
+    from utils.retry import cancel_retry_waits
+
+    # Draining: finish attempts in flight, but start no new ones after a backoff
+    cancel_retry_waits()
+    shutdown_job_manager(wait=True)
+    shutdown_export_executor()
+    stop_image_storage()
+
+    from controllers.system_controller import collect_stats
+    from utils.metrics import metrics, shared_metrics
+
+    if shared_metrics is not None:
+        shared_metrics.stop(metrics, collect_stats)
 
-# Register blueprints
-from controllers import comic_bp, image_bp, social_bp
 
-app.register_blueprint(comic_bp)
-app.register_blueprint(image_bp)
-app.register_blueprint(social_bp)
+app = create_app()
 
 
 if __name__ == '__main__':
-    import os
     port = int(os.environ.get('PORT', 5003))
+    # Only the reloader's child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up_worker()
     app.run(host='0.0.0.0', port=port, debug=True)
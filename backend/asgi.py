@@ -0,0 +1,101 @@
+"""
+ASGI entry point
+
+POST requests to the generation endpoints are handled natively by the
+async handlers in controllers/async_controller.py; every other request
+(static files, streaming endpoints, jobs, CORS preflight) is passed to the
+Flask app through a2wsgi's WSGI adapter. Run it with:
+
+    uv run --extra asgi serve.py --asgi
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+from a2wsgi import WSGIMiddleware
+
+from app import app as flask_app, warm_up_shared, warm_up_worker, shutdown
+from controllers.async_controller import ASYNC_ROUTES, dispatch
+from utils.metrics import observe_request
+
+logger = logging.getLogger(__name__)
+
+# Largest JSON body accepted by the async routes (data URI references can be large)
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+# Flask requests run on this many threads; streaming endpoints hold one for
+# their whole response, so a single NDJSON stream cannot block the others
+wsgi_application = WSGIMiddleware(flask_app, workers=int(os.getenv("COMIC_ASGI_WSGI_THREADS", 32)))
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionError("Client disconnected")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _send_json(send, body: dict, status: int) -> None:
+    payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode("ascii")),
+            # Same as flask_cors defaults on the Flask side
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                warm_up_shared()
+                warm_up_worker()
+            except Exception as e:
+                logger.warning(f"Warm-up failed: {e}")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Waits for background jobs; keep the event loop free meanwhile
+            await asyncio.to_thread(shutdown)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send) -> None:
+    """ASGI application: async generation routes, everything else via Flask"""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+
+    if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in ASYNC_ROUTES:
+        try:
+            body = await _read_body(receive)
+        except ConnectionError:
+            return
+        except ValueError as e:
+            await _send_json(send, {"error": str(e)}, 413)
+            return
+        started = time.perf_counter()
+        response, status = await dispatch(scope["path"], body)
+        observe_request(scope["path"], "POST", status, time.perf_counter() - started)
+        await _send_json(send, response, status)
+        return
+
+    await wsgi_application(scope, receive, send)
@@ -0,0 +1,365 @@
+"""
+Local stand-in for the Gemini and OpenAI-compatible APIs
+
+Serves just enough of both HTTP APIs for the backend to run end to end
+without spending quota:
+
+    POST /v1beta/models/<model>:generateContent   Gemini, returns a synthetic PNG
+    POST /v1/chat/completions                     OpenAI, JSON built from the
+                                                  request's response_format/tools
+    GET  /images/<name>.png                       static PNG with an ETag, for /api/proxy-image
+
+Latency, 5xx failures, 429s and image-less Gemini responses can be
+injected. Run it on its own and point the backend at it:
+
+    uv run benchmarks/fake_upstream.py --port 8090 --image-latency 2 --rate-limit-rate 0.05
+    COMIC_GEMINI_BASE_URL=http://127.0.0.1:8090 uv run serve.py
+
+and send "base_url": "http://127.0.0.1:8090/v1" with LLM requests.
+benchmarks/load_test.py starts one in-process automatically.
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+GEMINI_PATH = re.compile(r"^/[^/]+/models/([^/:]+):generateContent$")
+IMAGE_PATH = re.compile(r"^/images/([\w.-]+)\.png$")
+
+
+@dataclass
+class FakeConfig:
+    """Behaviour of the fake upstream; rates are probabilities per request"""
+
+    llm_latency: float = 0.5
+    image_latency: float = 1.0
+    # Latencies are drawn uniformly from latency * (1 +/- jitter)
+    jitter: float = 0.2
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    no_image_rate: float = 0.0
+    image_size: int = 1024
+    # Items generated for every JSON-schema array (pages, rows, panels, ...)
+    array_items: int = 3
+    # Cache-Control max-age of /images/* (0 makes the proxy revalidate every time)
+    image_max_age: int = 3600
+    seed: Optional[int] = None
+
+
+def synthetic_png(size: int, seed: int = 0) -> bytes:
+    """Noisy gradient PNG, roughly the size of a real generated page"""
+    from PIL import Image, ImageChops
+
+    gradient = Image.linear_gradient("L").resize((size, size))
+    noise = Image.effect_noise((size, size), 64)
+    shift = (seed * 37) % 256
+    channels = [
+        ImageChops.add(gradient, noise),
+        ImageChops.offset(gradient, shift, 0),
+        ImageChops.add(noise.rotate(90), gradient.rotate(180)),
+    ]
+    buffer = io.BytesIO()
+    Image.merge("RGB", channels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def example_from_schema(schema: Dict[str, Any], array_items: int, defs: Optional[Dict[str, Any]] = None,
+                        name: str = "value") -> Any:
+    """Build a value that validates against a (pydantic-generated) JSON schema"""
+    defs = defs if defs is not None else schema.get("$defs", schema.get("definitions", {}))
+    if "$ref" in schema:
+        return example_from_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], array_items, defs, name)
+    for combinator in ("anyOf", "oneOf", "allOf"):
+        if combinator in schema:
+            options = [option for option in schema[combinator] if option.get("type") != "null"]
+            return example_from_schema(options[0] if options else {}, array_items, defs, name)
+    if "enum" in schema:
+        return schema["enum"][0]
+
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "string")
+    if kind == "object":
+        return {
+            key: example_from_schema(value, array_items, defs, key)
+            for key, value in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        count = max(schema.get("minItems", 0), min(array_items, schema.get("maxItems", array_items)))
+        return [example_from_schema(schema.get("items", {}), array_items, defs, name) for _ in range(count)]
+    if kind == "integer":
+        return schema.get("minimum", 1)
+    if kind == "number":
+        return float(schema.get("minimum", 1.0))
+    if kind == "boolean":
+        return True
+    if name == "height":
+        return "180px"
+    return f"Synthetic {name} {random.randint(1000, 9999)}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeUpstream"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json",
+              headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        self._send(status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _inject_fault(self, api: str) -> bool:
+        """Sleep for the configured latency, then maybe answer with an error; True if one was sent"""
+        upstream = self.server
+        config = upstream.config
+        latency = config.image_latency if api == "gemini" else config.llm_latency
+        roll = upstream.random()
+        if roll < config.rate_limit_rate:
+            upstream.count(f"{api}_429")
+            message = "Resource has been exhausted (e.g. check quota)."
+            self._send_json(429, _error_body(api, 429, message, "RESOURCE_EXHAUSTED"),
+                            {"Retry-After": f"{config.retry_after:g}"})
+            return True
+        time.sleep(max(0.0, latency * (1 + (upstream.random() * 2 - 1) * config.jitter)))
+        if roll < config.rate_limit_rate + config.error_rate:
+            upstream.count(f"{api}_5xx")
+            self._send_json(503, _error_body(api, 503, "The model is overloaded.", "UNAVAILABLE"))
+            return True
+        return False
+
+    def do_POST(self) -> None:
+        try:
+            body = self._read_json()
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON"}})
+            return
+
+        match = GEMINI_PATH.match(self.path.split("?", 1)[0])
+        if match:
+            if not self._inject_fault("gemini"):
+                self._gemini(match.group(1))
+            return
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            if not self._inject_fault("llm"):
+                self._chat_completion(body)
+            return
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self) -> None:
+        match = IMAGE_PATH.match(self.path.split("?", 1)[0])
+        if not match:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        self.server.count("images")
+        png, etag = self.server.image(int(hashlib.md5(match.group(1).encode()).hexdigest(), 16) % 4)
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={self.server.config.image_max_age}"}
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send(200, png, "image/png", headers)
+
+    do_HEAD = do_GET
+
+    def _gemini(self, model: str) -> None:
+        upstream = self.server
+        upstream.count("gemini")
+        if upstream.random() < upstream.config.no_image_rate:
+            upstream.count("gemini_no_image")
+            candidate = {"content": {"role": "model", "parts": []}, "finishReason": "SAFETY", "index": 0}
+        else:
+            png, _ = upstream.image(upstream.randrange(4))
+            candidate = {
+                "content": {"role": "model", "parts": [
+                    {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(png).decode("ascii")}}
+                ]},
+                "finishReason": "STOP",
+                "index": 0,
+            }
+        self._send_json(200, {
+            "candidates": [candidate],
+            "modelVersion": model,
+            "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": 1290, "totalTokenCount": 1390},
+        })
+
+    def _chat_completion(self, body: Dict[str, Any]) -> None:
+        upstream = self.server
+        upstream.count("llm")
+        config = upstream.config
+        message: Dict[str, Any] = {"role": "assistant", "content": None}
+        finish_reason = "stop"
+
+        response_format = body.get("response_format") or {}
+        tools = body.get("tools") or []
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"].get("schema", {})
+            message["content"] = json.dumps(example_from_schema(schema, config.array_items), ensure_ascii=False)
+        elif tools:
+            function = tools[0]["function"]
+            arguments = example_from_schema(function.get("parameters", {}), config.array_items)
+            message["tool_calls"] = [{
+                "id": f"call_{upstream.randrange(10 ** 8)}",
+                "type": "function",
+                "function": {"name": function["name"], "arguments": json.dumps(arguments, ensure_ascii=False)},
+            }]
+            finish_reason = "tool_calls"
+        else:
+            # Same JSON shape SocialMediaService asks for in its prompt
+            message["content"] = "```json\n" + json.dumps({
+                "title": "Synthetic title",
+                "content": "Synthetic content for a benchmark run.",
+                "tags": ["#comic", "#benchmark"],
+            }) + "\n```"
+
+        completion_id = f"chatcmpl-{upstream.randrange(10 ** 12)}"
+        usage = {"prompt_tokens": 200, "completion_tokens": 400, "total_tokens": 600}
+        if body.get("stream"):
+            self._stream_completion(completion_id, body.get("model", "fake"), message, finish_reason, usage)
+            return
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": usage,
+        })
+
+    def _stream_completion(self, completion_id: str, model: str, message: Dict[str, Any],
+                           finish_reason: str, usage: Dict[str, int]) -> None:
+        content = message.get("content") or ""
+        pieces = [content[i:i + 64] for i in range(0, len(content), 64)]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        chunks = [{"role": "assistant", "content": ""}] + [{"content": piece} for piece in pieces]
+        for delta in chunks:
+            event = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+        final = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}], "usage": usage}
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+
+
+def _error_body(api: str, code: int, message: str, status: str) -> Dict[str, Any]:
+    if api == "gemini":
+        return {"error": {"code": code, "message": message, "status": status}}
+    return {"error": {"message": message, "type": status.lower(), "code": str(code)}}
+
+
+class FakeUpstream(ThreadingHTTPServer):
+    """Threaded HTTP server answering as Gemini and an OpenAI-compatible API"""
+
+    daemon_threads = True
+    # Concurrent connections are bounded by the load test, not the listen backlog
+    request_queue_size = 1024
+
+    def __init__(self, config: FakeConfig, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.config = config
+        self._random = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self._images: Dict[int, Tuple[bytes, str]] = {}
+        self.counters: Dict[str, int] = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def random(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def randrange(self, stop: int) -> int:
+        with self._lock:
+            return self._random.randrange(stop)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def image(self, variant: int) -> Tuple[bytes, str]:
+        """Return (png, etag) for one of a few pre-rendered variants"""
+        with self._lock:
+            cached = self._images.get(variant)
+        if cached is None:
+            png = synthetic_png(self.config.image_size, variant)
+            cached = (png, f'"{hashlib.sha256(png).hexdigest()[:32]}"')
+            with self._lock:
+                self._images.setdefault(variant, cached)
+        return cached
+
+    def start(self) -> "FakeUpstream":
+        """Render the images and serve on a daemon thread"""
+        for variant in range(4):
+            self.image(variant)
+        threading.Thread(target=self.serve_forever, name="fake-upstream", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add one --option per FakeConfig field (shared with load_test.py)"""
+    for field in fields(FakeConfig):
+        kind = int if field.type is int or field.name == "seed" else float
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=kind, default=field.default,
+                            help=f"fake upstream {field.name.replace('_', ' ')} (default: {field.default})")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(**{field.name: getattr(args, field.name) for field in fields(FakeConfig)})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a fake Gemini/OpenAI API for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeUpstream(config_from_args(args), args.host, args.port)
+    print(f"Fake upstream listening on {server.url} (Gemini base URL {server.url}, OpenAI base URL {server.url}/v1)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.counters))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Import-time benchmark for the backend
+
+Imports each module in a fresh interpreter and reports the median wall
+time and resident memory it adds, plus a "startup" row that imports the
+app and serves the first /api/health request. Run from backend/:
+
+    uv run benchmarks/import_time.py
+    uv run benchmarks/import_time.py --repeat 9 --json import_time.json
+    uv run benchmarks/import_time.py --compare import_time.json
+    uv run benchmarks/import_time.py services.comic_service google.genai
+
+Use --json on a known-good commit and --compare afterwards to catch
+regressions, e.g. a heavy SDK imported at module level again.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    "flask",
+    "utils",
+    "comic_generator",
+    "services",
+    "services.comic_service",
+    "services.image_service",
+    "services.social_media_service",
+    "controllers",
+    "app",
+    "google.genai",
+    "openai",
+    "langchain_openai",
+    "requests",
+    "PIL.Image",
+]
+
+# SDKs that should not be loaded by importing the app itself
+HEAVY_MODULES = ["google.genai", "openai", "langchain_openai", "langchain_core", "requests", "PIL.Image", "pydantic"]
+
+PROBE = r"""
+import importlib, json, os, sys, time
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+target = sys.argv[1]
+heavy = sys.argv[2].split(",")
+before = rss_bytes()
+started = time.perf_counter()
+if target == "startup":
+    import app
+    response = app.app.test_client().get("/api/health")
+    assert response.status_code == 200, response.status_code
+else:
+    importlib.import_module(target)
+seconds = time.perf_counter() - started
+after = rss_bytes()
+print(json.dumps({
+    "seconds": seconds,
+    "rss_delta": after - before if before is not None and after is not None else None,
+    "rss_total": after,
+    "modules": len(sys.modules),
+    "heavy_loaded": [name for name in heavy if name in sys.modules],
+}))
+"""
+
+
+def measure(target: str, repeat: int) -> Dict[str, Any]:
+    """Run the probe ``repeat`` times in fresh interpreters and take medians"""
+    env = dict(os.environ, COMIC_PREWARM="0", PYTHONDONTWRITEBYTECODE="0")
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", PROBE, target, ",".join(HEAVY_MODULES)],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"
+            return {"target": target, "error": error}
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    def median(key: str) -> Optional[float]:
+        values = [run[key] for run in runs if run[key] is not None]
+        return statistics.median(values) if values else None
+
+    return {
+        "target": target,
+        "seconds": median("seconds"),
+        "rss_delta_mb": _mb(median("rss_delta")),
+        "rss_total_mb": _mb(median("rss_total")),
+        "modules": int(median("modules")),
+        "heavy_loaded": runs[-1]["heavy_loaded"],
+    }
+
+
+def _mb(value: Optional[float]) -> Optional[float]:
+    return round(value / (1024 * 1024), 1) if value is not None else None
+
+
+def _format(value: Optional[float], fmt: str) -> str:
+    return format(value, fmt) if value is not None else "-"
+
+
+def print_table(results: List[Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]) -> None:
+    header = f"{'target':<32} {'ms':>9} {'rss +MB':>8} {'rss MB':>7} {'modules':>8}"
+    if baseline:
+        header += f" {'vs base':>9}"
+    print(header + "  heavy SDKs loaded")
+    print("-" * (len(header) + 19))
+    for result in results:
+        if "error" in result:
+            print(f"{result['target']:<32} error: {result['error']}")
+            continue
+        line = (
+            f"{result['target']:<32} {_format(result['seconds'] * 1000, '9.1f')} "
+            f"{_format(result['rss_delta_mb'], '8.1f')} {_format(result['rss_total_mb'], '7.1f')} "
+            f"{result['modules']:>8}"
+        )
+        if baseline:
+            previous = baseline.get(result["target"])
+            if previous and previous.get("seconds"):
+                change = (result["seconds"] - previous["seconds"]) / previous["seconds"] * 100
+                line += f" {change:>+8.0f}%"
+            else:
+                line += f" {'new':>9}"
+        print(line + "  " + (", ".join(result["heavy_loaded"]) or "none"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure backend import time and memory per module")
+    parser.add_argument("modules", nargs="*", help="Modules to measure (default: backend modules and SDKs)")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module (median is reported)")
+    parser.add_argument("--json", dest="json_path", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results file from an earlier run to compare against")
+    args = parser.parse_args()
+
+    targets = ["startup"] + (args.modules or DEFAULT_MODULES)
+    results = [measure(target, max(1, args.repeat)) for target in targets]
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = {result["target"]: result for result in json.load(f)["results"]}
+
+    print_table(results, baseline)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "repeat": args.repeat, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+"""
+Offline load test for the generation endpoints
+
+Starts benchmarks/fake_upstream.py in-process, launches the backend with
+COMIC_GEMINI_BASE_URL pointing at it, then drives each endpoint at a fixed
+concurrency and reports latency percentiles, throughput, and the peak RSS
+and CPU time of the server process tree. No API quota is used. Run from
+backend/:
+
+    uv run --extra serve benchmarks/load_test.py
+    uv run --extra asgi benchmarks/load_test.py --server asgi --concurrency 200 --requests 1000
+    uv run benchmarks/load_test.py --endpoints generate-image --image-latency 5 --rate-limit-rate 0.1
+    uv run benchmarks/load_test.py --json load.json
+    uv run benchmarks/load_test.py --compare load.json --max-regression 20
+
+With --compare and --max-regression the exit status is 1 when p95 latency
+or throughput of any endpoint is more than that many percent worse than
+the baseline, so the run can gate CI. Use --url to load a server that is
+already running (RSS and CPU are then reported only with --pid).
+
+Generated images are written to the server's static/images directory.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstream import FakeUpstream, add_config_arguments, config_from_args  # noqa: E402
+
+ENDPOINTS = ["generate", "generate-image", "generate-cover", "proxy-image"]
+
+WARMUP_OFFSET = 10 ** 6
+
+PAGE_DATA = {
+    "title": "Benchmark page",
+    "rows": [
+        {"height": "180px", "panels": [{"text": "A cat finds a glowing map"}, {"text": "The cat follows it"}]},
+        {"height": "200px", "panels": [{"text": "A door opens onto the sea"}]},
+    ],
+}
+
+try:
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = PAGE_SIZE = None
+
+
+def build_request(endpoint: str, index: int, upstream_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Return the method, path and body of request ``index`` against ``endpoint``"""
+    api_key = f"bench-key-{index % args.api_keys}"
+    cache = None if args.cache else "bypass"
+    # Distinct inputs per request so only --cache runs can hit the caches
+    variant = index % args.distinct if args.cache else index
+    if endpoint == "generate":
+        return {"method": "POST", "path": "/api/generate", "json": {
+            "api_key": api_key,
+            "base_url": f"{upstream_url}/v1",
+            "prompt": f"A short benchmark story #{variant}",
+            "page_count": args.page_count,
+            "mode": args.mode,
+            "cache": cache,
+        }}
+    if endpoint == "generate-image":
+        page = dict(PAGE_DATA, title=f"Benchmark page {variant}")
+        return {"method": "POST", "path": "/api/generate-image", "json": {
+            "page_data": page,
+            "google_api_key": api_key,
+            "comic_style": "doraemon",
+            "cache": cache,
+        }}
+    if endpoint == "generate-cover":
+        return {"method": "POST", "path": "/api/generate-cover", "json": {
+            "google_api_key": api_key,
+            "comic_style": ["doraemon", "american", "watercolor"][variant % 3],
+            "language": "en",
+            "cache": cache,
+        }}
+    if endpoint == "proxy-image":
+        url = f"{upstream_url}/images/{index % args.distinct}.png"
+        return {"method": "GET", "path": "/api/proxy-image", "params": {"url": url}}
+    raise ValueError(f"Unknown endpoint {endpoint}")
+
+
+def _children(pid: int) -> List[int]:
+    """All descendants of ``pid`` (Linux /proc)"""
+    parents: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+    result, stack = [], [pid]
+    while stack:
+        for child in parents.get(stack.pop(), []):
+            result.append(child)
+            stack.append(child)
+    return result
+
+
+def process_tree_usage(pid: Optional[int]) -> Optional[Dict[str, float]]:
+    """Return {"rss_mb", "cpu_seconds"} summed over ``pid`` and its children, or None"""
+    if pid is None or CLOCK_TICKS is None or not os.path.isdir("/proc"):
+        return None
+    rss = cpu = 0
+    for member in [pid] + _children(pid):
+        try:
+            with open(f"/proc/{member}/stat") as f:
+                stat = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{member}/statm") as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            continue
+        # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+        cpu += int(stat[11]) + int(stat[12])
+    return {"rss_mb": rss / (1024 * 1024), "cpu_seconds": cpu / CLOCK_TICKS}
+
+
+class UsageSampler:
+    """Track peak RSS and CPU time of the server process tree during a run"""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_mb: Optional[float] = None
+        self._start: Optional[Dict[str, float]] = None
+        self._end: Optional[Dict[str, float]] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="usage-sampler", daemon=True)
+
+    def _sample(self) -> Optional[Dict[str, float]]:
+        usage = process_tree_usage(self.pid)
+        if usage is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb or 0.0, usage["rss_mb"])
+        return usage
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "UsageSampler":
+        self._start = self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._end = self._sample()
+
+    @property
+    def cpu_seconds(self) -> Optional[float]:
+        if self._start is None or self._end is None:
+            return None
+        return self._end["cpu_seconds"] - self._start["cpu_seconds"]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+async def drive(base_url: str, make_request: Callable[[int], Dict[str, Any]], total: int,
+                concurrency: int, timeout: float) -> Dict[str, Any]:
+    """Send ``total`` requests with at most ``concurrency`` in flight"""
+    import httpx
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    next_index = iter(range(total))
+
+    async def worker(client: "httpx.AsyncClient") -> None:
+        for index in next_index:
+            request = make_request(index)
+            started = time.perf_counter()
+            try:
+                response = await client.request(
+                    request["method"], request["path"], json=request.get("json"), params=request.get("params")
+                )
+                await response.aread()
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(elapsed)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(min(concurrency, total))))
+        wall = time.perf_counter() - started
+
+    return {"latencies": latencies, "statuses": statuses, "wall_seconds": wall}
+
+
+def run_endpoint(endpoint: str, base_url: str, upstream_url: str, pid: Optional[int],
+                 args: argparse.Namespace) -> Dict[str, Any]:
+    """Warm up, then load one endpoint and summarise the run"""
+    if args.warmup:
+        # Warm-up inputs never repeat in the measured run
+        warmup_request = lambda index: build_request(endpoint, WARMUP_OFFSET + index, upstream_url, args)  # noqa: E731
+        asyncio.run(drive(base_url, warmup_request, args.warmup, min(args.warmup, args.concurrency), args.timeout))
+
+    with UsageSampler(pid) as usage:
+        run = asyncio.run(drive(
+            base_url, lambda index: build_request(endpoint, index, upstream_url, args),
+            args.requests, args.concurrency, args.timeout
+        ))
+
+    latencies = run["latencies"]
+    ok = len(latencies)
+    cpu = usage.cpu_seconds
+    return {
+        "endpoint": endpoint,
+        "requests": args.requests,
+        "ok": ok,
+        "errors": args.requests - ok,
+        "statuses": run["statuses"],
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "max_ms": _ms(max(latencies) if latencies else None),
+        "throughput_rps": round(ok / run["wall_seconds"], 2) if run["wall_seconds"] else None,
+        "peak_rss_mb": round(usage.peak_rss_mb, 1) if usage.peak_rss_mb is not None else None,
+        "cpu_seconds": round(cpu, 2) if cpu is not None else None,
+        "cpu_percent": round(cpu / run["wall_seconds"] * 100, 1) if cpu is not None and run["wall_seconds"] else None,
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind: str, upstream_url: str, args: argparse.Namespace) -> subprocess.Popen:
+    """Launch serve.py (gunicorn or uvicorn) against the fake upstream"""
+    env = dict(os.environ, COMIC_GEMINI_BASE_URL=upstream_url, COMIC_BIND=f"127.0.0.1:{args.port}")
+    if not args.rate_limits:
+        # The per-key quotas would otherwise dominate every latency; explicit settings still win
+        for prefix in ("COMIC_GEMINI", "COMIC_LLM"):
+            env.setdefault(f"{prefix}_RPM", "0")
+            env.setdefault(f"{prefix}_MAX_IN_FLIGHT", "0")
+    command = [sys.executable, "serve.py"]
+    if kind == "asgi":
+        command.append("--asgi")
+    if args.workers:
+        command += ["--workers", str(args.workers)]
+    if args.threads:
+        command += ["--threads", str(args.threads)]
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_healthy(base_url: str, process: Optional[subprocess.Popen], timeout: float = 60) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            sys.exit(f"Server exited with status {process.returncode} (see --server-log)")
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"Server at {base_url} did not become healthy within {timeout:.0f}s")
+
+
+def _format(value: Optional[float], fmt: str) -> str:
+    return format(value, fmt) if value is not None else "-"
+
+
+def print_table(results: List[Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]) -> None:
+    header = (f"{'endpoint':<16} {'ok':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'req/s':>8} {'rss MB':>7} {'cpu s':>7} {'cpu %':>6}")
+    if baseline:
+        header += f" {'p95 vs':>7} {'rps vs':>7}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        line = (
+            f"{result['endpoint']:<16} {result['ok']:>6} {result['errors']:>5} "
+            f"{_format(result['p50_ms'], '9.1f')} {_format(result['p95_ms'], '9.1f')} "
+            f"{_format(result['p99_ms'], '9.1f')} {_format(result['throughput_rps'], '8.2f')} "
+            f"{_format(result['peak_rss_mb'], '7.1f')} {_format(result['cpu_seconds'], '7.2f')} "
+            f"{_format(result['cpu_percent'], '6.1f')}"
+        )
+        if baseline:
+            changes = regressions(result, baseline.get(result["endpoint"]))
+            line += f" {_format(changes.get('p95_ms'), '+6.0f')}% {_format(changes.get('throughput_rps'), '+6.0f')}%"
+        print(line)
+        if result["errors"]:
+            failed = {status: count for status, count in result["statuses"].items() if status != "200"}
+            print(f"{'':<16} non-200: {json.dumps(failed)}")
+    if baseline:
+        print("(vs: percent change from the baseline, positive is worse)")
+
+
+def regressions(result: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    """Percent change against the baseline, signed so that positive is worse"""
+    changes: Dict[str, float] = {}
+    if not previous:
+        return changes
+    if result.get("p95_ms") and previous.get("p95_ms"):
+        changes["p95_ms"] = (result["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100
+    if result.get("throughput_rps") is not None and previous.get("throughput_rps"):
+        changes["throughput_rps"] = (previous["throughput_rps"] - result["throughput_rps"]) / previous["throughput_rps"] * 100
+    return changes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load the backend against a fake Gemini/OpenAI upstream")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight per endpoint")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests before each endpoint")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Client timeout per request (seconds)")
+    parser.add_argument("--api-keys", type=int, default=1, help="Distinct API keys to spread requests over")
+    parser.add_argument("--cache", action="store_true", help="Let requests use the server caches (default: bypass)")
+    parser.add_argument("--distinct", type=int, default=20, help="Distinct inputs with --cache, and distinct proxied images")
+    parser.add_argument("--page-count", type=int, default=3, help="page_count for /api/generate")
+    parser.add_argument("--mode", choices=["single", "chunked"], default="single", help="mode for /api/generate")
+
+    server = parser.add_argument_group("server")
+    server.add_argument("--server", choices=["gunicorn", "asgi"], default="gunicorn",
+                        help="Launch serve.py with gunicorn or with --asgi (uvicorn)")
+    server.add_argument("--url", help="Load an already running server instead of launching one")
+    server.add_argument("--pid", type=int, help="With --url: server PID to measure RSS and CPU for")
+    server.add_argument("--port", type=int, help="Port for the launched server (default: a free port)")
+    server.add_argument("--workers", type=int, help="serve.py --workers")
+    server.add_argument("--threads", type=int, help="serve.py --threads")
+    server.add_argument("--rate-limits", action="store_true",
+                        help="Keep the default per-key Gemini/LLM rate limits (default: off unless set in the environment)")
+    server.add_argument("--server-log", help="Write the launched server's output to this file")
+
+    upstream = parser.add_argument_group("fake upstream")
+    upstream.add_argument("--upstream-url", help="Use a fake_upstream.py that is already running")
+    add_config_arguments(upstream)
+
+    report = parser.add_argument_group("report")
+    report.add_argument("--json", dest="json_path", help="Write the results to this file")
+    report.add_argument("--compare", help="Results file from an earlier run to compare against")
+    report.add_argument("--max-regression", type=float,
+                        help="With --compare: exit 1 if p95 or throughput is this many percent worse")
+    args = parser.parse_args()
+    args.api_keys = max(1, args.api_keys)
+    args.distinct = max(1, args.distinct)
+
+    fake = None
+    upstream_url = args.upstream_url
+    if not upstream_url:
+        fake = FakeUpstream(config_from_args(args)).start()
+        upstream_url = fake.url
+
+    process = None
+    pid = args.pid
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        args.port = args.port or _free_port()
+        base_url = f"http://127.0.0.1:{args.port}"
+        process = start_server(args.server, upstream_url, args)
+        pid = process.pid
+
+    try:
+        wait_until_healthy(base_url, process)
+        results = []
+        for endpoint in args.endpoints:
+            print(f"Loading {endpoint}: {args.requests} requests, {args.concurrency} concurrent", file=sys.stderr)
+            results.append(run_endpoint(endpoint, base_url, upstream_url, pid, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if fake is not None:
+            fake.stop()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = {result["endpoint"]: result for result in json.load(f)["results"]}
+
+    print_table(results, baseline)
+    if fake is not None:
+        print(f"\nFake upstream calls: {json.dumps(fake.counters, sort_keys=True)}")
+
+    if args.json_path:
+        settings = {key: value for key, value in vars(args).items()
+                    if key not in ("json_path", "compare", "max_regression", "url", "pid", "port", "server_log")}
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "settings": settings, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+    if baseline and args.max_regression is not None:
+        failed = [
+            f"{result['endpoint']} {metric} {change:+.0f}%"
+            for result in results
+            for metric, change in regressions(result, baseline.get(result["endpoint"])).items()
+            if change > args.max_regression
+        ]
+        if failed:
+            sys.exit("Regression beyond {:.0f}%: {}".format(args.max_regression, ", ".join(failed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,147 +1,482 @@
+import asyncio
 import os
-import requests
 import logging
-import time
-import uuid
-import io
-import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from dotenv import load_dotenv
-from typing import Optional
-from google import genai
-from google.genai.types import GenerateContentConfig, ImageConfig, FinishReason
-from PIL import Image
+from typing import TYPE_CHECKING, Callable, Optional, Tuple
+from utils.client_pool import GEMINI_TIMEOUT_MS, get_genai_client
+from utils.image_cache import ImageResultCache, digest_reference, make_cache_key
+from utils.response_cache import CACHE_BYPASS
+from utils.reference_cache import ReferenceImageCache, ReferencePolicy, ROLE_SKETCH, ROLE_STYLE
+from utils.sketch_store import SketchStore, HANDLE_PREFIX
+from utils.image_storage import ImageStorage, key_from_url, sniff_mime, storage_from_env
+from utils.image_writer import ImageWriter, OutputPolicy
+from utils.retry import (
+    RetryPolicy, ContentBlockedError, NoImageError, TERMINAL_FINISH_REASONS, attempt_timeout, call_with_retry,
+    acall_with_retry,
+)
+from utils.rate_limit import gemini_governor
+from utils.metrics import GEMINI_ERRORS, span, timed
+
+# google.genai is imported where used: it dominates the backend's import time
+if TYPE_CHECKING:
+    from google.genai.types import Part
 
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+MODEL_ID = "gemini-3-pro-image-preview"
+ASPECT_RATIO = "9:16"
+IMAGE_SIZE = "2K"
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+IMAGES_DIR = os.path.join(STATIC_DIR, "images")
+DATA_DIR = os.path.join(BASE_DIR, "data")
+
+sketch_store = SketchStore(
+    directory=os.path.join(IMAGES_DIR, "sketches"),
+    max_bytes=int(os.getenv("COMIC_SKETCH_MAX_MB", 20)) * 1024 * 1024,
+)
+
+_image_cache: Optional[ImageResultCache] = None
+
+_image_storage: Optional[ImageStorage] = None
+_image_writer: Optional[ImageWriter] = None
+_image_storage_lock = threading.Lock()
+
+reference_cache = ReferenceImageCache(
+    max_bytes=int(os.getenv("COMIC_REFERENCE_CACHE_MB", 512)) * 1024 * 1024
+)
+
+# Previous pages and other style references: shrunk photos, JPEG is compact
+STYLE_POLICY = ReferencePolicy.from_env("COMIC_REFERENCE", max_edge=1024, format="JPEG", quality=85)
+# Layout sketches: flat line art, PNG keeps edges crisp and stays small
+SKETCH_POLICY = ReferencePolicy.from_env("COMIC_SKETCH", max_edge=1024, format="PNG", quality=90)
+
+_reference_executor: Optional[ThreadPoolExecutor] = None
+_reference_executor_lock = threading.Lock()
+
+
+def _get_reference_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool used to fetch and decode reference images"""
+    global _reference_executor
+    with _reference_executor_lock:
+        if _reference_executor is None:
+            _reference_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("COMIC_REFERENCE_WORKERS", 8)),
+                thread_name_prefix="comic-reference"
+            )
+        return _reference_executor
+
+
+def get_image_storage() -> ImageStorage:
+    """Return the process-wide storage for generated images (COMIC_IMAGE_STORAGE)"""
+    global _image_storage
+    with _image_storage_lock:
+        if _image_storage is None:
+            _image_storage = storage_from_env(IMAGES_DIR, DATA_DIR)
+        return _image_storage
+
+
+def get_image_writer() -> ImageWriter:
+    """Return the process-wide background writer for generated images"""
+    global _image_writer
+    storage = get_image_storage()
+    with _image_storage_lock:
+        if _image_writer is None:
+            _image_writer = ImageWriter(
+                storage,
+                OutputPolicy.from_env(),
+                max_workers=int(os.getenv("COMIC_IMAGE_WRITER_WORKERS", 2)),
+                max_pending=int(os.getenv("COMIC_IMAGE_WRITER_MAX_PENDING", 32)),
+            )
+        return _image_writer
+
+
+def stop_image_storage() -> None:
+    """Finish queued image writes and stop the retention sweeper"""
+    with _image_storage_lock:
+        storage, writer = _image_storage, _image_writer
+    if writer is not None:
+        writer.shutdown(wait=True)
+    if storage is not None:
+        storage.stop_sweeper()
+
+
+def get_image_cache() -> Optional[ImageResultCache]:
+    """Return the generated-image cache, or None unless COMIC_IMAGE_CACHE is enabled"""
+    global _image_cache
+    if os.getenv("COMIC_IMAGE_CACHE", "0").lower() not in ("1", "true", "yes", "on"):
+        return None
+    if _image_cache is None:
+        _image_cache = ImageResultCache(
+            cache_dir=os.path.join(IMAGES_DIR, "cache"),
+            max_bytes=int(os.getenv("COMIC_IMAGE_CACHE_MAX_MB", 1024)) * 1024 * 1024,
+        )
+    return _image_cache
+
+
+def _normalize_references(reference_img: Optional[str | list]) -> list:
+    """
+    Flatten the accepted reference formats into (image_string, role) pairs
+
+    Dict entries may carry a "role" of "sketch" (layout reference) or
+    "style" (previous pages and other look-and-feel references, the default).
+    """
+    references = []
+    if isinstance(reference_img, list):
+        for img in reference_img:
+            if isinstance(img, dict) and 'imageUrl' in img:
+                references.append((img['imageUrl'], img.get('role') or ROLE_STYLE))
+            elif isinstance(img, str):
+                references.append((img, ROLE_STYLE))
+    elif isinstance(reference_img, str):
+        references.append((reference_img, ROLE_STYLE))
+    return references
+
+
+def load_reference_part(img_str: str, role: str = ROLE_STYLE, timeout: float = 30) -> Optional["Part"]:
+    """
+    Load a reference image as an upload-ready, shrunk and re-encoded part
+
+    Encoded bytes are cached per source and policy, so a previous page used
+    as a reference by several requests is only resized and encoded once.
+
+    Args:
+        img_str: http(s) URL, /backend/static/images/... path, sketch:<sha256> handle or data URI
+        role: "sketch" or "style", selects the preprocessing policy
+        timeout: Download timeout in seconds for http(s) URLs
+
+    Returns:
+        Image part, or None if the format is not recognised
+    """
+    from google.genai.types import Part
+
+    policy = SKETCH_POLICY if role == ROLE_SKETCH else STYLE_POLICY
+    if img_str.startswith('http'):
+        logger.info(f"Downloading reference image: {img_str}")
+        data, mime_type = reference_cache.load_url_encoded(img_str, policy, timeout=timeout)
+    elif img_str.startswith("/backend/static/images/"):
+        logger.info(f"Processing reference image: {img_str}")
+        data, mime_type = _load_stored_reference(img_str, policy)
+    elif img_str.startswith(HANDLE_PREFIX):
+        path = sketch_store.resolve(img_str)
+        if path is None:
+            raise ValueError(f"Unknown sketch handle: {img_str}")
+        logger.info(f"Processing uploaded sketch: {img_str}")
+        data, mime_type = reference_cache.load_file_encoded(path, policy)
+    elif img_str.startswith('data:image'):
+        logger.info("Processing base64 reference image")
+        data, mime_type = reference_cache.load_data_uri_encoded(img_str, policy)
+    else:
+        return None
+    return Part.from_bytes(data=data, mime_type=mime_type)
+
+
+def _load_stored_reference(url: str, policy: ReferencePolicy) -> Tuple[bytes, str]:
+    """Encode a /backend/static/images/... reference from the image storage"""
+    storage = get_image_storage()
+    key = key_from_url(url)
+    path = storage.local_path(url) if key else os.path.join(STATIC_DIR, url[len("/backend/static/"):])
+    if path is not None:
+        return reference_cache.load_file_encoded(path, policy)
+    # Remote storage: stored images are immutable, so the key identifies the content
+    return reference_cache.load_object_encoded(f"{storage.backend.name}:{key}", lambda: storage.read(url), policy)
+
+
+@timed("reference_prep")
+def prepare_reference_images(references: list, deadline: Optional[float] = None) -> list:
+    """
+    Fetch, shrink and encode reference images concurrently
+
+    Every reference is loaded on the shared reference pool; the whole batch
+    must finish within ``deadline`` seconds. References that fail or miss
+    the deadline are skipped with a warning, and the rest keep the order of
+    ``references``.
+
+    Args:
+        references: List of (image_string, role) pairs
+        deadline: Overall deadline in seconds (COMIC_REFERENCE_DEADLINE by default)
+    """
+    if not references:
+        return []
+    if deadline is None:
+        deadline = float(os.getenv("COMIC_REFERENCE_DEADLINE", 30))
+
+    executor = _get_reference_executor()
+    futures = [executor.submit(load_reference_part, url, role, deadline) for url, role in references]
+    done, not_done = wait(futures, timeout=deadline)
+
+    parts = []
+    for (url, _), future in zip(references, futures):
+        if future in not_done:
+            future.cancel()
+            logger.warning(f"Reference image {url[:50]}... missed the {deadline}s deadline, skipping")
+            continue
+        try:
+            part = future.result()
+        except Exception as e:
+            logger.warning(f"Failed to process reference image {url[:50]}...: {e}")
+            continue
+        if part is not None:
+            parts.append(part)
+    return parts
+
+
+def _make_reporter(progress_callback: Optional[Callable[[str, dict], None]]) -> Callable[[str, dict], None]:
+    def report(event_type: str, data: dict) -> None:
+        # Progress reporting must never break generation
+        if progress_callback:
+            try:
+                progress_callback(event_type, data)
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {e}")
+    return report
+
+
+def _resolve_api_key(google_api_key: Optional[str]) -> str:
+    # Use provided API key or fall back to environment variable
+    api_key = google_api_key or os.getenv('GOOGLE_API_KEY') or os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise ValueError("Google API key is required. Please provide google_api_key parameter or set GOOGLE_API_KEY environment variable.")
+    return api_key
+
+
+def _image_cache_key(image_cache: Optional[ImageResultCache], prompt: str, references: list) -> Optional[str]:
+    if image_cache is None:
+        return None
+    return make_cache_key(
+        prompt, MODEL_ID, ASPECT_RATIO, IMAGE_SIZE,
+        [f"{role}:{digest_reference(url, STATIC_DIR)}" for url, role in references]
+    )
+
+
+def _lookup_cached_image(image_cache: Optional[ImageResultCache], cache_key: Optional[str],
+                         cache: Optional[str]) -> Optional[str]:
+    """Return the URL of a cached result for ``cache_key``, unless bypassed"""
+    if not cache_key or cache == CACHE_BYPASS:
+        return None
+    cached_path = image_cache.get(cache_key)
+    if not cached_path:
+        return None
+    try:
+        with open(cached_path, "rb") as f:
+            mime_type = sniff_mime(f.read(12)) or "image/png"
+        image_url = get_image_storage().save_file(cached_path, mime_type)
+    except (OSError, ValueError) as e:
+        # Evicted between the lookup and the copy
+        logger.warning(f"Image cache entry {cache_key[:12]} vanished: {e}")
+        return None
+    logger.info(f"Image cache hit: {cache_key[:12]}")
+    return image_url
+
+
+def _generation_config():
+    from google.genai.types import GenerateContentConfig, HttpOptions, ImageConfig
+
+    return GenerateContentConfig(
+        response_modalities=['TEXT', 'IMAGE'],
+        image_config=ImageConfig(
+            aspect_ratio=ASPECT_RATIO,
+            image_size=IMAGE_SIZE,
+        ),
+        # The last attempt may not run past the retry deadline
+        http_options=HttpOptions(timeout=int(attempt_timeout(GEMINI_TIMEOUT_MS / 1000) * 1000)),
+    )
+
+
+@timed("image_decode")
+def _extract_image(response):
+    """Return the generated image from a Gemini response, or raise why there is none"""
+    from google.genai.types import FinishReason
+
+    # Check for errors
+    if not response.candidates or response.candidates[0].finish_reason != FinishReason.STOP:
+        reason = "Unknown"
+        if response.candidates:
+            reason = response.candidates[0].finish_reason
+        GEMINI_ERRORS.inc(finish_reason=getattr(reason, "name", str(reason)))
+        if getattr(reason, "name", str(reason)) in TERMINAL_FINISH_REASONS:
+            raise ContentBlockedError(reason)
+        raise NoImageError(f"Prompt Content Error: {reason}")
+
+    # Extract image
+    for part in response.candidates[0].content.parts:
+        if part.inline_data:
+            return part.inline_data.as_image()
+    GEMINI_ERRORS.inc(finish_reason="NO_IMAGE")
+    raise NoImageError("No image generated in response")
+
+
+def _image_retry_policy(max_retries: int, retry_delay: float) -> RetryPolicy:
+    return RetryPolicy(
+        max_attempts=max_retries,
+        base_delay=retry_delay,
+        max_delay=float(os.getenv("COMIC_RETRY_MAX_DELAY", 20)),
+        deadline=float(os.getenv("COMIC_IMAGE_DEADLINE", 300)),
+    )
+
+
+@timed("image_save")
+def _save_image(generated_image, image_cache: Optional[ImageResultCache], cache_key: Optional[str]) -> str:
+    """
+    Stage a generated image and return its URL path
+
+    Encoding in the configured format, upload and derivatives happen on
+    the background writer; the URL is readable as soon as this returns.
+    """
+    on_encoded = (lambda encoded: image_cache.put(cache_key, encoded)) if cache_key else None
+    image_url = get_image_writer().write(generated_image.image_bytes, on_encoded)
+    logger.info(f"Image staged as {image_url}")
+    return image_url
+
 
 def generate_social_media_image_core(
         prompt: str, 
         reference_img: Optional[str | list] = None,
         google_api_key: Optional[str] = None,
         max_retries: int = 3,
-        retry_delay: float = 1.0
+        retry_delay: float = 1.0,
+        progress_callback: Optional[Callable[[str, dict], None]] = None,
+        cache: Optional[str] = None
     ) -> Optional[str]:
-    
-    # Initialize Google GenAI Client
-    # Use provided API key or fall back to environment variable
-    api_key = google_api_key or os.getenv('GOOGLE_API_KEY') or os.getenv('GEMINI_API_KEY')
-    if not api_key:
-        raise ValueError("Google API key is required. Please provide google_api_key parameter or set GOOGLE_API_KEY environment variable.")
-    
-    client = genai.Client(api_key=api_key, vertexai=False, http_options={'timeout':120000})
-    MODEL_ID = "gemini-3-pro-image-preview"
+    """
+    Generate an image with Gemini and save it to the image storage
+
+    Args:
+        prompt: Final image prompt
+        reference_img: Reference image(s): URLs, /backend/static paths or data URIs
+        google_api_key: Google API key (falls back to GOOGLE_API_KEY / GEMINI_API_KEY)
+        max_retries: Maximum number of Gemini attempts
+        retry_delay: Base delay in seconds for jittered backoff
+        progress_callback: Optional callback receiving (event_type, data) progress events
+        cache: Per-request cache mode; "bypass" skips the lookup and refreshes the entry
+
+    Returns:
+        URL path of the saved image
+
+    Raises:
+        ContentBlockedError: If Gemini refuses the prompt (not retried)
+    """
+    report = _make_reporter(progress_callback)
+    api_key = _resolve_api_key(google_api_key)
+    client = get_genai_client(api_key)
     
     logger.info(f"Generating social media image for: {prompt}")
     
+    references = _normalize_references(reference_img)
+
+    # Serve identical requests from the result cache
+    image_cache = get_image_cache()
+    cache_key = _image_cache_key(image_cache, prompt, references)
+    image_url = _lookup_cached_image(image_cache, cache_key, cache)
+    if image_url:
+        report("cache_hit", {"image_url": image_url})
+        return image_url
+
     # Prepare contents
     contents = [prompt]
     
     # Handle reference images
-    if reference_img:
-        image_urls = []
-        if isinstance(reference_img, list):
-            for img in reference_img:
-                if isinstance(img, dict) and 'imageUrl' in img:
-                    image_urls.append(img['imageUrl'])
-                elif isinstance(img, str):
-                    image_urls.append(img)
-        elif isinstance(reference_img, str):
-            image_urls.append(reference_img)
-            
-        for img_str in image_urls:
-            try:
-                if img_str.startswith('http'):
-                    logger.info(f"Downloading reference image: {img_str}")
-                    resp = requests.get(img_str, timeout=30)
-                    resp.raise_for_status()
-                    img = Image.open(io.BytesIO(resp.content))
-                    contents.append(img)
-                elif img_str.startswith("/backend/static/images/"):
-                    logger.info(f"Processing reference image: {img_str}")
-                    img_str = img_str.replace("/backend", "")
-                    img = Image.open(f"{os.getcwd()}/{img_str}")
-                    contents.append(img)
-                elif img_str.startswith('data:image'):
-                    logger.info("Processing base64 reference image")
-                    # Extract base64 data
-                    if "," in img_str:
-                        header, encoded = img_str.split(",", 1)
-                    else:
-                        encoded = img_str
-                    data = base64.b64decode(encoded)
-                    img = Image.open(io.BytesIO(data))
-                    contents.append(img)
-            except Exception as e:
-                logger.warning(f"Failed to process reference image {img_str[:50]}...: {e}")
+    report("preparing_references", {})
+    contents.extend(prepare_reference_images(references))
 
-    # Extract config from extra_body
-    aspect_ratio = "9:16"
-    image_size = "2K"
+    def attempt_generation():
+        # Every attempt, retries included, counts against the key's quota
+        with gemini_governor.limit(api_key) as waited:
+            if waited > 0.05:
+                report("queued", {"wait_seconds": round(waited, 3)})
+            with span("gemini_call"):
+                response = client.models.generate_content(
+                    model=MODEL_ID,
+                    contents=contents,
+                    config=_generation_config(),
+                )
+        return _extract_image(response)
 
-    # Retry logic
-    last_exception = None
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Calling Gemini API (Attempt {attempt + 1}/{max_retries})")
-            response = client.models.generate_content(
-                model=MODEL_ID,
-                contents=contents,
-                config=GenerateContentConfig(
-                    response_modalities=['TEXT', 'IMAGE'],
-                    image_config=ImageConfig(
-                        aspect_ratio=aspect_ratio,
-                        image_size=image_size,
-                    ),
-                ),
-            )
+    def on_attempt(attempt: int, max_attempts: int) -> None:
+        logger.info(f"Calling Gemini API (Attempt {attempt}/{max_attempts})")
+        report("attempt", {"attempt": attempt, "max_attempts": max_attempts})
 
-            # Check for errors
-            if not response.candidates or response.candidates[0].finish_reason != FinishReason.STOP:
-                reason = "Unknown"
-                if response.candidates:
-                    reason = response.candidates[0].finish_reason
-                raise ValueError(f"Prompt Content Error: {reason}")
-
-            # Extract image
-            generated_image = None
-            for part in response.candidates[0].content.parts:
-                if part.inline_data:
-                    generated_image = part.inline_data.as_image()
-                    break
-            
-            if generated_image:
-                # Save image to static/images
-                filename = f"{uuid.uuid4()}.png"
-                # Use absolute path to ensure correctness
-                base_dir = os.path.dirname(os.path.abspath(__file__))
-                static_dir = os.path.join(base_dir, "static", "images")
-                os.makedirs(static_dir, exist_ok=True)
-                
-                save_path = os.path.join(static_dir, filename)
-                generated_image.save(save_path)
-                logger.info(f"Image saved to {save_path}")
-                
-                # Return URL path relative to static folder
-                return f"/backend/static/images/{filename}"
-            else:
-                raise ValueError("No image generated in response")
+    def on_retry(attempt: int, error: Exception, wait_time: float) -> None:
+        report("retry", {"attempt": attempt, "error": str(error), "wait_seconds": round(wait_time, 3)})
 
-        except Exception as e:
-            last_exception = e
-            logger.warning(f"Attempt {attempt + 1}/{max_retries} failed: {str(e)}")
-            
-            if attempt < max_retries - 1:
-                wait_time = retry_delay * (2 ** attempt)
-                logger.info(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                logger.error(f"All {max_retries} attempts failed")
-                raise last_exception
-
-    return None
+    generated_image = call_with_retry(
+        attempt_generation, _image_retry_policy(max_retries, retry_delay), name="gemini_image",
+        on_attempt=on_attempt, on_retry=on_retry
+    )
+
+    image_url = _save_image(generated_image, image_cache, cache_key)
+    report("saved", {"image_url": image_url})
+    return image_url
+
+
+async def agenerate_social_media_image_core(
+        prompt: str,
+        reference_img: Optional[str | list] = None,
+        google_api_key: Optional[str] = None,
+        max_retries: int = 3,
+        retry_delay: float = 1.0,
+        progress_callback: Optional[Callable[[str, dict], None]] = None,
+        cache: Optional[str] = None
+    ) -> Optional[str]:
+    """
+    Async variant of ``generate_social_media_image_core``
+
+    The Gemini call goes through the SDK's async client (``client.aio``) and
+    waits for rate-limit slots without holding a thread, so one event loop
+    can keep many slow generations in flight. Reference preparation, cache
+    lookups and the PNG save are CPU or disk work and run in threads.
+    """
+    report = _make_reporter(progress_callback)
+    api_key = _resolve_api_key(google_api_key)
+    client = get_genai_client(api_key)
+
+    logger.info(f"Generating social media image for: {prompt}")
+
+    references = _normalize_references(reference_img)
+
+    image_cache = get_image_cache()
+    cache_key = await asyncio.to_thread(_image_cache_key, image_cache, prompt, references)
+    image_url = await asyncio.to_thread(_lookup_cached_image, image_cache, cache_key, cache)
+    if image_url:
+        report("cache_hit", {"image_url": image_url})
+        return image_url
+
+    contents = [prompt]
+    report("preparing_references", {})
+    contents.extend(await asyncio.to_thread(prepare_reference_images, references))
+
+    async def attempt_generation():
+        async with gemini_governor.alimit(api_key) as waited:
+            if waited > 0.05:
+                report("queued", {"wait_seconds": round(waited, 3)})
+            with span("gemini_call"):
+                response = await client.aio.models.generate_content(
+                    model=MODEL_ID,
+                    contents=contents,
+                    config=_generation_config(),
+                )
+        return _extract_image(response)
+
+    def on_attempt(attempt: int, max_attempts: int) -> None:
+        logger.info(f"Calling Gemini API (Attempt {attempt}/{max_attempts})")
+        report("attempt", {"attempt": attempt, "max_attempts": max_attempts})
+
+    def on_retry(attempt: int, error: Exception, wait_time: float) -> None:
+        report("retry", {"attempt": attempt, "error": str(error), "wait_seconds": round(wait_time, 3)})
+
+    generated_image = await acall_with_retry(
+        attempt_generation, _image_retry_policy(max_retries, retry_delay), name="gemini_image",
+        on_attempt=on_attempt, on_retry=on_retry
+    )
 
+    image_url = await asyncio.to_thread(_save_image, generated_image, image_cache, cache_key)
+    report("saved", {"image_url": image_url})
+    return image_url
 
 if __name__ == "__main__":
     # Test the function
@@ -2,5 +2,8 @@
 from .comic_controller import comic_bp
 from .image_controller import image_bp
 from .social_media_controller import social_bp
+from .job_controller import job_bp
+from .system_controller import system_bp
+from .export_controller import export_bp
 
-__all__ = ['comic_bp', 'image_bp', 'social_bp']
+__all__ = ['comic_bp', 'image_bp', 'social_bp', 'job_bp', 'system_bp', 'export_bp']
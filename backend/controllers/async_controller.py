@@ -0,0 +1,153 @@
+"""Async controller - native asyncio handlers for the slow generation endpoints
+
+Served by asgi.py in front of the Flask app. Each handler mirrors the
+validation and responses of the matching Flask view, but awaits the async
+service variants, so a worker holds a coroutine instead of a thread while
+it waits on Gemini or the LLM.
+"""
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from services.image_service import ImageService
+from services.social_media_service import SocialMediaService
+
+logger = logging.getLogger(__name__)
+
+AsyncHandler = Callable[[Dict[str, Any]], Awaitable[Tuple[Dict[str, Any], int]]]
+
+
+async def generate_comic(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """POST /api/generate (same body as the Flask view)"""
+    from services.comic_service import ComicService, SCRIPT_MODE_SINGLE, SCRIPT_MODE_CHUNKED
+
+    api_key = data.get('api_key')
+    prompt = data.get('prompt')
+
+    if not api_key:
+        return {"error": "API key is required"}, 400
+
+    if not prompt:
+        return {"error": "Prompt is required"}, 400
+
+    page_count = data.get('page_count', 3)
+    if not isinstance(page_count, int) or page_count < 1 or page_count > 10:
+        return {"error": "Page count must be between 1 and 10"}, 400
+
+    mode = data.get('mode', SCRIPT_MODE_SINGLE)
+    if mode not in (SCRIPT_MODE_SINGLE, SCRIPT_MODE_CHUNKED):
+        return {"error": "Mode must be 'single' or 'chunked'"}, 400
+
+    service = ComicService(
+        api_key,
+        data.get('base_url', 'https://api.openai.com/v1'),
+        data.get('model', 'gpt-4o-mini'),
+        data.get('comic_style', 'doraemon'),
+        data.get('language', 'zh')
+    )
+    if mode == SCRIPT_MODE_CHUNKED:
+        comic_pages = await service.agenerate_comic_script_chunked(prompt, page_count, cache=data.get('cache'))
+    else:
+        comic_pages = await service.agenerate_comic_script(prompt, page_count, cache=data.get('cache'))
+
+    return {
+        "success": True,
+        "pages": comic_pages,
+        "page_count": len(comic_pages)
+    }, 200
+
+
+async def generate_comic_image(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """POST /api/generate-image (same body as the Flask view)"""
+    page_data = data.get('page_data')
+    if not page_data:
+        return {"error": "Page data is required"}, 400
+
+    google_api_key = data.get('google_api_key')
+    if not google_api_key:
+        return {"error": "Google API key is required"}, 400
+
+    image_url, prompt = await ImageService.agenerate_comic_image(
+        page_data=page_data,
+        comic_style=data.get('comic_style', 'doraemon'),
+        reference_img=data.get('reference_img'),
+        extra_body=data.get('extra_body'),
+        google_api_key=google_api_key,
+        cache=data.get('cache')
+    )
+
+    if not image_url:
+        return {"error": "Image generation failed"}, 500
+
+    return {"success": True, "image_url": image_url, "prompt": prompt}, 200
+
+
+async def generate_comic_cover(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """POST /api/generate-cover (same body as the Flask view)"""
+    google_api_key = data.get('google_api_key')
+    if not google_api_key:
+        return {"error": "Google API key is required"}, 400
+
+    image_url, prompt = await ImageService.agenerate_comic_cover(
+        comic_style=data.get('comic_style', 'doraemon'),
+        google_api_key=google_api_key,
+        reference_imgs=data.get('reference_imgs'),
+        language=data.get('language', 'en'),
+        cache=data.get('cache')
+    )
+
+    if not image_url:
+        return {"error": "Cover generation failed"}, 500
+
+    return {"success": True, "image_url": image_url, "prompt": prompt}, 200
+
+
+async def generate_social_content(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """POST /api/generate-xiaohongshu (same body as the Flask view)"""
+    api_key = data.get('api_key')
+    comic_data = data.get('comic_data')
+
+    if not api_key:
+        return {"error": "API key is required"}, 400
+
+    if not comic_data:
+        return {"error": "Comic data is required"}, 400
+
+    service = SocialMediaService(
+        api_key,
+        data.get('base_url', 'https://api.openai.com/v1'),
+        data.get('model', 'gpt-4o-mini')
+    )
+    try:
+        result = await service.agenerate_social_content(
+            comic_data, data.get('platform', 'xiaohongshu'), cache=data.get('cache')
+        )
+    except json.JSONDecodeError as e:
+        return {"error": f"JSON parsing failed: {str(e)}"}, 500
+
+    return {"success": True, **result}, 200
+
+
+ASYNC_ROUTES: Dict[str, AsyncHandler] = {
+    '/api/generate': generate_comic,
+    '/api/generate-image': generate_comic_image,
+    '/api/generate-cover': generate_comic_cover,
+    '/api/generate-xiaohongshu': generate_social_content,
+}
+
+
+async def dispatch(path: str, body: bytes) -> Tuple[Dict[str, Any], int]:
+    """Parse a JSON body and run the async handler for ``path``"""
+    try:
+        data = json.loads(body) if body else None
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return {"error": "Invalid JSON format"}, 400
+
+    if not data or not isinstance(data, dict):
+        return {"error": "No JSON data provided"}, 400
+
+    try:
+        return await ASYNC_ROUTES[path](data)
+    except Exception as e:
+        logger.warning(f"{path} failed: {e}")
+        return {"error": str(e)}, 500
@@ -1,7 +1,6 @@
 """Comic controller - handles comic script generation endpoints"""
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 import json
-from services.comic_service import ComicService, validate_script
 
 comic_bp = Blueprint('comic', __name__)
 
@@ -23,9 +22,14 @@ def generate_comic():
         "prompt": "description of the comic",
         "page_count": 3,
         "base_url": "https://api.openai.com/v1",  # optional
-        "model": "gpt-4o-mini"  # optional
+        "model": "gpt-4o-mini",  # optional
+        "mode": "single",  # optional, "chunked" = outline plus parallel per-page calls
+        "cache": "bypass"  # optional, skip the response cache
     }
     """
+    # Imported on first use: the service's schemas are slow to build at startup
+    from services.comic_service import ComicService, SCRIPT_MODE_SINGLE, SCRIPT_MODE_CHUNKED
+
     try:
         data = request.get_json()
         
@@ -49,13 +53,21 @@ def generate_comic():
         comic_style = data.get('comic_style', 'doraemon')
         language = data.get('language', 'zh')
         
+        mode = data.get('mode', SCRIPT_MODE_SINGLE)
+        
         # Validate page count
         if not isinstance(page_count, int) or page_count < 1 or page_count > 10:
             return jsonify({"error": "Page count must be between 1 and 10"}), 400
+
+        if mode not in (SCRIPT_MODE_SINGLE, SCRIPT_MODE_CHUNKED):
+            return jsonify({"error": "Mode must be 'single' or 'chunked'"}), 400
         
         # Generate comic script
         service = ComicService(api_key, base_url, model, comic_style, language)
-        comic_pages = service.generate_comic_script(prompt, page_count)
+        if mode == SCRIPT_MODE_CHUNKED:
+            comic_pages = service.generate_comic_script_chunked(prompt, page_count, cache=data.get('cache'))
+        else:
+            comic_pages = service.generate_comic_script(prompt, page_count, cache=data.get('cache'))
         
         return jsonify({
             "success": True,
@@ -69,6 +81,69 @@ def generate_comic():
         return jsonify({"error": str(e)}), 500
 
 
+@comic_bp.route('/api/generate-stream', methods=['POST'])
+def generate_comic_stream():
+    """
+    Generate comic script, streaming each page as soon as it is ready
+
+    Expects the same JSON body as /api/generate (including "mode" and "cache"). Streams newline-delimited
+    JSON: one {"page_index": i, "page": {...}} line per page, followed by a
+    final {"done": true, "success": ..., "page_count" | "error": ...} line.
+    """
+    from services.comic_service import ComicService, SCRIPT_MODE_SINGLE, SCRIPT_MODE_CHUNKED
+
+    data = request.get_json(silent=True)
+
+    if not data:
+        return jsonify({"error": "No JSON data provided"}), 400
+
+    api_key = data.get('api_key')
+    prompt = data.get('prompt')
+
+    if not api_key:
+        return jsonify({"error": "API key is required"}), 400
+
+    if not prompt:
+        return jsonify({"error": "Prompt is required"}), 400
+
+    page_count = data.get('page_count', 3)
+    if not isinstance(page_count, int) or page_count < 1 or page_count > 10:
+        return jsonify({"error": "Page count must be between 1 and 10"}), 400
+
+    mode = data.get('mode', SCRIPT_MODE_SINGLE)
+    if mode not in (SCRIPT_MODE_SINGLE, SCRIPT_MODE_CHUNKED):
+        return jsonify({"error": "Mode must be 'single' or 'chunked'"}), 400
+
+    service = ComicService(
+        api_key,
+        data.get('base_url', 'https://api.openai.com/v1'),
+        data.get('model', 'gpt-4o-mini'),
+        data.get('comic_style', 'doraemon'),
+        data.get('language', 'zh')
+    )
+
+    def generate():
+        count = 0
+        try:
+            if mode == SCRIPT_MODE_CHUNKED:
+                pages = service.iter_comic_script_chunked(prompt, page_count, cache=data.get('cache'))
+            else:
+                pages = service.stream_comic_script(prompt, page_count, cache=data.get('cache'))
+            for page in pages:
+                yield json.dumps({"page_index": count, "page": page}, ensure_ascii=False) + "\n"
+                count += 1
+        except Exception as e:
+            yield json.dumps({"done": True, "success": False, "error": str(e)}, ensure_ascii=False) + "\n"
+            return
+        yield json.dumps({"done": True, "success": True, "page_count": count}) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @comic_bp.route('/api/validate', methods=['POST'])
 def validate_script_endpoint():
     """
@@ -79,6 +154,8 @@ def validate_script_endpoint():
         "script": {...}  # comic script object or array
     }
     """
+    from services.comic_service import validate_script
+
     try:
         data = request.get_json()
         script = data.get('script')
@@ -0,0 +1,100 @@
+"""Export controller - server-side PDF, CBZ and long-strip export of finished comics"""
+from flask import Blueprint, request, jsonify, send_file
+import uuid
+from urllib.parse import quote
+from services.export_service import ExportService, EXPORT_RETENTION
+from utils.jobs import get_job_manager
+
+export_bp = Blueprint('export', __name__)
+
+
+def _run_export_job(progress_callback, **kwargs):
+    """Job body for comic export"""
+    result = ExportService.export_comic(progress_callback=progress_callback, **kwargs)
+    return {
+        "download_url": f"/api/exports/{result['export_id']}/{quote(result['download_name'])}",
+        "download_name": result['download_name'],
+        "content_type": result['content_type'],
+        "bytes": result['bytes'],
+        "pages": result['pages']
+    }
+
+
+@export_bp.route('/api/export', methods=['POST'])
+def export_comic():
+    """
+    Queue an export of generated pages (and the cover) as one downloadable file
+
+    Expected JSON body:
+    {
+        "pages": ["/backend/static/images/...", ...],  # or [{"imageUrl": ..., "pageIndex": 0}, ...]
+        "cover": "/backend/static/images/...",  # optional, placed first
+        "format": "pdf",  # pdf, cbz, png (long strip) or webp (long strip)
+        "title": "My comic",  # optional, file name and metadata
+        "width": 1024  # optional strip width in pixels
+    }
+
+    The file is built by a worker process as a background job. Returns 202
+    with the job URLs; the succeeded job's result carries the download_url.
+    """
+    try:
+        data = request.get_json()
+
+        if not data:
+            return jsonify({"error": "No JSON data provided"}), 400
+
+        pages = data.get('pages')
+        if not pages or not isinstance(pages, list):
+            return jsonify({"error": "Pages are required"}), 400
+
+        width = data.get('width')
+        if width is not None and not isinstance(width, int):
+            return jsonify({"error": "Width must be an integer"}), 400
+
+        export_format = str(data.get('format', 'pdf')).lower()
+        ExportService.validate_request(pages, export_format, data.get('cover'), width)
+
+        job_id = get_job_manager().submit(
+            'export',
+            _run_export_job,
+            pages=pages,
+            export_format=export_format,
+            cover=data.get('cover'),
+            title=data.get('title'),
+            width=width,
+            export_id=uuid.uuid4().hex
+        )
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "status_url": f"/api/jobs/{job_id}",
+            "events_url": f"/api/jobs/{job_id}/events"
+        }), 202
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@export_bp.route('/api/exports/<export_id>/<download_name>', methods=['GET'])
+def download_export(export_id, download_name):
+    """
+    Download a finished export as an attachment
+
+    Exports stay available for COMIC_EXPORT_RETENTION seconds; Range
+    requests are supported, so interrupted downloads can resume.
+    """
+    try:
+        export = ExportService.export_file(export_id)
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+
+    return send_file(
+        export['path'],
+        mimetype=export['content_type'],
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True,
+        max_age=int(EXPORT_RETENTION)
+    )
@@ -1,7 +1,14 @@
 """Image controller - handles image generation and proxy endpoints"""
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, request, jsonify, Response, stream_with_context, send_file, send_from_directory, redirect
 import os
+import json
+import logging
+from contextlib import closing
+from comic_generator import IMAGES_DIR, get_image_storage
 from services.image_service import ImageService
+from utils.image_storage import content_type_for_key, key_from_url, sniff_mime
+
+logger = logging.getLogger(__name__)
 
 image_bp = Blueprint('image', __name__)
 
@@ -14,9 +21,10 @@ def generate_comic_image():
     Expected JSON body:
     {
         "page_data": {...},  # comic page data
-        "reference_img": "url" or ["url1", "url2"],  # optional reference image(s)
+        "reference_img": "url" or ["url1", "url2"],  # optional sketch(es): URL, data URI or sketch handle
         "comic_style": "doraemon",  # optional comic style
-        "google_api_key": "your-google-api-key"  # required Google API key
+        "google_api_key": "your-google-api-key",  # required Google API key
+        "cache": "bypass"  # optional, skip the generated-image cache
     }
     """
     try:
@@ -38,7 +46,7 @@ def generate_comic_image():
         reference_img = data.get('reference_img')
         extra_body = data.get('extra_body')
 
-        print(f"extra_body: {extra_body}")
+        logger.debug(f"extra_body: {extra_body}")
         
         # Generate image using service
         image_url, prompt = ImageService.generate_comic_image(
@@ -46,7 +54,8 @@ def generate_comic_image():
             comic_style=comic_style,
             reference_img=reference_img,
             extra_body=extra_body,
-            google_api_key=google_api_key
+            google_api_key=google_api_key,
+            cache=data.get('cache')
         )
         
         if not image_url:
@@ -62,6 +71,78 @@ def generate_comic_image():
         return jsonify({"error": str(e)}), 500
 
 
+@image_bp.route('/api/generate-images', methods=['POST'])
+def generate_comic_images_batch():
+    """
+    Generate images for every page of a comic in one request
+
+    Expected JSON body:
+    {
+        "pages": [{...}, {...}],  # comic pages data
+        "sketches": ["data:image/png;base64,...", ...],  # optional per-page sketches
+        "comic_style": "doraemon",  # optional comic style
+        "anchor_count": 1,  # optional number of pages generated first for consistency
+        "extra_body": [{"pageIndex": 0, "imageUrl": "..."}],  # optional pages generated earlier, used as references
+        "google_api_key": "your-google-api-key",  # required Google API key
+        "cache": "bypass"  # optional, skip the generated-image cache
+    }
+
+    Streams newline-delimited JSON, one line per finished page, followed by
+    a final {"done": true, ...} summary line.
+    """
+    data = request.get_json()
+
+    if not data:
+        return jsonify({"error": "No JSON data provided"}), 400
+
+    pages = data.get('pages')
+    if not pages or not isinstance(pages, list):
+        return jsonify({"error": "Pages are required"}), 400
+
+    google_api_key = data.get('google_api_key')
+    if not google_api_key:
+        return jsonify({"error": "Google API key is required"}), 400
+
+    sketches = data.get('sketches')
+    if sketches is not None and not isinstance(sketches, list):
+        return jsonify({"error": "Sketches must be a list"}), 400
+
+    anchor_count = data.get('anchor_count', 1)
+    if not isinstance(anchor_count, int) or anchor_count < 0:
+        return jsonify({"error": "Anchor count must be a non-negative integer"}), 400
+
+    previous_pages = data.get('extra_body')
+    if previous_pages is not None and not isinstance(previous_pages, list):
+        return jsonify({"error": "Extra body must be a list"}), 400
+
+    comic_style = data.get('comic_style', 'doraemon')
+
+    def generate():
+        succeeded = 0
+        results = ImageService.generate_comic_images_batch(
+            pages=pages,
+            comic_style=comic_style,
+            sketches=sketches,
+            google_api_key=google_api_key,
+            anchor_count=anchor_count,
+            cache=data.get('cache'),
+            previous_pages=previous_pages
+        )
+        # Closing the results on disconnect cancels the pages not yet started
+        with closing(results):
+            for result in results:
+                if result.get('success'):
+                    succeeded += 1
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        yield json.dumps({"done": True, "succeeded": succeeded, "total": len(pages)}) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @image_bp.route('/api/generate-cover', methods=['POST'])
 def generate_comic_cover_endpoint():
     """
@@ -71,12 +152,12 @@ def generate_comic_cover_endpoint():
     {
         "comic_style": "doraemon",
         "google_api_key": "your-google-api-key",
-        "reference_imgs": [...]  # optional reference images
+        "reference_imgs": [...],  # optional reference images
+        "cache": "bypass"  # optional, skip the generated-image cache
     }
     """
     try:
         data = request.get_json()
-        print(f"[Cover Generation] Received data: {data}")
         
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
@@ -89,16 +170,20 @@ def generate_comic_cover_endpoint():
         language = data.get('language', 'en')
         reference_imgs = data.get('reference_imgs')
 
-        print(f"[Cover Generation] Reference images count: {len(reference_imgs) if reference_imgs else 0}")
+        logger.debug(
+            f"[Cover Generation] style={comic_style} language={language} "
+            f"reference images: {len(reference_imgs) if reference_imgs else 0}"
+        )
         if reference_imgs:
-            print(f"[Cover Generation] First reference: {reference_imgs[0] if len(reference_imgs) > 0 else 'None'}")
+            logger.debug(f"[Cover Generation] First reference: {str(reference_imgs[0])[:80]}")
 
         # Generate cover using service
         image_url, prompt = ImageService.generate_comic_cover(
             comic_style=comic_style,
             google_api_key=google_api_key,
             reference_imgs=reference_imgs,
-            language=language
+            language=language,
+            cache=data.get('cache')
         )
         
         if not image_url:
@@ -114,13 +199,58 @@ def generate_comic_cover_endpoint():
         return jsonify({"error": str(e)}), 500
 
 
+@image_bp.route('/api/sketches', methods=['POST'])
+def upload_sketch():
+    """
+    Upload a page sketch once and get a handle to reuse as reference_img
+
+    Accepts either multipart/form-data with a "sketch" file field, the
+    raw image bytes as the request body (Content-Type: image/png), or
+    JSON {"page_data": {...}} to have the server draw the page layout.
+
+    Returns:
+    {
+        "success": true,
+        "handle": "sketch:<sha256>",
+        "digest": "<sha256>",
+        "url": "/backend/static/images/sketches/<sha256>.png"
+    }
+    """
+    try:
+        if request.is_json:
+            page_data = (request.get_json(silent=True) or {}).get('page_data')
+            if not page_data:
+                return jsonify({"error": "Page data is required"}), 400
+            result = ImageService.render_sketch(page_data)
+            return jsonify({"success": True, **result})
+
+        if 'sketch' in request.files:
+            data = request.files['sketch'].read()
+        elif request.mimetype and request.mimetype.startswith('image/'):
+            data = request.get_data()
+        else:
+            return jsonify({"error": "Sketch file is required"}), 400
+
+        result = ImageService.upload_sketch(data)
+        return jsonify({"success": True, **result})
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @image_bp.route('/api/proxy-image', methods=['GET'])
 def proxy_image():
     """
     Proxy image download to bypass CORS restrictions
-    
+
     Query parameters:
         url: The image URL to download
+
+    Cached images support If-None-Match / If-Modified-Since (304) and
+    Range requests. The first, uncached fetch is streamed through in full
+    with 200 and Accept-Ranges: none, ignoring any Range header.
     """
     try:
         image_url = request.args.get('url')
@@ -128,17 +258,111 @@ def proxy_image():
             return jsonify({"error": "Image URL is required"}), 400
         
         # Use service to download image
-        image_content, content_type = ImageService.proxy_image_download(image_url)
-        
-        # Return the image with appropriate headers
-        return Response(
-            image_content,
-            mimetype=content_type,
-            headers={
-                'Content-Disposition': f'attachment; filename=comic-{os.urandom(4).hex()}.png',
-                'Access-Control-Allow-Origin': '*'
-            }
-        )
+        result = ImageService.proxy_image(image_url)
+        download_name = f'comic-{os.urandom(4).hex()}.png'
+
+        if 'path' in result:
+            response = send_file(
+                result['path'],
+                mimetype=result['content_type'],
+                as_attachment=True,
+                download_name=download_name,
+                conditional=True,
+                etag=result['etag'],
+                last_modified=result['last_modified']
+            )
+        else:
+            headers = {'Content-Disposition': f'attachment; filename={download_name}', 'Accept-Ranges': 'none'}
+            if result['content_length'] is not None:
+                headers['Content-Length'] = str(result['content_length'])
+            response = Response(result['stream'], mimetype=result['content_type'], headers=headers)
+
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@image_bp.route('/api/images/<path:image_key>', methods=['GET'])
+def image_variant(image_key):
+    """
+    Serve a resized variant of a generated image
+
+    The key is the path after /backend/static/images/, e.g.
+    /api/images/3f/a2/<id>.png?w=400&fmt=webp
+
+    Query parameters:
+        w: Width in pixels, rounded up to the configured variant widths (optional, full size by default)
+        fmt: webp (default), jpeg or png
+
+    Responses carry a strong ETag and may be cached for a year; the
+    variant of an image never changes. Variants of an image that is still
+    being stored are rendered from its staged bytes and sent uncached.
+    """
+    try:
+        width = request.args.get('w', type=int)
+        if 'w' in request.args and width is None:
+            return jsonify({"error": "w must be an integer"}), 400
+        result = ImageService.image_variant(image_key, width, request.args.get('fmt', 'webp').lower())
+
+        if result['staged']:
+            response = Response(result['data'], mimetype=result['content_type'])
+            response.cache_control.no_cache = True
+            response.cache_control.max_age = 0
+        elif 'path' in result:
+            response = send_file(result['path'], mimetype=result['content_type'], conditional=True,
+                                 etag=result['etag'], max_age=31536000)
+        else:
+            response = Response(result['data'], mimetype=result['content_type'])
+            response.set_etag(result['etag'])
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+            response.make_conditional(request)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@image_bp.route('/backend/static/images/<path:subpath>', methods=['GET'])
+def stored_image(subpath):
+    """
+    Serve a generated image from the image storage
+
+    The frontend normally loads these paths from its own static file server;
+    this route makes them resolve against the backend too, including when
+    images are kept in S3 (redirects to a presigned URL).
+    """
+    url = f"/backend/static/images/{subpath}"
+    key = key_from_url(url)
+    if key is None:
+        # Sketches and other files that always stay on local disk
+        return send_from_directory(IMAGES_DIR, subpath)
+
+    storage = get_image_storage()
+    backend = storage.backend
+    staged = storage.staged_path(url)
+    if staged is not None:
+        # The writer replaces staged bytes with the final encoding, so they must not be cached
+        try:
+            with open(staged, 'rb') as f:
+                mime_type = sniff_mime(f.read(12)) or content_type_for_key(key)
+            response = send_file(staged, mimetype=mime_type, conditional=True, max_age=0)
+            response.cache_control.no_cache = True
+            return response
+        except FileNotFoundError:
+            # Committed in the meantime
+            pass
+    path = backend.local_path(key)
+    if path is not None:
+        # Committed images are never rewritten
+        return send_file(path, mimetype=content_type_for_key(key), conditional=True, max_age=31536000)
+    if hasattr(backend, 'presigned_url'):
+        return redirect(backend.presigned_url(key))
+    return jsonify({"error": "Image not found"}), 404
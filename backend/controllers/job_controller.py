@@ -0,0 +1,155 @@
+"""Job controller - asynchronous image generation jobs with polling and SSE"""
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+import json
+import time
+from services.image_service import ImageService
+from utils.jobs import get_job_manager, TERMINAL_STATUSES
+
+job_bp = Blueprint('job', __name__)
+
+# Seconds between SSE keep-alive comments while a job is quiet
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def _run_image_job(progress_callback, **kwargs):
+    """Job body for page image generation"""
+    image_url, prompt = ImageService.generate_comic_image(progress_callback=progress_callback, **kwargs)
+    if not image_url:
+        raise Exception("Image generation failed")
+    return {"image_url": image_url, "prompt": prompt}
+
+
+def _run_cover_job(progress_callback, **kwargs):
+    """Job body for cover generation"""
+    image_url, prompt = ImageService.generate_comic_cover(progress_callback=progress_callback, **kwargs)
+    if not image_url:
+        raise Exception("Cover generation failed")
+    return {"image_url": image_url, "prompt": prompt}
+
+
+def _accepted(job_id: str):
+    """Build the 202 response returned when a job is queued"""
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status_url": f"/api/jobs/{job_id}",
+        "events_url": f"/api/jobs/{job_id}/events"
+    }), 202
+
+
+@job_bp.route('/api/jobs/generate-image', methods=['POST'])
+def submit_image_job():
+    """
+    Queue a page image generation job
+
+    Accepts the same JSON body as /api/generate-image and returns
+    immediately with a job id.
+    """
+    data = request.get_json()
+
+    if not data:
+        return jsonify({"error": "No JSON data provided"}), 400
+
+    page_data = data.get('page_data')
+    if not page_data:
+        return jsonify({"error": "Page data is required"}), 400
+
+    google_api_key = data.get('google_api_key')
+    if not google_api_key:
+        return jsonify({"error": "Google API key is required"}), 400
+
+    job_id = get_job_manager().submit(
+        'generate-image',
+        _run_image_job,
+        page_data=page_data,
+        comic_style=data.get('comic_style', 'doraemon'),
+        reference_img=data.get('reference_img'),
+        extra_body=data.get('extra_body'),
+        google_api_key=google_api_key,
+        cache=data.get('cache')
+    )
+    return _accepted(job_id)
+
+
+@job_bp.route('/api/jobs/generate-cover', methods=['POST'])
+def submit_cover_job():
+    """
+    Queue a cover generation job
+
+    Accepts the same JSON body as /api/generate-cover and returns
+    immediately with a job id.
+    """
+    data = request.get_json()
+
+    if not data:
+        return jsonify({"error": "No JSON data provided"}), 400
+
+    google_api_key = data.get('google_api_key')
+    if not google_api_key:
+        return jsonify({"error": "Google API key is required"}), 400
+
+    job_id = get_job_manager().submit(
+        'generate-cover',
+        _run_cover_job,
+        comic_style=data.get('comic_style', 'doraemon'),
+        google_api_key=google_api_key,
+        reference_imgs=data.get('reference_imgs'),
+        language=data.get('language', 'en'),
+        cache=data.get('cache')
+    )
+    return _accepted(job_id)
+
+
+@job_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a job's status, progress, attempts and result"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@job_bp.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """
+    Stream a job's events as Server-Sent Events
+
+    Each event carries its sequence number as the SSE id, so a reconnecting
+    client resumes after Last-Event-ID. The stream ends once the job
+    succeeds or fails.
+    """
+    manager = get_job_manager()
+    if manager.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+    try:
+        after_seq = int(last_event_id)
+    except ValueError:
+        after_seq = 0
+
+    def generate():
+        seq = after_seq
+        last_sent = time.monotonic()
+        while True:
+            events = manager.wait_for_events(job_id, seq, timeout=1.0)
+            for event in events:
+                seq = event['seq']
+                payload = json.dumps(event['data'], ensure_ascii=False)
+                yield f"id: {seq}\nevent: {event['type']}\ndata: {payload}\n\n"
+                last_sent = time.monotonic()
+                if event['type'] in TERMINAL_STATUSES:
+                    return
+            if not events:
+                job = manager.get(job_id)
+                if job is None or job['status'] in TERMINAL_STATUSES:
+                    return
+                if time.monotonic() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                    yield ": keep-alive\n\n"
+                    last_sent = time.monotonic()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
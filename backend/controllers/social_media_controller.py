@@ -17,7 +17,8 @@ def generate_xiaohongshu_content():
         "comic_data": [...],  # array of comic pages
         "base_url": "https://api.openai.com/v1",  # optional
         "model": "gpt-4o-mini",  # optional
-        "platform": "xiaohongshu"  # or "twitter"
+        "platform": "xiaohongshu",  # or "twitter"
+        "cache": "bypass"  # optional, skip the response cache
     }
     """
     try:
@@ -42,7 +43,7 @@ def generate_xiaohongshu_content():
         
         # Generate social content using service
         service = SocialMediaService(api_key, base_url, model)
-        result = service.generate_social_content(comic_data, platform)
+        result = service.generate_social_content(comic_data, platform, cache=data.get('cache'))
         
         return jsonify({
             "success": True,
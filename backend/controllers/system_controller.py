@@ -0,0 +1,96 @@
+"""System controller - runtime statistics endpoints"""
+from flask import Blueprint, Response, jsonify
+from comic_generator import reference_cache, get_image_cache, get_image_storage, get_image_writer
+from services.image_service import proxy_cache, variant_cache
+from utils.client_pool import client_pool
+from utils.retry import retry_budget, retry_stats
+from utils.rate_limit import gemini_governor, llm_governor
+from utils.response_cache import get_response_cache
+from utils.metrics import render_metrics
+
+system_bp = Blueprint('system', __name__)
+
+
+@system_bp.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Report pool and cache counters for this worker process"""
+    image_cache = get_image_cache()
+    response_cache = get_response_cache()
+    return jsonify({
+        "client_pool": client_pool.stats(),
+        "reference_cache": reference_cache.stats(),
+        "image_cache": image_cache.stats() if image_cache else None,
+        "proxy_cache": proxy_cache.stats(),
+        "variant_cache": variant_cache.stats(),
+        "response_cache": response_cache.stats() if response_cache else None,
+        "image_storage": get_image_storage().stats(),
+        "image_writer": get_image_writer().stats(),
+        "retries": retry_stats.snapshot(),
+        "retry_budget_tokens": round(retry_budget.available(), 2),
+        "rate_limits": {
+            "gemini": gemini_governor.stats(),
+            "llm": llm_governor.stats()
+        }
+    })
+
+
+def collect_stats():
+    """Expose the existing stats() counters as Prometheus metric families"""
+    image_cache = get_image_cache()
+    response_cache = get_response_cache()
+    caches = {"reference": reference_cache.stats(), "proxy": proxy_cache.stats(), "variant": variant_cache.stats()}
+    if image_cache:
+        caches["image"] = image_cache.stats()
+    if response_cache:
+        caches["response"] = response_cache.stats()
+    yield ("comic_cache_hits_total", "counter", "Cache hits per cache",
+           [({"cache": name}, stats["hits"]) for name, stats in caches.items()])
+    yield ("comic_cache_misses_total", "counter", "Cache misses per cache",
+           [({"cache": name}, stats["misses"]) for name, stats in caches.items()])
+    yield ("comic_cache_entries", "gauge", "Entries held per cache",
+           [({"cache": name}, stats["entries"]) for name, stats in caches.items() if stats.get("entries") is not None])
+
+    retries = retry_stats.snapshot()
+    yield ("comic_upstream_calls_total", "counter", "Gemini/LLM operations started",
+           [({"operation": op}, values["calls"]) for op, values in retries.items()])
+    yield ("comic_upstream_retries_total", "counter", "Retries of Gemini/LLM operations",
+           [({"operation": op}, values["retries"]) for op, values in retries.items()])
+    yield ("comic_upstream_errors_total", "counter", "Failed Gemini/LLM attempts by kind",
+           [({"operation": op, "kind": kind}, values[f"{kind}_errors"])
+            for op, values in retries.items() for kind in ("retryable", "terminal")])
+    yield ("comic_retry_budget_tokens", "gauge", "Retries currently allowed by the retry budget",
+           [({}, retry_budget.available())])
+
+    governors = {"gemini": gemini_governor.stats(), "llm": llm_governor.stats()}
+    yield ("comic_rate_limit_in_flight", "gauge", "Upstream calls holding a rate-limit slot",
+           [({"governor": name}, sum(key["in_flight"] for key in stats["keys"].values()))
+            for name, stats in governors.items()])
+    yield ("comic_rate_limit_queue_depth", "gauge", "Callers waiting for a rate-limit slot",
+           [({"governor": name}, sum(key["queue_depth"] for key in stats["keys"].values()))
+            for name, stats in governors.items()])
+
+    storage = get_image_storage().stats()
+    yield ("comic_image_storage_deleted_total", "counter", "Generated images deleted by the retention sweeper",
+           [({"backend": storage["backend"]}, storage["deleted"])])
+    if storage["last_sweep"]:
+        yield ("comic_image_storage_bytes", "gauge", "Stored generated images at the last sweep",
+               [({"backend": storage["backend"]}, storage["last_sweep"]["bytes"])])
+
+    writer = get_image_writer().stats()
+    yield ("comic_image_writer_pending", "gauge", "Generated images waiting to be encoded and stored",
+           [({}, writer["pending"])])
+    yield ("comic_image_writer_written_total", "counter", "Generated images encoded and stored",
+           [({}, writer["written"])])
+    yield ("comic_image_writer_inline_total", "counter", "Image writes done on the request thread because the queue was full",
+           [({}, writer["inline"])])
+    yield ("comic_image_writer_failures_total", "counter", "Generated images that could not be re-encoded or stored",
+           [({}, writer["failures"])])
+
+    pool = client_pool.stats()
+    yield ("comic_client_pool_size", "gauge", "Pooled API clients", [({}, pool["size"])])
+
+
+@system_bp.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics of every worker (COMIC_METRICS_DIR), or of this process"""
+    return Response(render_metrics(collect_stats), mimetype='text/plain; version=0.0.4')
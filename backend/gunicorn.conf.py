@@ -0,0 +1,95 @@
+"""
+Gunicorn configuration for production serving
+
+Request time is dominated by waiting on Gemini and LLM APIs, so each
+worker runs many threads: for a request that waits a fraction W of its
+time, one core stays busy with about 1 / (1 - W) concurrent requests.
+
+Environment overrides:
+    PORT / COMIC_BIND             Listen address (default 0.0.0.0:5003)
+    COMIC_WORKERS                 Worker processes (default: CPU count); with more than one,
+                                  COMIC_JOB_STORE defaults to sqlite and COMIC_METRICS_DIR
+                                  to data/metrics
+    COMIC_THREADS                 Threads per worker (default: derived from COMIC_IO_WAIT)
+    COMIC_IO_WAIT                 Expected fraction of request time spent on remote I/O (default 0.95)
+    COMIC_MAX_THREADS             Upper bound for derived threads per worker (default 64)
+    COMIC_WORKER_TIMEOUT          Seconds a request may run before the worker is restarted (default 360)
+    COMIC_GRACEFUL_TIMEOUT        Seconds in-flight requests get to finish on shutdown (default 60)
+"""
+import math
+import os
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _threads_per_worker(workers: int, cpus: int) -> int:
+    io_wait = min(max(float(os.getenv("COMIC_IO_WAIT", 0.95)), 0.0), 0.99)
+    cores_per_worker = max(cpus / workers, 1.0)
+    threads = math.ceil(cores_per_worker / (1.0 - io_wait))
+    return max(1, min(threads, int(os.getenv("COMIC_MAX_THREADS", 64))))
+
+
+_cpus = _cpu_count()
+
+bind = os.getenv("COMIC_BIND", f"0.0.0.0:{os.getenv('PORT', 5003)}")
+workers = int(os.getenv("COMIC_WORKERS", _cpus))
+# Rate limits live in each worker's memory; every worker takes its share (utils/rate_limit.py)
+os.environ["COMIC_WORKERS"] = str(workers)
+# A job is polled by whichever worker receives the request, so with several
+# workers the job table has to live in SQLite rather than in worker memory
+if workers > 1:
+    os.environ.setdefault("COMIC_JOB_STORE", "sqlite")
+    if os.environ["COMIC_JOB_STORE"].lower() == "memory":
+        raise RuntimeError("COMIC_JOB_STORE=memory only works with one worker; use sqlite or COMIC_WORKERS=1")
+    # A scrape reaches one worker; workers merge their metrics through this directory
+    os.environ.setdefault("COMIC_METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                                                            "metrics"))
+# Threaded workers keep streaming (NDJSON/SSE) responses from blocking a whole process
+worker_class = "gthread"
+threads = int(os.getenv("COMIC_THREADS", _threads_per_worker(workers, _cpus)))
+
+# Image generation may retry for up to COMIC_IMAGE_DEADLINE (300s)
+timeout = int(os.getenv("COMIC_WORKER_TIMEOUT", 360))
+graceful_timeout = int(os.getenv("COMIC_GRACEFUL_TIMEOUT", 60))
+keepalive = 5
+
+# Import the app once in the master so workers fork with it loaded
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    from app import warm_up_shared
+    from utils.metrics import shared_metrics
+
+    warm_up_shared()
+    if shared_metrics is not None:
+        # Snapshots of a previous run's workers would inflate the totals
+        shared_metrics.clear()
+
+
+def when_ready(server):
+    server.log.info(
+        f"Serving on {bind} with {workers} workers x {threads} threads "
+        f"(timeout {timeout}s, graceful {graceful_timeout}s)"
+    )
+
+
+def post_worker_init(worker):
+    from app import warm_up_worker
+
+    # Returns at once; clients (and SDK imports with COMIC_PREWARM=1) load in the background
+    warm_up_worker()
+
+
+def worker_exit(server, worker):
+    from app import shutdown
+
+    shutdown()
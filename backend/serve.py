@@ -0,0 +1,96 @@
+"""
+Production server entry point
+
+Runs the app under gunicorn with the settings in gunicorn.conf.py:
+
+    uv run --extra serve serve.py
+    uv run --extra serve serve.py --workers 4 --threads 32 --bind 0.0.0.0:8080
+
+or, with --asgi, runs asgi.py under uvicorn so the generation endpoints are
+served by async handlers (one event loop per worker instead of a thread
+per in-flight request):
+
+    uv run --extra asgi serve.py --asgi --workers 2
+
+Command-line options override the matching COMIC_* environment variables.
+"""
+import argparse
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the comic generator API with gunicorn or uvicorn")
+    parser.add_argument("--bind", help="Listen address, e.g. 0.0.0.0:5003 (COMIC_BIND)")
+    parser.add_argument("--workers", type=int, help="Worker processes (COMIC_WORKERS)")
+    parser.add_argument("--threads", type=int, help="Threads per worker (COMIC_THREADS)")
+    parser.add_argument("--io-wait", type=float, help="Expected I/O wait fraction used to derive threads (COMIC_IO_WAIT)")
+    parser.add_argument("--asgi", action="store_true", help="Serve asgi.py with uvicorn instead of gunicorn")
+    args = parser.parse_args()
+
+    overrides = {
+        "COMIC_BIND": args.bind,
+        "COMIC_WORKERS": args.workers,
+        "COMIC_THREADS": args.threads,
+        "COMIC_IO_WAIT": args.io_wait,
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            os.environ[name] = str(value)
+
+    if args.asgi:
+        serve_asgi()
+        return
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        sys.exit("gunicorn is not installed; run `uv sync --extra serve` (gunicorn does not support Windows)")
+
+    os.chdir(BASE_DIR)
+    os.execvp(sys.executable, [
+        sys.executable, "-m", "gunicorn",
+        "--config", os.path.join(BASE_DIR, "gunicorn.conf.py"),
+        "app:app",
+    ])
+
+
+def serve_asgi() -> None:
+    """Run asgi:application under uvicorn with the same COMIC_* settings"""
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("uvicorn is not installed; run `uv sync --extra asgi`")
+
+    workers = int(os.getenv("COMIC_WORKERS", 1))
+    # Rate limits are split across the workers (utils/rate_limit.py)
+    os.environ["COMIC_WORKERS"] = str(workers)
+    if workers > 1:
+        # Same rule as gunicorn.conf.py: jobs must be visible to every worker
+        os.environ.setdefault("COMIC_JOB_STORE", "sqlite")
+        if os.environ["COMIC_JOB_STORE"].lower() == "memory":
+            sys.exit("COMIC_JOB_STORE=memory only works with one worker; use sqlite or --workers 1")
+        os.environ.setdefault("COMIC_METRICS_DIR", os.path.join(BASE_DIR, "data", "metrics"))
+
+    host, _, port = os.getenv("COMIC_BIND", f"0.0.0.0:{os.getenv('PORT', 5003)}").rpartition(":")
+    os.chdir(BASE_DIR)
+    sys.path.insert(0, BASE_DIR)
+    from utils.metrics import shared_metrics
+
+    if shared_metrics is not None:
+        shared_metrics.clear()
+    uvicorn.run(
+        "asgi:application",
+        host=host or "0.0.0.0",
+        port=int(port),
+        workers=workers,
+        timeout_keep_alive=5,
+        timeout_graceful_shutdown=int(os.getenv("COMIC_GRACEFUL_TIMEOUT", 60)),
+        lifespan="on",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,27 @@
 # Services package
-from .comic_service import ComicService, validate_script
-from .image_service import ImageService
-from .social_media_service import SocialMediaService
+# Exports resolve on first access (PEP 562) so importing the package does not
+# load every service module and its SDK dependencies up front
+import importlib
 
-__all__ = ['ComicService', 'validate_script', 'ImageService', 'SocialMediaService']
+_EXPORTS = {
+    'ComicService': 'comic_service',
+    'validate_script': 'comic_service',
+    'ImageService': 'image_service',
+    'SocialMediaService': 'social_media_service',
+    'ExportService': 'export_service',
+}
+
+__all__ = ['ComicService', 'validate_script', 'ImageService', 'SocialMediaService', 'ExportService']
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
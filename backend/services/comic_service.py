@@ -1,10 +1,20 @@
 """Comic script generation service"""
-import openai
+import asyncio
+import os
 import json
-from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
-from pydantic import BaseModel, Field
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Awaitable, Callable, Iterator, Optional
+from pydantic import BaseModel, Field, ValidationError
+from utils.client_pool import LLM_TIMEOUT_SECONDS, get_structured_model, get_json_stream_model, hash_api_key
+from utils.retry import RetryableError, attempt_timeout, call_with_retry, acall_with_retry, llm_retry_policy
+from utils.rate_limit import llm_governor
+from utils.response_cache import CACHE_BYPASS, get_response_cache, make_response_key
+from utils.prompt_registry import prompt_registry, log_prompt
+from utils.metrics import timed
+
+logger = logging.getLogger(__name__)
 
 
 class Panel(BaseModel):
@@ -21,6 +31,33 @@ class ComicPage(BaseModel):
 class ComicScript(BaseModel):
     pages: List[ComicPage] = Field(description="漫画面板页面列表")
 
+class PageOutline(BaseModel):
+    title: str = Field(description="页标题")
+    beats: List[str] = Field(description="本页情节要点，每条一句话")
+
+class ComicOutline(BaseModel):
+    summary: str = Field(description="故事梗概，包括主要角色及外形")
+    pages: List[PageOutline] = Field(description="每页大纲")
+
+
+SCRIPT_MODE_SINGLE = "single"
+SCRIPT_MODE_CHUNKED = "chunked"
+
+_page_executor: Optional[ThreadPoolExecutor] = None
+_page_executor_lock = threading.Lock()
+
+
+def _get_page_executor() -> ThreadPoolExecutor:
+    """Return the process-wide worker pool used for per-page script calls"""
+    global _page_executor
+    with _page_executor_lock:
+        if _page_executor is None:
+            _page_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('COMIC_SCRIPT_WORKERS', 10)),
+                thread_name_prefix='comic-script'
+            )
+        return _page_executor
+
 
 class ComicService:
     """Comic script generator using OpenAI API"""
@@ -32,70 +69,70 @@ class ComicService:
         self.comic_style = comic_style
         self.language = language
     
-    def generate_comic_script(self, prompt: str, page_count: int = 3) -> List[Dict[str, Any]]:
+    def generate_comic_script(self, prompt: str, page_count: int = 3, cache: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Generate comic script based on user prompt
         
         Args:
             prompt: User's description of the comic
             page_count: Number of pages to generate
+            cache: Per-request cache mode; "bypass" skips the lookup and refreshes the entry
             
         Returns:
             List of comic page data
         """
-        # Define style descriptions
-        style_descriptions = {
-            "doraemon": "哆啦A梦风格：圆润可爱的角色设计，简洁明快的线条，温馨幽默的氛围",
-            "american": "美式漫画风格：夸张的肌肉线条，英雄主义，强烈的明暗对比",
-            "watercolor": "水彩风格：柔和的色彩过渡，艺术感的笔触，梦幻氛围",
-            "disney": "迪士尼动画风格：经典的迪士尼角色设计，流畅的动作表现，丰富的表情，温暖明亮的色彩，充满魔法和梦幻的氛围",
-            "ghibli": "宫崎骏/吉卜力风格：细腻的自然场景描绘，柔和温暖的色调，充满想象力的奇幻元素，人物表情细腻生动，富有诗意和治愈感",
-            "pixar": "皮克斯动画风格：3D渲染质感，圆润可爱的角色设计，丰富的光影效果，细腻的材质表现，情感表达真挚动人",
-            "shonen": "日本少年漫画风格：充满动感的线条和速度线，夸张的表情和动作，热血激昂的氛围，强烈的视觉冲击力，快节奏的分镜"
-        }
-        
-        # Define language instructions
-        language_instructions = {
-            "zh": "请用中文生成所有内容（包括标题和分镜描述）。",
-            "en": "Please generate all content in English (including titles and panel descriptions).",
-            "ja": "すべてのコンテンツ（タイトルとパネルの説明を含む）を日本語で生成してください。"
-        }
-        
-        style_desc = style_descriptions.get(self.comic_style, style_descriptions["doraemon"])
-        language_instruction = language_instructions.get(self.language, language_instructions["zh"])
-        
-        system_prompt = f"""You are a professional comic storyboard script assistant. Please generate a {page_count}-page comic storyboard script based on the user's description.
+        return self._cached(
+            SCRIPT_MODE_SINGLE, prompt, page_count, cache,
+            lambda: self._generate_comic_script(prompt, page_count)
+        )
 
-**IMPORTANT: Please use {style_desc} to design the storyboard content.**
+    def _cache_key(self, mode: str, prompt: str, page_count: int) -> str:
+        return make_response_key(
+            "comic_script", prompt=prompt, page_count=page_count, mode=mode,
+            comic_style=self.comic_style, language=self.language,
+            model=self.model, base_url=self.base_url, api_key=hash_api_key(self.api_key)
+        )
 
-**Language Requirement: {language_instruction}**
+    def _cached(self, mode: str, prompt: str, page_count: int, cache: Optional[str],
+                compute: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Serve a whole script from the response cache, computing it on a miss"""
+        response_cache = get_response_cache()
+        if response_cache is None:
+            return compute()
+        return response_cache.get_or_compute(
+            self._cache_key(mode, prompt, page_count), compute, bypass=cache == CACHE_BYPASS
+        )
 
-Please strictly follow the provided Schema structure to generate the storyboard script:
+    def _cached_stream(self, mode: str, prompt: str, page_count: int, cache: Optional[str],
+                       pages: Callable[[], Iterator[Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+        """Replay a cached script page by page, or stream and store it once complete"""
+        response_cache = get_response_cache()
+        if response_cache is None:
+            yield from pages()
+            return
+        key = self._cache_key(mode, prompt, page_count)
+        if cache != CACHE_BYPASS:
+            cached = response_cache.get(key)
+            if cached is not None:
+                yield from cached
+                return
+        streamed = []
+        for page in pages():
+            streamed.append(page)
+            yield page
+        response_cache.put(key, streamed)
 
-1. **Story Structure**:
-   - Generate a complete and coherent {page_count}-page story.
-   - Each page (ComicPage) should contain 3-5 rows (Rows).
-   - **Pacing Control**: Each row can contain 1-3 panels (Panels). Avoid having only 1 panel per row entirely; use rows with 2-3 panels frequently to add dynamism and pacing variation.
-
-2. **Visual Design (Critical)**:
-   - **Row Height**: Dynamically adjust `height` based on the importance of the panels.
-     - Standard shots/dialogue: Use '250px'.
-     - Key actions/emphasis shots: Use '350px' or '400px'.
-     - Avoid using the same height for all rows.
-   - **Panel Description**: The `text` field MUST contain specific visual descriptions (e.g., camera angle, facial expressions, body language, background details).
-   - Descriptions should fully reflect the visual style of {self.comic_style}.
-
-3. **Language**:
-   - All content (titles, descriptions) must follow the language requirement: {language_instruction}"""
+    def _generate_comic_script(self, prompt: str, page_count: int) -> List[Dict[str, Any]]:
+        messages = self._build_messages(prompt, page_count)
 
         try:
-            llm = ChatOpenAI(model=self.model, openai_api_key=self.api_key, base_url=self.base_url, temperature=0.7, max_tokens=3000)
-            structured_llm = llm.with_structured_output(ComicScript)
-            response: ComicScript = structured_llm.invoke(
-                input=[
-                    SystemMessage(content=system_prompt),
-                    HumanMessage(content=prompt)
-                ],
+            structured_llm = get_structured_model(
+                self.api_key, self.base_url, self.model, ComicScript, temperature=0.7, max_tokens=3000
+            )
+            response: ComicScript = call_with_retry(
+                llm_governor.wrap(self.api_key, lambda: structured_llm.invoke(input=messages, timeout=_llm_timeout())),
+                llm_retry_policy(),
+                name="llm_script"
             )
             
             # Parse and validate JSON
@@ -106,6 +143,306 @@ Please strictly follow the provided Schema structure to generate the storyboard
         except Exception as e:
             raise Exception(f"AI generation failed: {str(e)}")
 
+    async def agenerate_comic_script(self, prompt: str, page_count: int = 3, cache: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Async variant of ``generate_comic_script`` using the model's ``ainvoke``"""
+        return await self._acached(
+            SCRIPT_MODE_SINGLE, prompt, page_count, cache,
+            lambda: self._agenerate_comic_script(prompt, page_count)
+        )
+
+    async def _acached(self, mode: str, prompt: str, page_count: int, cache: Optional[str],
+                       compute: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        response_cache = get_response_cache()
+        if response_cache is None:
+            return await compute()
+        return await response_cache.aget_or_compute(
+            self._cache_key(mode, prompt, page_count), compute, bypass=cache == CACHE_BYPASS
+        )
+
+    async def _agenerate_comic_script(self, prompt: str, page_count: int) -> List[Dict[str, Any]]:
+        messages = self._build_messages(prompt, page_count)
+
+        try:
+            structured_llm = get_structured_model(
+                self.api_key, self.base_url, self.model, ComicScript, temperature=0.7, max_tokens=3000
+            )
+            response: ComicScript = await acall_with_retry(
+                llm_governor.awrap(self.api_key, lambda: structured_llm.ainvoke(input=messages, timeout=_llm_timeout())),
+                llm_retry_policy(),
+                name="llm_script"
+            )
+            return [elem.model_dump() for elem in response.pages]
+        except Exception as e:
+            raise Exception(f"AI generation failed: {str(e)}")
+
+    def stream_comic_script(self, prompt: str, page_count: int = 3, cache: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Generate comic script, yielding each page as soon as it is complete
+
+        The model streams the ComicScript JSON; a page is yielded once the
+        next page has started (or the stream has ended) and it validates
+        against ComicPage. Only opening the stream is retried, so pages are
+        never yielded twice. Cached scripts are replayed immediately.
+
+        Args:
+            prompt: User's description of the comic
+            page_count: Number of pages to generate
+            cache: Per-request cache mode; "bypass" skips the lookup and refreshes the entry
+
+        Yields:
+            Comic page data, in order
+        """
+        return self._cached_stream(
+            SCRIPT_MODE_SINGLE, prompt, page_count, cache,
+            lambda: self._stream_comic_script(prompt, page_count)
+        )
+
+    def _stream_comic_script(self, prompt: str, page_count: int) -> Iterator[Dict[str, Any]]:
+        messages = self._build_messages(prompt, page_count)
+        llm = get_json_stream_model(
+            self.api_key, self.base_url, self.model, ComicScript, temperature=0.7, max_tokens=3000
+        )
+
+        def open_stream():
+            chunks = iter(llm.stream(messages, timeout=_llm_timeout()))
+            return chunks, next(chunks, None)
+
+        try:
+            # The slot is held for the whole stream, as for a blocking call
+            with llm_governor.limit(self.api_key):
+                chunks, first = call_with_retry(open_stream, llm_retry_policy(), name="llm_script_stream")
+                parser = _PageStreamParser()
+                if first is not None:
+                    yield from parser.feed(first.text)
+                for chunk in chunks:
+                    yield from parser.feed(chunk.text)
+                yield from parser.finish()
+        except Exception as e:
+            raise Exception(f"AI generation failed: {str(e)}")
+
+    def generate_comic_script_chunked(self, prompt: str, page_count: int = 3, cache: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Generate comic script as an outline plus one parallel call per page
+
+        Each call produces far fewer tokens than a whole script, so latency
+        stays roughly flat as page_count grows and long comics do not hit
+        the max_tokens ceiling.
+
+        Args:
+            prompt: User's description of the comic
+            page_count: Number of pages to generate
+            cache: Per-request cache mode; "bypass" skips the lookup and refreshes the entry
+
+        Returns:
+            List of comic page data, in the same shape as generate_comic_script
+        """
+        return self._cached(
+            SCRIPT_MODE_CHUNKED, prompt, page_count, cache,
+            lambda: list(self._iter_comic_script_chunked(prompt, page_count))
+        )
+
+    def iter_comic_script_chunked(self, prompt: str, page_count: int = 3, cache: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Chunked generation, yielding pages in order as soon as each is ready
+
+        Args:
+            prompt: User's description of the comic
+            page_count: Number of pages to generate
+            cache: Per-request cache mode; "bypass" skips the lookup and refreshes the entry
+
+        Yields:
+            Comic page data, in order
+        """
+        return self._cached_stream(
+            SCRIPT_MODE_CHUNKED, prompt, page_count, cache,
+            lambda: self._iter_comic_script_chunked(prompt, page_count)
+        )
+
+    def _iter_comic_script_chunked(self, prompt: str, page_count: int) -> Iterator[Dict[str, Any]]:
+        try:
+            outline_llm = get_structured_model(
+                self.api_key, self.base_url, self.model, ComicOutline, temperature=0.7, max_tokens=1500
+            )
+            outline_messages = self._build_outline_messages(prompt, page_count)
+            outline: ComicOutline = call_with_retry(
+                llm_governor.wrap(self.api_key, lambda: _fit_outline(
+                    outline_llm.invoke(input=outline_messages, timeout=_llm_timeout()), page_count
+                )),
+                llm_retry_policy(),
+                name="llm_outline"
+            )
+
+            page_llm = get_structured_model(
+                self.api_key, self.base_url, self.model, ComicPage, temperature=0.7, max_tokens=1500
+            )
+
+            def write_page(index: int) -> ComicPage:
+                messages = self._build_page_messages(prompt, outline, index)
+                return call_with_retry(
+                    llm_governor.wrap(self.api_key, lambda: page_llm.invoke(input=messages, timeout=_llm_timeout())),
+                    llm_retry_policy(),
+                    name="llm_page"
+                )
+
+            executor = _get_page_executor()
+            futures = [executor.submit(write_page, index) for index in range(len(outline.pages))]
+            try:
+                pages = []
+                for future in futures:
+                    pages.append(future.result())
+                    yield pages[-1].model_dump()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        except Exception as e:
+            raise Exception(f"AI generation failed: {str(e)}")
+
+    async def agenerate_comic_script_chunked(self, prompt: str, page_count: int = 3, cache: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Async variant of ``generate_comic_script_chunked``; page calls run as concurrent tasks"""
+        return await self._acached(
+            SCRIPT_MODE_CHUNKED, prompt, page_count, cache,
+            lambda: self._agenerate_comic_script_chunked(prompt, page_count)
+        )
+
+    async def _agenerate_comic_script_chunked(self, prompt: str, page_count: int) -> List[Dict[str, Any]]:
+        try:
+            outline_llm = get_structured_model(
+                self.api_key, self.base_url, self.model, ComicOutline, temperature=0.7, max_tokens=1500
+            )
+            outline_messages = self._build_outline_messages(prompt, page_count)
+            async def request_outline() -> ComicOutline:
+                return _fit_outline(await outline_llm.ainvoke(input=outline_messages, timeout=_llm_timeout()), page_count)
+
+            outline: ComicOutline = await acall_with_retry(
+                llm_governor.awrap(self.api_key, request_outline),
+                llm_retry_policy(),
+                name="llm_outline"
+            )
+
+            page_llm = get_structured_model(
+                self.api_key, self.base_url, self.model, ComicPage, temperature=0.7, max_tokens=1500
+            )
+
+            async def write_page(index: int) -> ComicPage:
+                messages = self._build_page_messages(prompt, outline, index)
+                return await acall_with_retry(
+                    llm_governor.awrap(self.api_key, lambda: page_llm.ainvoke(input=messages, timeout=_llm_timeout())),
+                    llm_retry_policy(),
+                    name="llm_page"
+                )
+
+            # gather cancels nothing on failure, so cancel the remaining pages explicitly
+            tasks = [asyncio.ensure_future(write_page(index)) for index in range(len(outline.pages))]
+            try:
+                pages = await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+            return [page.model_dump() for page in pages]
+
+        except Exception as e:
+            raise Exception(f"AI generation failed: {str(e)}")
+
+    @timed("prompt_build")
+    def _build_messages(self, prompt: str, page_count: int) -> list:
+        """Build the system and user messages for a script request"""
+        system_prompt = prompt_registry.script_prompt(self.comic_style, self.language, page_count)
+        log_prompt(logger, "Script prompt", system_prompt)
+        return _messages(system_prompt, prompt)
+
+    @timed("prompt_build")
+    def _build_outline_messages(self, prompt: str, page_count: int) -> list:
+        """Build the messages asking for a short per-page outline"""
+        system_prompt = prompt_registry.outline_prompt(self.comic_style, self.language, page_count)
+        log_prompt(logger, "Outline prompt", system_prompt)
+        return _messages(system_prompt, prompt)
+
+    @timed("prompt_build")
+    def _build_page_messages(self, prompt: str, outline: "ComicOutline", page_index: int) -> list:
+        """Build the messages asking for one page's rows and panels, conditioned on the outline"""
+        plan = "\n".join(
+            f"Page {i + 1}: {page.title}" + "".join(f"\n   - {beat}" for beat in page.beats)
+            for i, page in enumerate(outline.pages)
+        )
+        system_prompt = prompt_registry.page_script_prompt(
+            self.comic_style, self.language,
+            page_number=page_index + 1,
+            page_total=len(outline.pages),
+            summary=outline.summary,
+            outline=plan,
+            page_title=outline.pages[page_index].title
+        )
+        log_prompt(logger, f"Page {page_index + 1} prompt", system_prompt)
+        return _messages(system_prompt, prompt)
+
+
+def _fit_outline(outline: ComicOutline, page_count: int) -> ComicOutline:
+    """
+    Hold the outline to the requested page count
+
+    Extra pages are dropped. A short outline raises, so the outline call
+    is retried like any other bad response.
+    """
+    if len(outline.pages) < page_count:
+        raise RetryableError(f"Outline has {len(outline.pages)} pages, expected {page_count}")
+    if len(outline.pages) > page_count:
+        outline = outline.model_copy(update={"pages": outline.pages[:page_count]})
+    return outline
+
+
+def _llm_timeout() -> float:
+    """Per-call LLM timeout, cut short by the retry deadline"""
+    return attempt_timeout(LLM_TIMEOUT_SECONDS)
+
+
+def _messages(system_prompt: str, prompt: str) -> list:
+    # langchain_core is imported on first use to keep the service cheap to import
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=prompt)
+    ]
+
+
+class _PageStreamParser:
+    """Incrementally parse a streamed ComicScript JSON document into pages"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.emitted = 0
+
+    def _ready_pages(self, pages: list, complete: bool) -> Iterator[Dict[str, Any]]:
+        # The last page may still be growing until the document is complete
+        ready = len(pages) if complete else len(pages) - 1
+        while self.emitted < ready:
+            try:
+                page = ComicPage.model_validate(pages[self.emitted])
+            except ValidationError:
+                if complete:
+                    raise
+                return
+            self.emitted += 1
+            yield page.model_dump()
+
+    def feed(self, text: str) -> Iterator[Dict[str, Any]]:
+        """Add streamed text, yielding pages completed by it"""
+        self.buffer += text
+        # A page can only complete when an object or array closes or opens
+        if not any(c in text for c in "{}]"):
+            return
+        from langchain_core.utils.json import parse_partial_json
+
+        partial = parse_partial_json(self.buffer)
+        if isinstance(partial, dict) and isinstance(partial.get("pages"), list):
+            yield from self._ready_pages(partial["pages"], complete=False)
+
+    def finish(self) -> Iterator[Dict[str, Any]]:
+        """Validate the complete document and yield the remaining pages"""
+        script = ComicScript.model_validate(json.loads(self.buffer))
+        yield from self._ready_pages([page.model_dump() for page in script.pages], complete=True)
+
 
 def validate_script(script) -> tuple[bool, str]:
     """
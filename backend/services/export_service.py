@@ -0,0 +1,272 @@
+"""Comic export service - assembles generated pages into PDF, CBZ or long-strip images"""
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from comic_generator import DATA_DIR, get_image_storage, get_image_writer
+from utils.comic_export import CONTENT_TYPES, EXPORT_FORMATS, build_export
+from utils.image_storage import key_from_url
+from utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv('COMIC_EXPORT_DIR', os.path.join(DATA_DIR, 'exports'))
+MAX_EXPORT_PAGES = int(os.getenv('COMIC_EXPORT_MAX_PAGES', 64))
+EXPORT_TIMEOUT = float(os.getenv('COMIC_EXPORT_TIMEOUT', 300))
+# Widest long strip that can be requested; strips are never wider than their narrowest page
+MAX_EXPORT_WIDTH = int(os.getenv('COMIC_EXPORT_MAX_WIDTH', 4096))
+# Seconds a finished export stays downloadable
+EXPORT_RETENTION = float(os.getenv('COMIC_EXPORT_RETENTION', 3600))
+
+_EXPORT_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+_export_executor: Optional[ProcessPoolExecutor] = None
+_export_executor_lock = threading.Lock()
+
+
+def _remove_stale_exports() -> None:
+    """Delete exports past their retention, and any a crashed worker left behind"""
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - max(EXPORT_RETENTION, EXPORT_TIMEOUT * 2)
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if name.startswith('export-') and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def _get_export_executor() -> ProcessPoolExecutor:
+    """Return the process-wide pool that builds exports"""
+    global _export_executor
+    with _export_executor_lock:
+        if _export_executor is None:
+            # Spawned, not forked: the server process runs many threads, and
+            # a forked child could inherit a lock one of them was holding
+            _export_executor = ProcessPoolExecutor(
+                max_workers=int(os.getenv('COMIC_EXPORT_WORKERS', 2)),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _export_executor
+
+
+def _discard_export_executor(executor: ProcessPoolExecutor) -> None:
+    """
+    Drop a pool that lost a worker, so the next export starts a new one
+
+    A ProcessPoolExecutor whose worker died (killed after a timeout, or by
+    the OOM killer) fails every later submission.
+    """
+    global _export_executor
+    with _export_executor_lock:
+        if _export_executor is executor:
+            _export_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_export_executor() -> None:
+    """Stop the export worker processes"""
+    global _export_executor
+    with _export_executor_lock:
+        executor, _export_executor = _export_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _download_name(title: Optional[str], export_format: str) -> str:
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '_', title or '').strip(' ._')[:80]
+    return f"{name or 'comic'}.{export_format}"
+
+
+class ExportService:
+    """Server-side export of finished comics"""
+
+    @staticmethod
+    def _image_urls(images: List[Union[str, Dict]]) -> List[str]:
+        """Accept plain URLs or the frontend's {imageUrl, pageIndex} objects, in page order"""
+        if images and all(isinstance(img, dict) for img in images):
+            images = sorted(images, key=lambda img: img.get('pageIndex', 0))
+        urls = []
+        for img in images:
+            url = img.get('imageUrl') if isinstance(img, dict) else img
+            if not isinstance(url, str) or key_from_url(url) is None:
+                raise ValueError(f"Not a generated image URL: {str(url)[:80]}")
+            urls.append(url)
+        return urls
+
+    @staticmethod
+    def _local_file(url: str, work_dir: str, index: int) -> str:
+        """Return a local file holding the final bytes of a stored image"""
+        key = key_from_url(url)
+        # Export the final bytes, not the copy staged while the writer is busy
+        get_image_writer().wait(key, timeout=60)
+        storage = get_image_storage()
+        path = storage.local_path(url)
+        if path is not None:
+            return path
+        if not storage.backend.exists(key):
+            raise FileNotFoundError(f"Image not found: {url}")
+        path = os.path.join(work_dir, f"source-{index:03d}")
+        with open(path, 'wb') as f:
+            f.write(storage.read(url))
+        return path
+
+    @staticmethod
+    def validate_request(
+        pages: List[Union[str, Dict]],
+        export_format: str = 'pdf',
+        cover: Optional[Union[str, Dict]] = None,
+        width: Optional[int] = None
+    ) -> List[str]:
+        """
+        Check an export request before it is queued
+
+        Returns:
+            Image URLs to export, cover first
+
+        Raises:
+            ValueError: Invalid format, width or image URLs
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {export_format} (expected pdf, cbz, png or webp)")
+        # Pages are put in order on their own, so a plain cover URL cannot disable their sorting
+        urls = ExportService._image_urls([cover] if cover else []) + ExportService._image_urls(list(pages or []))
+        if not urls:
+            raise ValueError("At least one page image is required")
+        if len(urls) > MAX_EXPORT_PAGES:
+            raise ValueError(f"At most {MAX_EXPORT_PAGES} images can be exported at once")
+        if width is not None and not 1 <= width <= MAX_EXPORT_WIDTH:
+            raise ValueError(f"Width must be between 1 and {MAX_EXPORT_WIDTH} pixels")
+        return urls
+
+    @staticmethod
+    def export_comic(
+        pages: List[Union[str, Dict]],
+        export_format: str = 'pdf',
+        cover: Optional[Union[str, Dict]] = None,
+        title: Optional[str] = None,
+        width: Optional[int] = None,
+        export_id: Optional[str] = None,
+        progress_callback: Optional[Callable[[str, dict], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Build a PDF, CBZ or long-strip PNG/WebP from generated images
+
+        The export is built by a worker process into ``<EXPORT_DIR>/export-<export_id>``,
+        where ``export_file`` finds it until EXPORT_RETENTION has passed. Run
+        it as a job: it blocks until the file is complete. A worker that
+        exceeds EXPORT_TIMEOUT exits.
+
+        Args:
+            pages: Page image URLs (or {imageUrl, pageIndex} objects)
+            export_format: pdf, cbz, png or webp
+            cover: Optional cover image URL, placed before the pages
+            title: Comic title, used for the file name and document metadata
+            width: Strip width in pixels (png/webp; at most, and by default, the narrowest page)
+            export_id: 32 hex digits naming the export (generated if omitted)
+            progress_callback: Optional callback receiving (event_type, data) progress events
+
+        Returns:
+            Dict with export_id, path, content_type, download_name and the builder's result
+
+        Raises:
+            ValueError: Invalid format or image URLs
+            FileNotFoundError: An image is no longer stored
+            TimeoutError: The export took longer than EXPORT_TIMEOUT
+            RuntimeError: The worker process died (e.g. out of memory)
+        """
+        urls = ExportService.validate_request(pages, export_format, cover, width)
+        export_id = export_id or uuid.uuid4().hex
+        if not _EXPORT_ID_RE.match(export_id):
+            raise ValueError("Invalid export id")
+
+        _remove_stale_exports()
+        work_dir = os.path.join(EXPORT_DIR, f"export-{export_id}")
+        os.makedirs(work_dir)
+        # Marks the export unfinished for export_file until the cleanup below
+        open(os.path.join(work_dir, 'building'), 'w').close()
+        try:
+            paths = [ExportService._local_file(url, work_dir, i) for i, url in enumerate(urls)]
+            output_path = os.path.join(work_dir, f"export.{export_format}")
+            if progress_callback:
+                progress_callback("exporting", {"pages": len(paths), "format": export_format})
+            with span("export"):
+                result = ExportService._build(export_format, paths, output_path, work_dir,
+                                              title=title, has_cover=bool(cover), width=width)
+            # Leave only the export, which also marks it finished for export_file
+            for name in os.listdir(work_dir):
+                if name != os.path.basename(output_path):
+                    os.remove(os.path.join(work_dir, name))
+        except BaseException:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+
+        logger.info(f"Exported {len(paths)} images as {export_format} ({result['bytes'] / (1024 * 1024):.1f} MB)")
+        return {
+            "export_id": export_id,
+            "path": output_path,
+            "content_type": CONTENT_TYPES[export_format],
+            "download_name": _download_name(title, export_format),
+            **result
+        }
+
+    @staticmethod
+    def _build(export_format: str, paths: List[str], output_path: str, work_dir: str, **options) -> Dict[str, int]:
+        """
+        Run ``build_export`` in the pool
+
+        A running task cannot be cancelled, so the worker enforces
+        EXPORT_TIMEOUT on itself and exits. Killing it from here could hit
+        a worker that has just moved on to another export.
+        """
+        executor = _get_export_executor()
+        timeout_path = os.path.join(work_dir, 'timed-out')
+        try:
+            future = executor.submit(build_export, export_format, paths, output_path,
+                                     timeout=EXPORT_TIMEOUT, timeout_path=timeout_path, **options)
+            try:
+                return future.result(timeout=EXPORT_TIMEOUT)
+            except FutureTimeoutError:
+                if future.cancel():
+                    raise TimeoutError(f"Export did not start within {EXPORT_TIMEOUT:g} s")
+            # Started late: its watchdog ends it at most EXPORT_TIMEOUT from now
+            try:
+                return future.result(timeout=EXPORT_TIMEOUT + 30)
+            except FutureTimeoutError:
+                raise TimeoutError(f"Export took longer than {EXPORT_TIMEOUT:g} s")
+        except BrokenProcessPool:
+            _discard_export_executor(executor)
+            if os.path.exists(timeout_path):
+                raise TimeoutError(f"Export took longer than {EXPORT_TIMEOUT:g} s and was stopped")
+            raise RuntimeError("Export worker stopped unexpectedly (out of memory?), please try again")
+
+    @staticmethod
+    def export_file(export_id: str) -> Dict[str, str]:
+        """
+        Find a finished export
+
+        Returns:
+            Dict with path and content_type
+
+        Raises:
+            FileNotFoundError: Unknown, unfinished or expired export
+        """
+        if _EXPORT_ID_RE.match(export_id or ''):
+            work_dir = os.path.join(EXPORT_DIR, f"export-{export_id}")
+            # Only the export is left once it has finished building
+            if os.path.isdir(work_dir) and not os.path.exists(os.path.join(work_dir, 'building')):
+                for export_format in EXPORT_FORMATS:
+                    path = os.path.join(work_dir, f"export.{export_format}")
+                    if os.path.isfile(path):
+                        return {"path": path, "content_type": CONTENT_TYPES[export_format]}
+        raise FileNotFoundError(f"Export not found: {export_id}")
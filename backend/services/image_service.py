@@ -1,8 +1,66 @@
 """Image generation service"""
+import asyncio
 import os
-import requests
-from typing import List, Dict, Any, Optional, Union
-from comic_generator import generate_social_media_image_core
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Union, Iterator, Callable
+from comic_generator import (
+    generate_social_media_image_core, agenerate_social_media_image_core, sketch_store, BASE_DIR, IMAGES_DIR,
+    get_image_storage, get_image_writer
+)
+from utils.proxy_cache import ProxyCache, freshness_lifetime
+from utils.image_storage import CONTENT_TYPES, derivative_key, key_from_url, url_for_key
+from utils.image_variants import ImageVariantCache, VARIANT_FORMATS, render_variant, snap_width, variant_id
+from utils.prompt_registry import prompt_registry, log_prompt
+from utils.sketch_renderer import layout_digest, render_sketch
+from utils.metrics import span, timed
+
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of previous pages sent as references (matches the frontend)
+MAX_PREVIOUS_PAGES = 6
+
+PROXY_CHUNK_SIZE = 64 * 1024
+
+proxy_cache = ProxyCache(
+    directory=os.getenv('COMIC_PROXY_CACHE_DIR', os.path.join(BASE_DIR, 'data', 'proxy_cache')),
+    max_bytes=int(os.getenv('COMIC_PROXY_CACHE_MB', 512)) * 1024 * 1024,
+    max_object_bytes=int(os.getenv('COMIC_PROXY_MAX_OBJECT_MB', 25)) * 1024 * 1024
+)
+
+# Widths /api/images/<key>?w= is rounded up to, so each image has a handful of variants
+VARIANT_WIDTHS = tuple(sorted({
+    int(w) for w in os.getenv('COMIC_IMAGE_VARIANT_WIDTHS', '200,400,800,1024,1200,1600').split(',') if w.strip()
+}))
+VARIANT_QUALITY = int(os.getenv('COMIC_IMAGE_VARIANT_QUALITY', 80))
+
+variant_cache = ImageVariantCache(
+    cache_dir=os.path.join(IMAGES_DIR, 'variants'),
+    max_bytes=int(os.getenv('COMIC_IMAGE_VARIANT_CACHE_MB', 256)) * 1024 * 1024
+)
+
+# Draw the page sketch on the server when the client does not send one
+SERVER_SKETCHES = os.getenv('COMIC_SERVER_SKETCHES', '1').lower() in ('1', 'true', 'yes', 'on')
+
+_batch_executor: Optional[ThreadPoolExecutor] = None
+_batch_executor_lock = threading.Lock()
+
+
+def _get_batch_executor() -> ThreadPoolExecutor:
+    """Return the process-wide worker pool used for batch page generation"""
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('COMIC_BATCH_WORKERS', 4)),
+                thread_name_prefix='comic-batch'
+            )
+        return _batch_executor
 
 
 class ImageService:
@@ -14,7 +72,9 @@ class ImageService:
         comic_style: str = 'doraemon',
         reference_img: Optional[Union[str, List[str]]] = None,
         extra_body: Optional[List] = None,
-        google_api_key: str = None
+        google_api_key: str = None,
+        progress_callback: Optional[Callable[[str, dict], None]] = None,
+        cache: Optional[str] = None
     ) -> tuple[Optional[str], str]:
         """
         Generate comic image from page data
@@ -22,16 +82,70 @@ class ImageService:
         Args:
             page_data: Comic page data with rows and panels
             comic_style: Style of the comic
-            reference_img: Optional reference image(s)
+            reference_img: Optional sketch reference(s): URL, data URI or sketch:<sha256> handle;
+                rendered from ``page_data`` on the server when omitted
             extra_body: Optional extra body parameters (previous pages)
             google_api_key: Google API key for image generation
+            progress_callback: Optional callback receiving (event_type, data) progress events
+            cache: Optional cache mode ("bypass" forces a fresh generation)
             
         Returns:
             Tuple of (image_url, prompt)
         """
         # Convert page data to prompt with style
         prompt = ImageService._convert_page_to_prompt(page_data, comic_style)
+        if reference_img is None:
+            reference_img = ImageService._server_sketch(page_data)
         
+        # Generate image
+        image_url = generate_social_media_image_core(
+            prompt=prompt,
+            reference_img=ImageService._page_references(reference_img, extra_body),
+            google_api_key=google_api_key,
+            progress_callback=progress_callback,
+            cache=cache
+        )
+        
+        return image_url, prompt
+
+    @staticmethod
+    async def agenerate_comic_image(
+        page_data: Dict[str, Any],
+        comic_style: str = 'doraemon',
+        reference_img: Optional[Union[str, List[str]]] = None,
+        extra_body: Optional[List] = None,
+        google_api_key: str = None,
+        progress_callback: Optional[Callable[[str, dict], None]] = None,
+        cache: Optional[str] = None
+    ) -> tuple[Optional[str], str]:
+        """Async variant of ``generate_comic_image``"""
+        prompt = ImageService._convert_page_to_prompt(page_data, comic_style)
+        if reference_img is None:
+            reference_img = await asyncio.to_thread(ImageService._server_sketch, page_data)
+        image_url = await agenerate_social_media_image_core(
+            prompt=prompt,
+            reference_img=ImageService._page_references(reference_img, extra_body),
+            google_api_key=google_api_key,
+            progress_callback=progress_callback,
+            cache=cache
+        )
+        return image_url, prompt
+
+    @staticmethod
+    def _server_sketch(page_data: Dict[str, Any]) -> Optional[str]:
+        """Handle of the server-rendered sketch for a page, or None if disabled or not drawable"""
+        if not SERVER_SKETCHES:
+            return None
+        try:
+            return ImageService.render_sketch(page_data)['handle']
+        except ValueError as e:
+            logger.warning(f"Page sketch not rendered: {e}")
+            return None
+
+    @staticmethod
+    def _page_references(reference_img: Optional[Union[str, List[str]]],
+                         extra_body: Optional[List]) -> Optional[List]:
+        """Previous pages as style references, followed by the page sketch(es)"""
         # Prepare reference images (can be single image or array)
         reference_images = []
         
@@ -47,28 +161,100 @@ class ImageService:
         # Add current page sketch as last reference
         if reference_img:
             if isinstance(reference_img, str):
-                reference_images.append(reference_img)
+                reference_images.append({'imageUrl': reference_img, 'role': 'sketch'})
             elif isinstance(reference_img, list):
-                reference_images.extend(reference_img)
+                reference_images.extend(
+                    {'imageUrl': img, 'role': 'sketch'} if isinstance(img, str) else img
+                    for img in reference_img
+                )
         
         # Use reference_images if we have any, otherwise None
-        final_reference = reference_images if reference_images else None
-        
-        # Generate image
-        image_url = generate_social_media_image_core(
-            prompt=prompt,
-            reference_img=final_reference,
-            google_api_key=google_api_key
-        )
-        
-        return image_url, prompt
+        return reference_images if reference_images else None
     
+    @staticmethod
+    def generate_comic_images_batch(
+        pages: List[Dict[str, Any]],
+        comic_style: str = 'doraemon',
+        sketches: Optional[List[Optional[str]]] = None,
+        google_api_key: str = None,
+        anchor_count: int = 1,
+        cache: Optional[str] = None,
+        previous_pages: Optional[List[Dict[str, Any]]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Generate images for all pages, yielding each result as soon as it is ready
+
+        The first ``anchor_count`` pages are generated one after another, each
+        using the previously generated anchors as references, so they fix the
+        characters and style. The remaining pages then run concurrently on the
+        shared batch worker pool with the anchors as their references.
+        ``previous_pages`` (pages generated earlier) start the anchor list, so
+        only missing pages need to be sent. When the consumer stops reading,
+        pages that have not started are cancelled.
+
+        Args:
+            pages: List of comic page data
+            comic_style: Style of the comic
+            sketches: Optional per-page sketch reference, aligned with ``pages``
+            google_api_key: Google API key for image generation
+            anchor_count: Number of leading pages generated sequentially
+            cache: Optional cache mode ("bypass" forces fresh generations)
+            previous_pages: Optional already generated pages ({pageIndex, imageUrl}) used as references
+
+        Yields:
+            Per-page result dicts with page_index, success and image_url/prompt or error
+        """
+        sketches = sketches or []
+        anchor_count = max(0, min(anchor_count, len(pages)))
+        anchors: List[Dict[str, Any]] = list(previous_pages or [])
+
+        def run_page(index: int, previous: List[Dict[str, Any]]) -> Dict[str, Any]:
+            sketch = sketches[index] if index < len(sketches) else None
+            try:
+                image_url, prompt = ImageService.generate_comic_image(
+                    page_data=pages[index],
+                    comic_style=comic_style,
+                    reference_img=sketch,
+                    extra_body=previous[-MAX_PREVIOUS_PAGES:] or None,
+                    google_api_key=google_api_key,
+                    cache=cache
+                )
+            except Exception as e:
+                logger.warning(f"Batch page {index + 1} failed: {e}")
+                return {"page_index": index, "success": False, "error": str(e)}
+            if not image_url:
+                return {"page_index": index, "success": False, "error": "Image generation failed"}
+            return {"page_index": index, "success": True, "image_url": image_url, "prompt": prompt}
+
+        # Consistency anchors: strictly sequential
+        for index in range(anchor_count):
+            result = run_page(index, anchors)
+            if result["success"]:
+                anchors.append({"pageIndex": index, "imageUrl": result["image_url"]})
+            yield result
+
+        # Remaining pages: concurrent, conditioned on the anchors
+        executor = _get_batch_executor()
+        futures = [
+            executor.submit(run_page, index, list(anchors))
+            for index in range(anchor_count, len(pages))
+        ]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # The client went away: don't spend the quota on pages nobody reads
+            for future in futures:
+                future.cancel()
+
     @staticmethod
     def generate_comic_cover(
         comic_style: str = 'doraemon',
         google_api_key: str = None,
         reference_imgs: List[Union[str, Dict]] = None,
-        language: str = 'en'
+        language: str = 'en',
+        progress_callback: Optional[Callable[[str, dict], None]] = None,
+        cache: Optional[str] = None
     ) -> tuple[Optional[str], str]:
         """
         Generate comic cover image
@@ -78,14 +264,48 @@ class ImageService:
             google_api_key: Google API key
             reference_imgs: List of reference image URLs
             language: Language for cover generation (en, zh, ja)
+            progress_callback: Optional callback receiving (event_type, data) progress events
+            cache: Optional cache mode ("bypass" forces a fresh generation)
 
         Returns:
             Tuple of (image_url, prompt)
         """
         # Create cover prompt
         prompt = ImageService._create_cover_prompt(comic_style, language)
+
+        image_url = generate_social_media_image_core(
+            prompt=prompt,
+            reference_img=ImageService._cover_references(reference_imgs),
+            google_api_key=google_api_key,
+            progress_callback=progress_callback,
+            cache=cache
+        )
         
-        # Prepare reference images list (extract URLs from objects if needed)
+        return image_url, prompt
+
+    @staticmethod
+    async def agenerate_comic_cover(
+        comic_style: str = 'doraemon',
+        google_api_key: str = None,
+        reference_imgs: List[Union[str, Dict]] = None,
+        language: str = 'en',
+        progress_callback: Optional[Callable[[str, dict], None]] = None,
+        cache: Optional[str] = None
+    ) -> tuple[Optional[str], str]:
+        """Async variant of ``generate_comic_cover``"""
+        prompt = ImageService._create_cover_prompt(comic_style, language)
+        image_url = await agenerate_social_media_image_core(
+            prompt=prompt,
+            reference_img=ImageService._cover_references(reference_imgs),
+            google_api_key=google_api_key,
+            progress_callback=progress_callback,
+            cache=cache
+        )
+        return image_url, prompt
+
+    @staticmethod
+    def _cover_references(reference_imgs: Optional[List[Union[str, Dict]]]) -> List[str]:
+        """Extract URLs from reference objects if needed"""
         processed_refs = []
         if reference_imgs:
             for img in reference_imgs:
@@ -93,35 +313,209 @@ class ImageService:
                     processed_refs.append(img['imageUrl'])
                 elif isinstance(img, str):
                     processed_refs.append(img)
-
-        image_url = generate_social_media_image_core(
-            prompt=prompt,
-            reference_img=processed_refs,
-            google_api_key=google_api_key
-        )
-        
-        return image_url, prompt
+        return processed_refs
     
     @staticmethod
-    def proxy_image_download(image_url: str) -> tuple[bytes, str]:
+    def upload_sketch(data: bytes) -> Dict[str, str]:
         """
-        Proxy image download to bypass CORS restrictions
-        
+        Store a page sketch and return a reusable handle
+
+        Args:
+            data: Raw PNG/JPEG/WebP bytes
+
+        Returns:
+            Dict with handle (usable as reference_img), digest and url
+        """
+        return sketch_store.save(data)
+
+    @staticmethod
+    def render_sketch(page_data: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Draw the panel-grid sketch of a page and store it like an uploaded one
+
+        Rendering is deterministic, so each distinct layout is drawn once and
+        later calls return the stored handle.
+
+        Args:
+            page_data: Comic page data with rows and panels
+
+        Returns:
+            Dict with handle (usable as reference_img), digest and url
+
+        Raises:
+            ValueError: If the page has no rows or is too tall to draw
+        """
+        with span("sketch_render"):
+            return sketch_store.save_rendered(layout_digest(page_data), lambda: render_sketch(page_data))
+
+    @staticmethod
+    def proxy_image(image_url: str) -> Dict[str, Any]:
+        """
+        Proxy an image download to bypass CORS restrictions
+
+        Fresh cached copies are served from disk; stale ones are revalidated
+        upstream with If-None-Match / If-Modified-Since. Anything else is
+        streamed through in chunks and stored in the cache on the way if the
+        upstream cache headers allow it.
+
         Args:
             image_url: URL of the image to download
-            
+
         Returns:
-            Tuple of (image_content, content_type)
+            Dict with content_type and either "path" (cached file, plus etag
+            and last_modified) or "stream" (chunk iterator, plus content_length,
+            None when the upstream length is missing or invalid)
         """
-        response = requests.get(image_url, timeout=30)
-        
+        now = time.time()
+        meta = proxy_cache.lookup(image_url)
+        if meta is not None and meta.get("expires_at", 0) > now:
+            proxy_cache.touch(meta)
+            return ImageService._cached_proxy_result(meta)
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        import requests
+
+        response = requests.get(image_url, timeout=30, stream=True, headers=headers)
+
+        if response.status_code == 304 and meta is not None:
+            response.close()
+            proxy_cache.refresh(meta, response.headers, now)
+            proxy_cache.touch(meta, "revalidated")
+            return ImageService._cached_proxy_result(meta)
+
         if response.status_code != 200:
+            response.close()
             raise Exception(f"Failed to fetch image: {response.status_code}")
-        
+
+        proxy_cache.record_miss()
         content_type = response.headers.get('Content-Type', 'image/png')
-        return response.content, content_type
-    
+        content_length = ImageService._content_length(response.headers.get('Content-Length'))
+        chunks = ImageService._iter_response(response)
+
+        lifetime = freshness_lifetime(response.headers, now)
+        has_validators = bool(response.headers.get('ETag') or response.headers.get('Last-Modified'))
+        too_large = content_length is not None and content_length > proxy_cache.max_object_bytes
+        if lifetime is not None and (lifetime > 0 or has_validators) and not too_large:
+            chunks = proxy_cache.tee(image_url, chunks, response.headers, lifetime, now)
+
+        return {
+            "stream": chunks,
+            "content_type": content_type,
+            "content_length": content_length
+        }
+
     @staticmethod
+    def image_variant(image_key: str, width: Optional[int] = None, fmt: str = 'webp') -> Dict[str, Any]:
+        """
+        Return a resized and re-encoded copy of a generated image
+
+        Variants are rendered on first request and served from the variant
+        cache afterwards; the derivatives the image writer stores next to
+        each page are reused when they match. While the writer is still
+        encoding the image, the variant is rendered from the staged bytes
+        and neither cached nor marked cacheable ("staged").
+
+        Args:
+            image_key: Storage key, i.e. the path after /backend/static/images/
+            width: Requested width in pixels (rounded up to COMIC_IMAGE_VARIANT_WIDTHS), None for full size
+            fmt: webp, jpeg or png
+
+        Returns:
+            Dict with content_type, etag, staged and either "path" (file to send) or "data" (bytes)
+
+        Raises:
+            ValueError: Invalid key, width or format
+            FileNotFoundError: No stored image under the key
+        """
+        url = url_for_key(image_key)
+        if key_from_url(url) != image_key:
+            raise ValueError(f"Invalid image key: {image_key}")
+        if fmt not in VARIANT_FORMATS:
+            raise ValueError(f"Unsupported format: {fmt} (expected webp, jpeg or png)")
+        if width is not None:
+            if width < 1:
+                raise ValueError("Width must be a positive integer")
+            width = snap_width(width, VARIANT_WIDTHS)
+
+        image_format, ext = VARIANT_FORMATS[fmt]
+        etag = variant_id(image_key, width, image_format, VARIANT_QUALITY)
+        name = f"{etag}.{ext}"
+        result = {"content_type": CONTENT_TYPES[ext], "etag": etag, "staged": False}
+
+        path = variant_cache.get(name)
+        if path is not None:
+            return {**result, "path": path}
+
+        storage = get_image_storage()
+        staged = storage.staged_path(url)
+        if staged is not None:
+            try:
+                with open(staged, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # Committed in the meantime
+                data = None
+            if data is not None:
+                # Don't hold the request until the writer is done; the final encoding may differ
+                with span("image_variant"):
+                    data = render_variant(data, width, image_format, VARIANT_QUALITY)
+                return {**result, "staged": True, "data": data}
+
+        policy = get_image_writer().policy
+        if (width in policy.derivative_widths and image_format == policy.derivative_format
+                and VARIANT_QUALITY == policy.derivative_quality):
+            stored = derivative_key(image_key, width, ext)
+            if storage.backend.exists(stored):
+                return {**result, **ImageService._cache_variant(name, storage.backend.read(stored))}
+
+        if storage.local_path(url) is None and not storage.backend.exists(image_key):
+            raise FileNotFoundError(f"Image not found: {image_key}")
+        with span("image_variant"):
+            data = render_variant(storage.read(url), width, image_format, VARIANT_QUALITY)
+        return {**result, **ImageService._cache_variant(name, data)}
+
+    @staticmethod
+    def _cache_variant(name: str, data: bytes) -> Dict[str, Any]:
+        path = variant_cache.put(name, data)
+        return {"path": path} if path is not None else {"data": data}
+
+    @staticmethod
+    def _content_length(value: Optional[str]) -> Optional[int]:
+        """Parse an upstream Content-Length, treating malformed values as unknown"""
+        try:
+            length = int(value)
+        except (TypeError, ValueError):
+            return None
+        return length if length >= 0 else None
+
+    @staticmethod
+    def _cached_proxy_result(meta: Dict[str, Any]) -> Dict[str, Any]:
+        """Describe a cached proxy entry for the controller"""
+        return {
+            "path": meta["path"],
+            "content_type": meta.get("content_type", "image/png"),
+            "etag": f"{meta['key'][:16]}-{meta.get('size', 0)}-{int(meta.get('stored_at', 0))}",
+            "last_modified": meta.get("stored_at")
+        }
+
+    @staticmethod
+    def _iter_response(response: "requests.Response") -> Iterator[bytes]:
+        """Yield an upstream body in chunks and always release the connection"""
+        try:
+            for chunk in response.iter_content(chunk_size=PROXY_CHUNK_SIZE):
+                if chunk:
+                    yield chunk
+        finally:
+            response.close()
+
+    @staticmethod
+    @timed("prompt_build")
     def _convert_page_to_prompt(page_data: Dict[str, Any], comic_style: str = 'doraemon') -> str:
         """Convert page data to image generation prompt"""
         panels = []
@@ -132,70 +526,18 @@ class ImageService:
                         if 'text' in panel:
                             panels.append(f"Panel {i}-{j}: {panel['text']}")
 
-        prompt_template = """Using the style of {comic_style}, convert the storyline in each panel of the reference image into corresponding comic content.
-
-# Content:
-
-## Title
-{title}
-
-## Panels
-{panels}
-
-# Requirements:
-- The content of each panel should avoid being overly complex.
-- Maintain consistency in characters and scenes.
-- Preserve the layout and proportions of the comic.
-- The image should be colorful and vibrant.
-- Do not show panel index in the content.
-- Include speech bubbles with short, clear dialogue to help tell the story.
-- Keep dialogue concise to avoid cluttering the image.
-- Ensure text is legible and spelled correctly.
-- Display the title only once, typically at the top center of the comic page.
-- Do not duplicate the title in multiple locations.
-- Maintain consistent and uniform margins around the entire comic page.
-- Ensure equal spacing on all sides (top, bottom, left, right) for a professional appearance.
-- The comic title should use a {comic_style}-style font that matches the overall comic aesthetic.
-- Use fonts that properly support Chinese characters to prevent text corruption.
-- Ensure all Chinese text is correctly encoded and displayed without mojibake or garbled characters.
-- Text should be clear, sharp, and properly rendered in both speech bubbles and titles.
-"""
-        
-        final_prompt = prompt_template.format(
-            comic_style=comic_style, 
+        final_prompt = prompt_registry.page_image_prompt(
+            comic_style,
             title=page_data.get('title', ''),
             panels="\n".join(panels)
         )
-        print(final_prompt)
+        log_prompt(logger, "Page prompt", final_prompt)
         return final_prompt
     
     @staticmethod
+    @timed("prompt_build")
     def _create_cover_prompt(comic_style: str, language: str = 'en') -> str:
         """Create prompt for comic cover"""
-        # Language-specific text requirement
-        language_requirements = {
-            'zh': '生成的图片务必使用中文',
-            'en': 'Generated images must use English',
-            'ja': '生成された画像は必ず日本語を使用してください'
-        }
-        language_requirement = language_requirements.get(language, language_requirements['en'])
-
-        prompt_template = """Create a high-quality comic book cover in the style of {comic_style}.
-
-# Requirements:
-- The image must be a vertical comic book cover composition.
-- The art style must strictly follow {comic_style}.
-- Make it eye-catching and dramatic.
-- High resolution, detailed, and professional quality.
-- No other text except the title.
-- Clear and sharp text for the title, do not repeat all the titles in reference images.
-- Vibrant colors and "Cover Art" aesthetic.
-- Only present one row one panel in the cover.
-- {language_requirement}
-"""
-        final_prompt = prompt_template.format(
-            comic_style=comic_style,
-            language_requirement=language_requirement
-        )
-        print(f"Cover Prompt: {final_prompt}")
+        final_prompt = prompt_registry.cover_prompt(comic_style, language)
+        log_prompt(logger, "Cover prompt", final_prompt)
         return final_prompt
@@ -1,7 +1,11 @@
 """Social media content generation service"""
-import openai
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from utils.client_pool import LLM_TIMEOUT_SECONDS, get_openai_client, get_async_openai_client, hash_api_key
+from utils.retry import attempt_timeout, call_with_retry, acall_with_retry, llm_retry_policy
+from utils.rate_limit import llm_governor
+from utils.response_cache import CACHE_BYPASS, get_response_cache, make_response_key
+from utils.metrics import timed
 
 
 class SocialMediaService:
@@ -11,20 +15,79 @@ class SocialMediaService:
         self.api_key = api_key
         self.base_url = base_url
         self.model = model
-        openai.api_key = api_key
-        openai.api_base = base_url
     
-    def generate_social_content(self, comic_data: List[Dict], platform: str = 'xiaohongshu') -> Dict[str, Any]:
+    def generate_social_content(self, comic_data: List[Dict], platform: str = 'xiaohongshu',
+                                cache: Optional[str] = None) -> Dict[str, Any]:
         """
         Generate social media content from comic data
         
         Args:
             comic_data: Array of comic pages
             platform: 'xiaohongshu' or 'twitter'
+            cache: Per-request cache mode; "bypass" skips the lookup and refreshes the entry
             
         Returns:
             Dict with title, content, and tags
         """
+        response_cache = get_response_cache()
+        if response_cache is None:
+            return self._generate_social_content(comic_data, platform)
+        key = make_response_key(
+            "social_content", comic_data=comic_data, platform=platform,
+            model=self.model, base_url=self.base_url, api_key=hash_api_key(self.api_key)
+        )
+        return response_cache.get_or_compute(
+            key, lambda: self._generate_social_content(comic_data, platform), bypass=cache == CACHE_BYPASS
+        )
+
+    async def agenerate_social_content(self, comic_data: List[Dict], platform: str = 'xiaohongshu',
+                                       cache: Optional[str] = None) -> Dict[str, Any]:
+        """Async variant of ``generate_social_content`` using ``openai.AsyncOpenAI``"""
+        response_cache = get_response_cache()
+        if response_cache is None:
+            return await self._agenerate_social_content(comic_data, platform)
+        key = make_response_key(
+            "social_content", comic_data=comic_data, platform=platform,
+            model=self.model, base_url=self.base_url, api_key=hash_api_key(self.api_key)
+        )
+        return await response_cache.aget_or_compute(
+            key, lambda: self._agenerate_social_content(comic_data, platform), bypass=cache == CACHE_BYPASS
+        )
+
+    def _generate_social_content(self, comic_data: List[Dict], platform: str) -> Dict[str, Any]:
+        messages = self._build_messages(comic_data, platform)
+        client = get_openai_client(self.api_key, self.base_url)
+        response = call_with_retry(
+            llm_governor.wrap(self.api_key, lambda: client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.8,
+                max_tokens=1000,
+                timeout=attempt_timeout(LLM_TIMEOUT_SECONDS)
+            )),
+            llm_retry_policy(),
+            name="llm_social"
+        )
+        return self._parse_response(response, platform)
+
+    async def _agenerate_social_content(self, comic_data: List[Dict], platform: str) -> Dict[str, Any]:
+        messages = self._build_messages(comic_data, platform)
+        client = get_async_openai_client(self.api_key, self.base_url)
+        response = await acall_with_retry(
+            llm_governor.awrap(self.api_key, lambda: client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.8,
+                max_tokens=1000,
+                timeout=attempt_timeout(LLM_TIMEOUT_SECONDS)
+            )),
+            llm_retry_policy(),
+            name="llm_social"
+        )
+        return self._parse_response(response, platform)
+
+    @timed("prompt_build")
+    def _build_messages(self, comic_data: List[Dict], platform: str) -> List[Dict[str, str]]:
         # Extract comic content summary
         comic_summary = self._extract_comic_summary(comic_data)
         
@@ -96,16 +159,13 @@ Create a viral tweet that captures the FEELING and makes people say "this is so
 
 写出让人"太懂了！"的文案，要有你的态度和感悟！"""
 
-        response = openai.ChatCompletion.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.8,
-            max_tokens=1000
-        )
-        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    @timed("llm_decode")
+    def _parse_response(self, response, platform: str) -> Dict[str, Any]:
         generated_text = response.choices[0].message.content.strip()
         
         # Extract JSON from markdown code blocks if present
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("a2wsgi")
+
+import asgi  # noqa: E402
+from services import social_media_service  # noqa: E402
+from services.social_media_service import SocialMediaService  # noqa: E402
+
+
+def test_lifespan_shuts_down_off_the_event_loop(monkeypatch):
+    shutdown_threads = []
+    monkeypatch.setattr(asgi, "warm_up_shared", lambda: None)
+    monkeypatch.setattr(asgi, "warm_up_worker", lambda: None)
+    monkeypatch.setattr(asgi, "shutdown", lambda: shutdown_threads.append(threading.get_ident()))
+
+    async def run():
+        messages = asyncio.Queue()
+        sent = []
+        for message_type in ("lifespan.startup", "lifespan.shutdown"):
+            messages.put_nowait({"type": message_type})
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await asgi.application({"type": "lifespan"}, messages.get, send)
+        return sent, threading.get_ident()
+
+    sent, loop_thread = asyncio.run(run())
+
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert len(shutdown_threads) == 1 and shutdown_threads[0] != loop_thread
+
+
+def test_async_social_path_builds_no_sync_client(monkeypatch):
+    def sync_client(api_key, base_url):
+        raise AssertionError("sync client built")
+
+    monkeypatch.setattr(social_media_service, "get_openai_client", sync_client)
+    SocialMediaService("sk-test", "https://llm.example/v1", "gpt-4o-mini")
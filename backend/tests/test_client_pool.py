@@ -0,0 +1,113 @@
+import importlib
+import threading
+import time
+
+from pydantic import BaseModel
+
+from utils.client_pool import ClientPool, get_chat_model, get_structured_model, hash_api_key
+
+# utils re-exports the pool instance under the module's name
+client_pool_module = importlib.import_module("utils.client_pool")
+
+
+def counting_factory():
+    built = []
+
+    def factory():
+        built.append(object())
+        return built[-1]
+
+    factory.built = built
+    return factory
+
+
+def test_key_never_holds_the_raw_api_key():
+    key = ClientPool.make_key("openai", "sk-secret", "https://api.openai.com/v1", "gpt-4o-mini")
+    assert "sk-secret" not in repr(key)
+    assert key == ("openai", hash_api_key("sk-secret"), "https://api.openai.com/v1", "gpt-4o-mini")
+    assert ClientPool.make_key("openai", None) == ("openai", "anonymous", "", "")
+
+
+def test_same_key_reuses_one_client():
+    pool = ClientPool()
+    factory = counting_factory()
+    key = ClientPool.make_key("gemini", "key")
+
+    assert pool.get(key, factory) is pool.get(key, factory)
+    assert pool.get(ClientPool.make_key("gemini", "other"), factory) is not factory.built[0]
+    assert len(factory.built) == 2
+    assert pool.stats()["hits"] == 1 and pool.stats()["misses"] == 2
+
+
+def test_least_recently_used_client_is_evicted_when_full():
+    pool = ClientPool(max_size=2)
+    factory = counting_factory()
+    first, second, third = (ClientPool.make_key("gemini", name) for name in ("a", "b", "c"))
+
+    pool.get(first, factory)
+    pool.get(second, factory)
+    pool.get(first, factory)
+    pool.get(third, factory)
+
+    assert pool.stats()["evictions"] == 1
+    pool.get(first, factory)
+    assert len(factory.built) == 3
+    pool.get(second, factory)
+    assert len(factory.built) == 4
+
+
+def test_idle_clients_are_evicted(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(client_pool_module.time, "monotonic", lambda: clock[0])
+    pool = ClientPool(idle_seconds=60)
+    factory = counting_factory()
+    key = ClientPool.make_key("gemini", "key")
+
+    pool.get(key, factory)
+    clock[0] += 30
+    pool.get(key, factory)
+    clock[0] += 61
+    pool.get(key, factory)
+
+    assert len(factory.built) == 2
+    assert pool.stats()["evictions"] == 1
+
+
+def test_concurrent_misses_keep_the_first_client():
+    pool = ClientPool()
+    key = ClientPool.make_key("gemini", "key")
+    barrier = threading.Barrier(4)
+
+    def slow_factory():
+        time.sleep(0.05)
+        return object()
+
+    results = []
+
+    def fetch():
+        barrier.wait()
+        results.append(pool.get(key, slow_factory))
+
+    threads = [threading.Thread(target=fetch) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(client) for client in results}) == 1
+    assert pool.stats()["size"] == 1
+
+
+def test_langchain_models_are_pooled_per_settings(monkeypatch):
+    monkeypatch.setattr(client_pool_module, "client_pool", ClientPool())
+    model = get_chat_model("sk-test", "https://llm.example/v1", "gpt-4o-mini")
+
+    assert get_chat_model("sk-test", "https://llm.example/v1", "gpt-4o-mini") is model
+    assert get_chat_model("sk-test", "https://llm.example/v1", "gpt-4o-mini", temperature=0.2) is not model
+    assert model.max_retries == 0
+
+    class Schema(BaseModel):
+        title: str
+
+    structured = get_structured_model("sk-test", "https://llm.example/v1", "gpt-4o-mini", Schema)
+    assert get_structured_model("sk-test", "https://llm.example/v1", "gpt-4o-mini", Schema) is structured
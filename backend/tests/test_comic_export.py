@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+import time
+import zipfile
+
+import pytest
+from PIL import Image
+
+from services.export_service import MAX_EXPORT_WIDTH, ExportService
+from utils.comic_export import _exit_after, build_export
+
+PAGE_URL = "/backend/static/images/aa/bb/page.png"
+
+
+@pytest.fixture
+def pages(tmp_path):
+    """Two pages of different widths, the second with transparency"""
+    paths = []
+    for index, (size, mode, color) in enumerate([((300, 200), "RGB", (200, 0, 0)),
+                                                  ((400, 100), "RGBA", (0, 0, 200, 0))]):
+        path = str(tmp_path / f"page{index}.png")
+        Image.new(mode, size, color).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_png_strip_stacks_pages_at_the_narrowest_width(pages, tmp_path):
+    output = str(tmp_path / "strip.png")
+    result = build_export("png", pages, output)
+
+    assert (result["width"], result["height"]) == (300, 275)
+    with Image.open(output) as strip:
+        strip.load()
+        assert strip.size == (300, 275)
+        assert strip.getpixel((10, 10)) == (200, 0, 0)
+        # Transparent pixels are flattened onto white
+        assert strip.getpixel((10, 250)) == (255, 255, 255)
+    assert result["bytes"] == os.path.getsize(output)
+
+
+@pytest.mark.parametrize("export_format", ["png", "webp"])
+def test_strips_never_scale_pages_up(pages, tmp_path, export_format):
+    output = str(tmp_path / f"strip.{export_format}")
+    assert build_export(export_format, pages, output, width=4000)["width"] == 300
+    assert build_export(export_format, pages, output, width=150)["width"] == 150
+    with Image.open(output) as strip:
+        assert strip.size == (150, 138)
+
+
+def test_pdf_has_one_page_per_image(pages, tmp_path):
+    output = str(tmp_path / "comic.pdf")
+    build_export("pdf", pages, output, title="My comic")
+    with open(output, "rb") as f:
+        data = f.read()
+    assert data.startswith(b"%PDF")
+    assert data.count(b"/Type /Page ") == 2
+
+
+def test_cbz_keeps_original_pages(pages, tmp_path):
+    output = str(tmp_path / "comic.cbz")
+    build_export("cbz", pages, output, title="My comic", has_cover=True)
+    with zipfile.ZipFile(output) as archive:
+        names = archive.namelist()
+        assert "ComicInfo.xml" in names
+        with open(pages[0], "rb") as f:
+            assert f.read() in [archive.read(name) for name in names]
+        assert b"<Title>My comic</Title>" in archive.read("ComicInfo.xml")
+
+
+def test_unknown_format_is_rejected(pages, tmp_path):
+    with pytest.raises(ValueError):
+        build_export("gif", pages, str(tmp_path / "comic.gif"))
+
+
+def _hang_past_watchdog(timeout_path):
+    _exit_after(0.1, timeout_path)
+    time.sleep(10)
+
+
+def test_watchdog_ends_only_its_own_worker_and_leaves_a_marker(tmp_path):
+    timeout_path = str(tmp_path / "timed-out")
+    process = multiprocessing.get_context("spawn").Process(target=_hang_past_watchdog, args=(timeout_path,))
+    process.start()
+    process.join(10)
+    assert process.exitcode == 1
+    assert os.path.exists(timeout_path)
+
+
+def test_finished_build_cancels_its_watchdog(pages, tmp_path):
+    timeout_path = str(tmp_path / "timed-out")
+    build_export("png", pages, str(tmp_path / "strip.png"), timeout=0.2, timeout_path=timeout_path)
+    time.sleep(0.3)
+    assert not os.path.exists(timeout_path)
+
+
+@pytest.mark.parametrize("width", [0, -1, MAX_EXPORT_WIDTH + 1, 200000])
+def test_validate_request_rejects_bad_widths(width):
+    with pytest.raises(ValueError):
+        ExportService.validate_request([PAGE_URL], "png", width=width)
+
+
+def test_validate_request_puts_the_cover_first():
+    pages = [{"imageUrl": "/backend/static/images/aa/bb/2.png", "pageIndex": 1},
+             {"imageUrl": "/backend/static/images/aa/bb/1.png", "pageIndex": 0}]
+    urls = ExportService.validate_request(pages, "pdf", cover=PAGE_URL, width=MAX_EXPORT_WIDTH)
+    assert urls == [PAGE_URL, "/backend/static/images/aa/bb/1.png", "/backend/static/images/aa/bb/2.png"]
+
+
+@pytest.mark.parametrize("pages, export_format", [
+    ([PAGE_URL], "gif"),
+    ([], "pdf"),
+    (["https://example.com/page.png"], "pdf"),
+    (["/backend/static/images/../../secret.png"], "pdf"),
+])
+def test_validate_request_rejects_bad_requests(pages, export_format):
+    with pytest.raises(ValueError):
+        ExportService.validate_request(pages, export_format)
@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services import image_service
+from services.image_service import ImageService
+
+
+@pytest.fixture
+def generated(monkeypatch):
+    """Record each generate_comic_image call; pages titled "slow" wait for release, "fail" raises"""
+    calls = []
+    release = threading.Event()
+
+    def generate_comic_image(page_data, comic_style, reference_img, extra_body, google_api_key, cache):
+        calls.append({"page": page_data["title"], "references": extra_body})
+        if page_data["title"] == "slow":
+            release.wait(5)
+        if page_data["title"] == "fail":
+            raise RuntimeError("quota exceeded")
+        return f"/backend/static/images/{page_data['title']}.png", "prompt"
+
+    monkeypatch.setattr(ImageService, "generate_comic_image", staticmethod(generate_comic_image))
+    monkeypatch.setattr(image_service, "_batch_executor", ThreadPoolExecutor(max_workers=2))
+    yield calls, release
+    release.set()
+    image_service._batch_executor.shutdown(wait=True)
+
+
+def pages(*titles):
+    return [{"title": title} for title in titles]
+
+
+def test_anchor_pages_run_first_and_condition_the_rest(generated):
+    calls, _ = generated
+    results = list(ImageService.generate_comic_images_batch(pages("a", "b", "fail"), google_api_key="key"))
+
+    assert results[0] == {"page_index": 0, "success": True, "image_url": "/backend/static/images/a.png",
+                          "prompt": "prompt"}
+    assert calls[0] == {"page": "a", "references": None}
+    anchor = [{"pageIndex": 0, "imageUrl": "/backend/static/images/a.png"}]
+    assert all(call["references"] == anchor for call in calls[1:])
+    failed = next(result for result in results if result["page_index"] == 2)
+    assert failed == {"page_index": 2, "success": False, "error": "quota exceeded"}
+
+
+def test_previously_generated_pages_are_references(generated):
+    calls, _ = generated
+    previous = [{"pageIndex": 0, "imageUrl": "/backend/static/images/old.png"}]
+    results = list(ImageService.generate_comic_images_batch(
+        pages("b", "c"), google_api_key="key", anchor_count=0, previous_pages=previous
+    ))
+
+    assert sorted(result["page_index"] for result in results) == [0, 1]
+    assert [call["references"] for call in calls] == [previous, previous]
+
+
+def test_closing_the_stream_cancels_pages_not_started(generated):
+    calls, release = generated
+    results = ImageService.generate_comic_images_batch(pages("a", "b", *["slow"] * 6), google_api_key="key")
+    assert next(results)["page_index"] == 0
+    assert next(results)["page_index"] == 1
+
+    results.close()
+    release.set()
+    image_service._batch_executor.shutdown(wait=True)
+
+    # At most one slow page per worker has started; the rest never do
+    assert len(calls) in (3, 4)
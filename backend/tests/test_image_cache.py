@@ -0,0 +1,74 @@
+import os
+
+from utils.image_cache import ImageResultCache, digest_reference, make_cache_key
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 92
+WEBP = b"RIFF\x00\x00\x00\x00WEBP" + b"\x00" * 88
+
+
+def test_key_changes_with_every_input():
+    base = make_cache_key("a robot", "gemini", "3:4", "1K", ["data:abc"])
+    assert make_cache_key("a robot", "gemini", "3:4", "1K", ["data:abc"]) == base
+    for args in [
+        ("a cat", "gemini", "3:4", "1K", ["data:abc"]),
+        ("a robot", "other", "3:4", "1K", ["data:abc"]),
+        ("a robot", "gemini", "1:1", "1K", ["data:abc"]),
+        ("a robot", "gemini", "3:4", "2K", ["data:abc"]),
+        ("a robot", "gemini", "3:4", "1K", []),
+    ]:
+        assert make_cache_key(*args) != base
+
+
+def test_references_are_digested_by_content_file_stat_or_url(tmp_path):
+    (tmp_path / "images").mkdir()
+    (tmp_path / "images" / "page.png").write_bytes(PNG)
+
+    assert digest_reference("data:image/png;base64,QUJD", str(tmp_path)) == \
+        digest_reference("data:image/jpeg;base64,QUJD", str(tmp_path))
+    local = digest_reference("/backend/static/images/page.png", str(tmp_path))
+    assert local.startswith("file:/backend/static/images/page.png:100:")
+    assert digest_reference("/backend/static/images/gone.png", str(tmp_path)).endswith(":missing")
+    assert digest_reference("https://cdn.example/a.png", str(tmp_path)) == "url:https://cdn.example/a.png"
+
+
+def test_put_then_get_keeps_the_format_extension(tmp_path):
+    cache = ImageResultCache(str(tmp_path), max_bytes=1024)
+
+    assert cache.get("k1") is None
+    cache.put("k1", WEBP)
+    path = cache.get("k1")
+
+    assert path == os.path.join(str(tmp_path), "k1.webp")
+    with open(path, "rb") as f:
+        assert f.read() == WEBP
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ImageResultCache(str(tmp_path), max_bytes=250)
+    cache.put("a", PNG)
+    cache.put("b", PNG)
+    cache.get("a")
+    cache.put("c", PNG)
+
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert sorted(os.listdir(tmp_path)) == ["a.png", "c.png"]
+    assert cache.stats()["bytes"] == 200
+
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    ImageResultCache(str(tmp_path), max_bytes=1024).put("k1", PNG)
+    reopened = ImageResultCache(str(tmp_path), max_bytes=1024)
+
+    assert reopened.get("k1") == os.path.join(str(tmp_path), "k1.png")
+    assert reopened.stats()["entries"] == 1
+
+
+def test_deleted_file_is_a_miss(tmp_path):
+    cache = ImageResultCache(str(tmp_path), max_bytes=1024)
+    cache.put("k1", PNG)
+    os.remove(os.path.join(str(tmp_path), "k1.png"))
+
+    assert cache.get("k1") is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,82 @@
+import os
+
+from utils.image_storage import ImageStorage, LocalImageBackend, key_from_url, new_key, sniff_mime, url_for_key
+
+NOW = 1_700_000_000.0
+DAY = 86400
+
+
+def put(backend, key, size, age):
+    """Store ``size`` bytes under ``key`` with an mtime ``age`` seconds before NOW"""
+    backend.put(key, b"x" * size)
+    path = backend.local_path(key)
+    os.utime(path, (NOW - age, NOW - age))
+
+
+def keys(backend):
+    return sorted(obj.key for obj in backend.list())
+
+
+def test_new_key_is_sharded_and_round_trips_through_urls():
+    key = new_key("image/webp")
+    shard_a, shard_b, name = key.split("/")
+    assert len(shard_a) == len(shard_b) == 2
+    assert name.endswith(".webp")
+    assert key_from_url(url_for_key(key)) == key
+    assert key_from_url("/backend/static/images/../secret.png") is None
+
+
+def test_sniff_mime():
+    assert sniff_mime(b"\x89PNG\r\n\x1a\n\0\0\0\0") == "image/png"
+    assert sniff_mime(b"\xff\xd8\xff\xe0") == "image/jpeg"
+    assert sniff_mime(b"RIFF\0\0\0\0WEBP") == "image/webp"
+    assert sniff_mime(b"GIF89a") is None
+
+
+def test_sweep_deletes_images_older_than_max_age(tmp_path):
+    backend = LocalImageBackend(str(tmp_path))
+    put(backend, "aa/bb/old.png", 10, 3 * DAY)
+    put(backend, "aa/cc/new.png", 10, DAY // 2)
+
+    result = ImageStorage(backend, max_age_seconds=DAY).sweep(now=NOW)
+
+    assert keys(backend) == ["aa/cc/new.png"]
+    assert result["deleted"] == 1
+    assert result["freed_bytes"] == 10
+    assert result["objects"] == 1
+
+
+def test_sweep_deletes_oldest_until_under_max_bytes(tmp_path):
+    backend = LocalImageBackend(str(tmp_path))
+    for index, age in enumerate((400, 300, 200, 100)):
+        put(backend, f"aa/bb/{index}.png", 10, age)
+
+    storage = ImageStorage(backend, max_bytes=25)
+    result = storage.sweep(now=NOW)
+
+    assert keys(backend) == ["aa/bb/2.png", "aa/bb/3.png"]
+    assert result["bytes"] == 20
+    assert storage.stats()["deleted"] == 2
+
+
+def test_sweep_skips_reserved_dirs_and_other_files(tmp_path):
+    backend = LocalImageBackend(str(tmp_path))
+    for key in ("cache/result.png", "sketches/layout.png", "variants/aa/bb/x.w400.webp", "aa/bb/notes.txt"):
+        put(backend, key, 10, 10 * DAY)
+    put(backend, "aa/bb/old.jpg", 10, 10 * DAY)
+
+    ImageStorage(backend, max_age_seconds=DAY).sweep(now=NOW)
+
+    for key in ("cache/result.png", "sketches/layout.png", "variants/aa/bb/x.w400.webp", "aa/bb/notes.txt"):
+        assert os.path.exists(os.path.join(tmp_path, *key.split("/")))
+    assert not os.path.exists(os.path.join(tmp_path, "aa", "bb", "old.jpg"))
+
+
+def test_sweep_without_limits_keeps_everything(tmp_path):
+    backend = LocalImageBackend(str(tmp_path))
+    put(backend, "aa/bb/old.png", 10, 100 * DAY)
+
+    storage = ImageStorage(backend)
+    assert not storage.retention_enabled
+    assert storage.sweep(now=NOW)["deleted"] == 0
+    assert keys(backend) == ["aa/bb/old.png"]
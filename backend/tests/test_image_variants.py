@@ -0,0 +1,125 @@
+import io
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+from controllers import image_controller
+from services import image_service
+from services.image_service import ImageService
+from utils.image_storage import ImageStorage, LocalImageBackend, derivative_key, key_from_url
+from utils.image_variants import ImageVariantCache, snap_width
+from utils.image_writer import ImageWriter, OutputPolicy
+
+
+def png_bytes(size=(800, 400)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (30, 90, 160)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def width_of(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return img.width
+
+
+@pytest.fixture
+def images(monkeypatch, tmp_path):
+    """Local storage, a WebP writer with 400px derivatives and an empty variant cache"""
+    storage = ImageStorage(LocalImageBackend(str(tmp_path / "images")))
+    writer = ImageWriter(storage, OutputPolicy(format="WEBP", derivative_widths=(400,)))
+    cache = ImageVariantCache(str(tmp_path / "variants"), max_bytes=64 * 1024 * 1024)
+    monkeypatch.setattr(image_service, "get_image_storage", lambda: storage)
+    monkeypatch.setattr(image_service, "get_image_writer", lambda: writer)
+    monkeypatch.setattr(image_service, "variant_cache", cache)
+    yield storage, writer, cache
+    writer.shutdown()
+
+
+def stored_key(writer):
+    url = writer.write(png_bytes())
+    writer.flush(timeout=5)
+    return key_from_url(url)
+
+
+def test_requested_widths_snap_up_to_the_configured_ones():
+    assert snap_width(1, (200, 400)) == 200
+    assert snap_width(300, (200, 400)) == 400
+    assert snap_width(5000, (200, 400)) == 400
+
+
+def test_variant_is_rendered_once_then_served_from_the_cache(images):
+    storage, writer, cache = images
+    key = stored_key(writer)
+
+    first = ImageService.image_variant(key, 700, "jpeg")
+    second = ImageService.image_variant(key, 800, "jpeg")
+
+    assert first == second
+    assert first["content_type"] == "image/jpeg" and not first["staged"]
+    with open(first["path"], "rb") as f:
+        assert width_of(f.read()) == 800
+    assert (cache.stored, cache.hits) == (1, 1)
+
+
+def test_stored_derivative_is_reused(images):
+    storage, writer, _ = images
+    key = stored_key(writer)
+
+    result = ImageService.image_variant(key, 300, "webp")
+
+    with open(result["path"], "rb") as f:
+        assert f.read() == storage.backend.read(derivative_key(key, 400, "webp"))
+
+
+def test_staged_image_renders_at_once_without_caching(images):
+    storage, _, cache = images
+    storage.stage("aa/bb/page.webp", png_bytes())
+
+    result = ImageService.image_variant("aa/bb/page.webp", 400, "png")
+
+    assert result["staged"]
+    assert width_of(result["data"]) == 400
+    assert cache.stored == 0
+
+
+@pytest.mark.parametrize("key, width, fmt, error", [
+    ("aa/bb/missing.png", None, "webp", FileNotFoundError),
+    ("aa/bb/page.png", None, "gif", ValueError),
+    ("aa/bb/page.png", 0, "webp", ValueError),
+    ("../secret.png", None, "webp", ValueError),
+])
+def test_bad_requests_are_rejected(images, key, width, fmt, error):
+    with pytest.raises(error):
+        ImageService.image_variant(key, width, fmt)
+
+
+@pytest.fixture
+def client(images):
+    app = Flask(__name__)
+    app.register_blueprint(image_controller.image_bp)
+    return app.test_client()
+
+
+def test_variants_are_cacheable_once_stored(images, client):
+    _, writer, _ = images
+    key = stored_key(writer)
+
+    response = client.get(f"/api/images/{key}?w=200&fmt=webp")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "public, max-age=31536000"
+    etag = response.headers["ETag"]
+
+    assert client.get(f"/api/images/{key}?w=200&fmt=webp", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/api/images/{key}?w=wide").status_code == 400
+
+
+def test_staged_variants_are_sent_uncached(images, client):
+    storage, _, _ = images
+    storage.stage("aa/bb/page.webp", png_bytes())
+
+    response = client.get("/api/images/aa/bb/page.webp?w=200")
+    assert response.status_code == 200
+    assert response.mimetype == "image/webp"
+    assert "no-cache" in response.headers["Cache-Control"]
+    assert "ETag" not in response.headers
@@ -0,0 +1,153 @@
+import io
+import os
+import threading
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+from controllers import image_controller
+from utils.image_storage import ImageStorage, LocalImageBackend, key_from_url, url_for_key
+from utils.image_writer import ImageWriter, OutputPolicy
+
+
+class MemoryBackend:
+    """Remote-style backend (not served from local disk) that can hold back uploads"""
+
+    name = "memory"
+    is_local = False
+
+    def __init__(self):
+        self.objects = {}
+        self.release = threading.Event()
+        self.release.set()
+
+    def put(self, key, data):
+        self.release.wait(5)
+        self.objects[key] = data
+
+    def read(self, key):
+        return self.objects[key]
+
+    def exists(self, key):
+        return key in self.objects
+
+    def local_path(self, key):
+        return None
+
+    def delete(self, key):
+        self.objects.pop(key, None)
+
+    def list(self):
+        return iter(())
+
+
+def png_bytes(size=(64, 32), color=(10, 120, 200)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """Two workers sharing a remote backend and a staging directory"""
+    backend = MemoryBackend()
+    staging = str(tmp_path / "staging")
+    return backend, ImageStorage(backend, staging_dir=staging), ImageStorage(backend, staging_dir=staging)
+
+
+def test_staged_image_is_readable_from_another_worker(remote):
+    backend, writer_worker, other_worker = remote
+    url = url_for_key("aa/bb/page.webp")
+    writer_worker.stage(key_from_url(url), b"staged")
+
+    assert other_worker.staged_path(url) is not None
+    assert other_worker.read(url) == b"staged"
+    assert not backend.exists("aa/bb/page.webp")
+
+    writer_worker.commit("aa/bb/page.webp", b"final")
+    assert other_worker.staged_path(url) is None
+    assert other_worker.local_path(url) is None
+    assert other_worker.read(url) == b"final"
+
+
+def test_recovered_images_stay_readable_while_claimed(remote):
+    backend, crashed_worker, recovering_worker = remote
+    url = url_for_key("aa/bb/page.png")
+    crashed_worker.stage("aa/bb/page.png", b"staged")
+
+    assert recovering_worker.recover_staged() == [("aa/bb/page.png", b"staged")]
+    assert crashed_worker.read(url) == b"staged"
+
+    recovering_worker.commit("aa/bb/page.png", b"final")
+    assert os.listdir(recovering_worker.staging_dir) == []
+    assert crashed_worker.read(url) == b"final"
+
+
+def test_writer_commits_the_configured_format_with_derivatives(remote):
+    backend, storage, _ = remote
+    writer = ImageWriter(storage, OutputPolicy(format="WEBP", derivative_widths=(16, 400)))
+    encoded = []
+
+    url = writer.write(png_bytes(), on_encoded=encoded.append)
+    writer.flush(timeout=5)
+    writer.shutdown()
+
+    key = key_from_url(url)
+    assert key.endswith(".webp")
+    assert backend.read(key)[8:12] == b"WEBP"
+    assert encoded == [backend.read(key)]
+    assert sorted(writer.derivative_urls(url)) == [16, 400]
+    assert backend.exists(key.replace(".webp", ".w16.webp"))
+    assert not backend.exists(key.replace(".webp", ".w400.webp"))
+    assert storage.staged_path(url) is None
+
+
+def test_write_returns_before_the_upload_finishes(remote):
+    backend, storage, other_worker = remote
+    backend.release.clear()
+    writer = ImageWriter(storage, OutputPolicy())
+
+    url = writer.write(png_bytes())
+    assert other_worker.read(url).startswith(b"\x89PNG")
+    assert writer.stats()["pending"] == 1
+
+    backend.release.set()
+    writer.flush(timeout=5)
+    writer.shutdown()
+    assert backend.exists(key_from_url(url))
+
+
+def test_local_staged_bytes_count_as_staged_until_reencoded(tmp_path):
+    storage = ImageStorage(LocalImageBackend(str(tmp_path)))
+    url = url_for_key("aa/bb/page.webp")
+    storage.stage("aa/bb/page.webp", png_bytes())
+    assert storage.staged_path(url) == storage.local_path(url)
+
+    storage.commit("aa/bb/page.webp", b"RIFF\0\0\0\0WEBPdata")
+    assert storage.staged_path(url) is None
+
+
+@pytest.fixture
+def client(remote, monkeypatch, tmp_path):
+    backend, storage, _ = remote
+    backend.presigned_url = lambda key: f"https://bucket.example/{key}"
+    monkeypatch.setattr(image_controller, "get_image_storage", lambda: storage)
+    app = Flask(__name__)
+    app.register_blueprint(image_controller.image_bp)
+    return storage, app.test_client()
+
+
+def test_staged_images_are_served_uncached_with_their_real_type(client):
+    storage, http = client
+    storage.stage("aa/bb/page.webp", png_bytes())
+
+    response = http.get("/backend/static/images/aa/bb/page.webp")
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert "no-cache" in response.headers["Cache-Control"]
+
+    storage.commit("aa/bb/page.webp", b"RIFF\0\0\0\0WEBPdata")
+    response = http.get("/backend/static/images/aa/bb/page.webp")
+    assert response.status_code == 302
+    assert response.location == "https://bucket.example/aa/bb/page.webp"
@@ -0,0 +1,182 @@
+import os
+import runpy
+import threading
+
+import pytest
+
+from utils.jobs import (
+    JOB_FAILED, JOB_SUCCEEDED, InMemoryJobStore, JobManager, SQLiteJobStore, create_job_store,
+)
+
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+
+def wait_until_done(manager, job_id):
+    seq = 0
+    for _ in range(100):
+        for event in manager.wait_for_events(job_id, seq, timeout=0.1):
+            seq = event["seq"]
+            if event["type"] in (JOB_SUCCEEDED, JOB_FAILED):
+                return manager.get(job_id)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def export_job(progress_callback, pages):
+    progress_callback("page", {"page": 1, "total": pages})
+    return {"pages": pages}
+
+
+def failing_job(progress_callback):
+    raise ValueError("bad input")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / "jobs.db"))
+
+
+def test_job_records_progress_result_and_events(store):
+    manager = JobManager(store, max_workers=1)
+    job_id = manager.submit("export", export_job, pages=3)
+
+    job = wait_until_done(manager, job_id)
+    manager.shutdown()
+
+    assert job["status"] == JOB_SUCCEEDED
+    assert job["result"] == {"pages": 3}
+    assert job["progress"] == {"event": "page", "page": 1, "total": 3}
+    assert [e["type"] for e in store.events_since(job_id)] == ["queued", "running", "page", "succeeded"]
+
+
+def test_failed_job_keeps_the_error(store):
+    manager = JobManager(store, max_workers=1)
+    job = wait_until_done(manager, manager.submit("export", failing_job))
+    manager.shutdown()
+
+    assert job["status"] == JOB_FAILED
+    assert job["error"] == "bad input"
+
+
+def test_events_resume_after_a_sequence_number(store):
+    store.create("job", "export")
+    for index in range(4):
+        store.append_event("job", "page", {"page": index})
+
+    resumed = store.events_since("job", after_seq=2)
+    assert [e["seq"] for e in resumed] == [3, 4]
+    assert [e["data"]["page"] for e in resumed] == [2, 3]
+
+
+def test_sqlite_job_is_visible_to_another_worker(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    submitting = JobManager(SQLiteJobStore(path), max_workers=1)
+    polling = JobManager(SQLiteJobStore(path), max_workers=1)
+    release = threading.Event()
+
+    def job(progress_callback):
+        release.wait(5)
+        progress_callback("page", {"page": 1})
+        return {"ok": True}
+
+    job_id = submitting.submit("export", job)
+    assert polling.get(job_id)["kind"] == "export"
+    release.set()
+
+    job = wait_until_done(polling, job_id)
+    submitting.shutdown()
+    assert job["result"] == {"ok": True}
+    assert "page" in [e["type"] for e in polling.store.events_since(job_id)]
+
+
+def test_memory_jobs_are_private_to_one_store():
+    submitting = JobManager(InMemoryJobStore(), max_workers=1)
+    job_id = submitting.submit("export", export_job, pages=1)
+    submitting.shutdown()
+    assert InMemoryJobStore().get(job_id) is None
+
+
+def test_finished_jobs_expire(store):
+    store.ttl_seconds = -1
+    store.create("old", "export")
+    store.update("old", status=JOB_SUCCEEDED)
+    store.create("new", "export")
+    assert store.get("old") is None
+    assert store.get("new") is not None
+
+
+def test_create_job_store(monkeypatch, tmp_path):
+    monkeypatch.delenv("COMIC_JOB_STORE", raising=False)
+    assert isinstance(create_job_store(), InMemoryJobStore)
+    monkeypatch.setenv("COMIC_JOB_STORE", "sqlite")
+    monkeypatch.setenv("COMIC_JOB_DB", str(tmp_path / "jobs.db"))
+    assert isinstance(create_job_store(), SQLiteJobStore)
+    monkeypatch.setenv("COMIC_JOB_STORE", "redis")
+    with pytest.raises(ValueError):
+        create_job_store()
+
+
+def test_gunicorn_with_several_workers_uses_the_sqlite_store(monkeypatch):
+    environ = {key: value for key, value in os.environ.items() if key != "COMIC_JOB_STORE"}
+    monkeypatch.setattr(os, "environ", environ)
+
+    environ["COMIC_WORKERS"] = "2"
+    runpy.run_path(GUNICORN_CONF)
+    assert environ["COMIC_JOB_STORE"] == "sqlite"
+
+    environ["COMIC_JOB_STORE"] = "memory"
+    with pytest.raises(RuntimeError):
+        runpy.run_path(GUNICORN_CONF)
+
+    environ["COMIC_WORKERS"] = "1"
+    assert runpy.run_path(GUNICORN_CONF)["workers"] == 1
+
+
+@pytest.fixture
+def job_client(monkeypatch):
+    from flask import Flask
+
+    from controllers import job_controller
+
+    def generate_comic_image(progress_callback, **kwargs):
+        progress_callback("attempt", {"attempt": 1, "max_attempts": 3})
+        return "/backend/static/images/aa/bb/page.png", "prompt"
+
+    manager = JobManager(InMemoryJobStore(), max_workers=1)
+    monkeypatch.setattr(job_controller, "get_job_manager", lambda: manager)
+    monkeypatch.setattr(job_controller.ImageService, "generate_comic_image", staticmethod(generate_comic_image))
+    app = Flask(__name__)
+    app.register_blueprint(job_controller.job_bp)
+    yield manager, app.test_client()
+    manager.shutdown()
+
+
+def sse_events(body):
+    """(id, event) pairs of an SSE stream"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        events.append((int(fields["id"]), fields["event"]))
+    return events
+
+
+def test_sse_stream_resumes_after_last_event_id(job_client):
+    manager, client = job_client
+    response = client.post("/api/jobs/generate-image", json={"page_data": {"title": "t"}, "google_api_key": "k"})
+    assert response.status_code == 202
+    job_id = response.json["job_id"]
+    wait_until_done(manager, job_id)
+
+    events = sse_events(client.get(f"/api/jobs/{job_id}/events").get_data(as_text=True))
+    assert [event for _, event in events] == ["queued", "running", "attempt", "succeeded"]
+
+    resumed = client.get(f"/api/jobs/{job_id}/events", headers={"Last-Event-ID": str(events[1][0])})
+    assert sse_events(resumed.get_data(as_text=True)) == events[2:]
+    assert client.get(f"/api/jobs/{job_id}").json["result"]["image_url"] == "/backend/static/images/aa/bb/page.png"
+
+
+def test_unknown_job_is_not_found(job_client):
+    _, client = job_client
+    assert client.get("/api/jobs/missing").status_code == 404
+    assert client.get("/api/jobs/missing/events").status_code == 404
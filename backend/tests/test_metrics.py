@@ -0,0 +1,94 @@
+import json
+import os
+import runpy
+
+from utils.metrics import MetricsRegistry, SharedMetricsDir
+
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+
+def worker_registry(requests, latencies):
+    registry = MetricsRegistry()
+    counter = registry.counter("comic_requests_total", "Requests", ["endpoint"])
+    histogram = registry.histogram("comic_seconds", "Latency", ["phase"], buckets=(0.1, 1.0))
+    counter.inc(requests, endpoint="/api/generate")
+    for latency in latencies:
+        histogram.observe(latency, phase="gemini")
+    return registry
+
+
+def stats(hits):
+    return lambda: [("comic_cache_hits_total", "counter", "Cache hits", [({"cache": "proxy"}, hits)])]
+
+
+def test_render_formats_counters_and_cumulative_histograms():
+    text = worker_registry(2, [0.05, 0.5, 5.0]).render()
+    assert 'comic_requests_total{endpoint="/api/generate"} 2' in text
+    assert 'comic_seconds_bucket{phase="gemini",le="0.1"} 1' in text
+    assert 'comic_seconds_bucket{phase="gemini",le="1"} 2' in text
+    assert 'comic_seconds_bucket{phase="gemini",le="+Inf"} 3' in text
+    assert 'comic_seconds_count{phase="gemini"} 3' in text
+
+
+def test_scrape_merges_every_worker(tmp_path):
+    first, second = SharedMetricsDir(str(tmp_path)), SharedMetricsDir(str(tmp_path))
+    first.write(worker_registry(2, [0.05]), stats(1)())
+
+    text = second.render(worker_registry(3, [0.5, 5.0]), stats(4))
+
+    assert 'comic_requests_total{endpoint="/api/generate"} 5' in text
+    assert 'comic_seconds_bucket{phase="gemini",le="0.1"} 1' in text
+    assert 'comic_seconds_count{phase="gemini"} 3' in text
+    # Scrape-time stats stay per worker
+    assert text.count("# TYPE comic_cache_hits_total counter") == 1
+    hits = [line for line in text.splitlines() if line.startswith("comic_cache_hits_total{")]
+    assert len(hits) == 2
+    assert all('worker="' in line for line in hits)
+
+
+def test_exited_workers_keep_their_totals_but_not_their_stats(tmp_path):
+    exited = SharedMetricsDir(str(tmp_path))
+    exited.write(worker_registry(2, []), stats(7)())
+    path = os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0])
+    with open(path, "r", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    snapshot["written_at"] -= 3600
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+
+    text = SharedMetricsDir(str(tmp_path)).render(worker_registry(1, []), stats(0))
+
+    assert 'comic_requests_total{endpoint="/api/generate"} 3' in text
+    assert "} 7" not in text
+
+
+def test_scrape_republishes_the_same_file(tmp_path):
+    shared = SharedMetricsDir(str(tmp_path))
+    registry = worker_registry(1, [])
+    shared.render(registry, stats(0))
+    registry.counter("comic_requests_total", "Requests", ["endpoint"]).inc(endpoint="/api/generate")
+    text = shared.render(registry, stats(0))
+
+    assert len(os.listdir(str(tmp_path))) == 1
+    assert 'comic_requests_total{endpoint="/api/generate"} 2' in text
+
+
+def test_clear_removes_old_snapshots(tmp_path):
+    shared = SharedMetricsDir(str(tmp_path))
+    shared.write(worker_registry(1, []))
+    shared.clear()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_gunicorn_with_several_workers_shares_metrics(monkeypatch):
+    environ = {key: value for key, value in os.environ.items()
+               if key not in ("COMIC_METRICS_DIR", "COMIC_JOB_STORE")}
+    monkeypatch.setattr(os, "environ", environ)
+
+    environ["COMIC_WORKERS"] = "1"
+    runpy.run_path(GUNICORN_CONF)
+    assert "COMIC_METRICS_DIR" not in environ
+
+    environ["COMIC_WORKERS"] = "3"
+    runpy.run_path(GUNICORN_CONF)
+    assert environ["COMIC_METRICS_DIR"].endswith(os.path.join("data", "metrics"))
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from utils.prompt_registry import PromptRegistry, PromptTemplate, prompt_registry
+
+
+def test_template_renders_fields_in_place():
+    template = PromptTemplate("greeting", "Hello {name}, {{literal}} page {page}")
+    assert template.fields == {"name", "page"}
+    assert template.render(name="Nobita", page=3) == "Hello Nobita, {literal} page 3"
+
+
+@pytest.mark.parametrize("text", ["{0}", "{name!r}", "{page:02d}", "{user.name}"])
+def test_template_rejects_anything_but_plain_fields(text):
+    with pytest.raises(ValueError):
+        PromptTemplate("bad", text)
+
+
+def test_template_reports_missing_values():
+    with pytest.raises(KeyError, match="page"):
+        PromptTemplate("greeting", "{name} {page}").render(name="Nobita")
+
+
+def test_every_shipped_prompt_renders():
+    assert prompt_registry.warm(max_page_count=2) > 0
+    for style in prompt_registry.styles:
+        for language in prompt_registry.languages:
+            prompt = prompt_registry.page_script_prompt(style, language, 2, 3, "summary", "plan", "Title")
+            assert "plan" in prompt and "Title" in prompt
+    assert prompt_registry.page_image_prompt("doraemon", "Title", "panels")
+
+
+def test_memoized_prompts_are_rendered_once():
+    first = prompt_registry.script_prompt("ghibli", "en", 4)
+    assert prompt_registry.script_prompt("ghibli", "en", 4) is first
+    assert "4" in first
+
+
+@pytest.fixture
+def registry(tmp_path):
+    (tmp_path / "templates").mkdir()
+    (tmp_path / "templates" / "cover_image.txt").write_text("{comic_style} cover, {language_requirement}")
+    (tmp_path / "templates" / "notes.md").write_text("not a template {")
+    (tmp_path / "registry.json").write_text(json.dumps({
+        "defaults": {"style": "ink", "script_language": "en", "cover_language": "en"},
+        "styles": {"ink": {"description": "black ink"}},
+        "languages": {"en": {"script": "Write in English", "cover": "English title"}},
+    }))
+    return PromptRegistry(str(tmp_path))
+
+
+def test_styles_and_templates_are_data(registry):
+    assert list(registry.templates) == ["cover_image"]
+    assert registry.cover_prompt("ink", "en") == "ink cover, English title"
+
+
+def test_unknown_style_and_language_fall_back_to_defaults(registry):
+    assert registry.style_description("unknown") == "black ink"
+    assert registry.language_instruction("fr") == "Write in English"
+    assert registry.cover_language_requirement("fr") == "English title"
@@ -0,0 +1,106 @@
+import email.utils
+import os
+
+import pytest
+
+from utils.proxy_cache import ProxyCache, freshness_lifetime, parse_cache_control
+
+NOW = 1_700_000_000.0
+
+
+def http_date(timestamp):
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def test_parse_cache_control():
+    assert parse_cache_control('public, max-age="60", No-Cache') == {
+        "public": None, "max-age": "60", "no-cache": None,
+    }
+    assert parse_cache_control(None) == {}
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"Cache-Control": "no-store"}, None),
+    ({"Cache-Control": "private, max-age=60"}, None),
+    ({"Cache-Control": "no-cache"}, 0.0),
+    ({"Cache-Control": "max-age=60"}, 60.0),
+    ({"Cache-Control": "max-age=60, s-maxage=120"}, 120.0),
+    ({"Cache-Control": "max-age=soon"}, 0.0),
+    ({}, 0.0),
+])
+def test_freshness_lifetime_cache_control(headers, expected):
+    assert freshness_lifetime(headers, NOW) == expected
+
+
+def test_freshness_lifetime_expires_is_relative_to_date():
+    headers = {"Date": http_date(NOW - 100), "Expires": http_date(NOW + 200)}
+    assert freshness_lifetime(headers, NOW) == 300.0
+    assert freshness_lifetime({"Expires": http_date(NOW - 10)}, NOW) == 0.0
+
+
+def test_freshness_lifetime_heuristic_from_last_modified():
+    assert freshness_lifetime({"Last-Modified": http_date(NOW - 1000)}, NOW) == 100.0
+    assert freshness_lifetime({"Last-Modified": http_date(NOW - 10 ** 8)}, NOW) == 86400
+
+
+def store(cache, url, body, headers=None, lifetime=60.0):
+    return b"".join(cache.tee(url, iter([body[:3], body[3:]]), headers or {}, lifetime, NOW))
+
+
+def test_tee_stores_complete_body_and_metadata(tmp_path):
+    cache = ProxyCache(str(tmp_path), max_bytes=1000, max_object_bytes=100)
+    headers = {"ETag": '"v1"', "Content-Type": "image/webp"}
+
+    assert store(cache, "http://x/a.webp", b"abcdef", headers) == b"abcdef"
+
+    meta = cache.lookup("http://x/a.webp")
+    assert meta["etag"] == '"v1"'
+    assert meta["content_type"] == "image/webp"
+    assert meta["expires_at"] == NOW + 60.0
+    with open(meta["path"], "rb") as f:
+        assert f.read() == b"abcdef"
+    assert cache.lookup("http://x/other.png") is None
+
+
+def test_tee_skips_oversized_and_aborted_bodies(tmp_path):
+    cache = ProxyCache(str(tmp_path), max_bytes=1000, max_object_bytes=4)
+    assert store(cache, "http://x/big.png", b"abcdef") == b"abcdef"
+    assert cache.lookup("http://x/big.png") is None
+
+    stream = cache.tee("http://x/cut.png", iter([b"ab", b"cd"]), {}, 60.0, NOW)
+    next(stream)
+    stream.close()
+    assert cache.lookup("http://x/cut.png") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_commit_evicts_least_recently_used(tmp_path):
+    cache = ProxyCache(str(tmp_path), max_bytes=10, max_object_bytes=10)
+    store(cache, "http://x/1.png", b"111111")
+    store(cache, "http://x/2.png", b"222222")
+
+    assert cache.lookup("http://x/1.png") is None
+    assert cache.lookup("http://x/2.png") is not None
+    assert cache.stats()["bytes"] == 6
+
+
+def test_refresh_extends_lifetime_and_updates_etag(tmp_path):
+    cache = ProxyCache(str(tmp_path), max_bytes=1000, max_object_bytes=100)
+    store(cache, "http://x/a.png", b"abcdef", {"ETag": '"v1"'}, lifetime=0.0)
+    meta = cache.lookup("http://x/a.png")
+
+    cache.refresh(meta, {"Cache-Control": "max-age=30", "ETag": '"v2"'}, NOW + 5)
+    cache.touch(meta, "revalidated")
+
+    meta = cache.lookup("http://x/a.png")
+    assert meta["expires_at"] == NOW + 35
+    assert meta["etag"] == '"v2"'
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    store(ProxyCache(str(tmp_path), 1000, 100), "http://x/a.png", b"abcdef")
+
+    cache = ProxyCache(str(tmp_path), 1000, 100)
+    assert cache.lookup("http://x/a.png") is not None
+    assert cache.stats()["entries"] == 1
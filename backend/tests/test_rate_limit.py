@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils import rate_limit
+from utils.client_pool import hash_api_key
+from utils.rate_limit import Governor, QueueTimeoutError
+
+
+def test_burst_is_spent_before_calls_wait_for_the_rate():
+    governor = Governor("test", requests_per_minute=600, burst=2)
+    waits = []
+    for _ in range(3):
+        with governor.limit("key") as waited:
+            waits.append(waited)
+
+    assert waits[0] < 0.05 and waits[1] < 0.05
+    # 600 rpm refills one token every 0.1s
+    assert 0.05 < waits[2] < 0.5
+
+
+def test_keys_are_limited_independently():
+    governor = Governor("test", requests_per_minute=1, burst=1, queue_timeout=0.1)
+    with governor.limit("first"):
+        pass
+    with governor.limit("second") as waited:
+        assert waited < 0.05
+    with pytest.raises(QueueTimeoutError):
+        with governor.limit("first"):
+            pass
+    assert governor.stats()["keys"][hash_api_key("first")]["timeouts"] == 1
+
+
+def test_in_flight_cap_admits_callers_in_arrival_order():
+    governor = Governor("test", requests_per_minute=0, max_in_flight=1)
+    order = []
+    started = threading.Event()
+
+    def hold():
+        with governor.limit("key"):
+            started.set()
+            time.sleep(0.1)
+            order.append("first")
+
+    def follow(name):
+        with governor.limit("key"):
+            order.append(name)
+
+    threads = [threading.Thread(target=hold)]
+    threads[0].start()
+    started.wait(1)
+    for name in ("second", "third"):
+        threads.append(threading.Thread(target=follow, args=(name,)))
+        threads[-1].start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join(2)
+
+    assert order == ["first", "second", "third"]
+
+
+def test_async_callers_share_the_cap_with_threads():
+    governor = Governor("test", requests_per_minute=0, max_in_flight=1)
+    results = []
+
+    async def call():
+        return await governor.awrap("key", lambda: asyncio.sleep(0, result="done"))()
+
+    with governor.limit("key"):
+        caller = threading.Thread(target=lambda: results.append(asyncio.run(call())))
+        caller.start()
+        time.sleep(0.1)
+        assert results == []
+    caller.join(2)
+    assert results == ["done"]
+
+
+def test_disabled_governor_does_not_track_keys():
+    governor = Governor("test", requests_per_minute=0, max_in_flight=0)
+    assert governor.wrap("key", lambda: 42)() == 42
+    assert governor.stats()["keys"] == {}
+
+
+def test_pruning_spares_limiters_that_are_in_use(monkeypatch):
+    monkeypatch.setattr(rate_limit, "MAX_TRACKED_KEYS", 2)
+    governor = Governor("test", requests_per_minute=60, burst=1)
+
+    with governor._lease(hash_api_key("busy")) as busy:
+        # Idle (no waiters, full bucket) but looked up by a caller that has not queued yet
+        with governor.limit("other"):
+            pass
+        with governor.limit("third"):
+            pass
+        assert governor._limiters[hash_api_key("busy")] is busy
+
+    with governor.limit("fourth"):
+        pass
+    assert hash_api_key("busy") not in governor._limiters
+
+
+def test_from_env_splits_limits_across_workers(monkeypatch):
+    monkeypatch.setenv("COMIC_WORKERS", "4")
+    monkeypatch.setenv("COMIC_TEST_RPM", "20")
+    monkeypatch.setenv("COMIC_TEST_BURST", "2")
+    monkeypatch.setenv("COMIC_TEST_MAX_IN_FLIGHT", "6")
+    governor = Governor.from_env("test", "COMIC_TEST", rpm=60, max_in_flight=8)
+
+    assert governor.rate_per_second * 60 == pytest.approx(5)
+    assert governor.burst == 1.0
+    assert governor.max_in_flight == 2
+
+    monkeypatch.setenv("COMIC_WORKERS", "1")
+    assert Governor.from_env("test", "COMIC_TEST", rpm=60, max_in_flight=8).max_in_flight == 6
@@ -0,0 +1,140 @@
+import base64
+import io
+import os
+
+import pytest
+import requests
+from PIL import Image
+
+from utils.reference_cache import ReferenceImageCache, ReferencePolicy, encode_image
+
+SMALL_JPEG = ReferencePolicy(max_edge=100, format="JPEG", quality=80)
+
+
+def png_bytes(size=(400, 200), color=(200, 40, 40, 128)):
+    buffer = io.BytesIO()
+    Image.new("RGBA", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def decoded(data):
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+
+def test_encode_shrinks_the_long_edge_and_flattens_alpha_for_jpeg():
+    data, mime_type = encode_image(decoded(png_bytes()), SMALL_JPEG)
+    img = decoded(data)
+
+    assert mime_type == "image/jpeg"
+    assert (img.format, img.mode, img.size) == ("JPEG", "RGB", (100, 50))
+
+
+def test_small_images_keep_their_size():
+    data, mime_type = encode_image(decoded(png_bytes((60, 30))), ReferencePolicy(max_edge=100, format="PNG"))
+    assert mime_type == "image/png"
+    assert decoded(data).size == (60, 30)
+
+
+def test_from_env_reads_the_policy(monkeypatch):
+    monkeypatch.setenv("COMIC_TEST_MAX_EDGE", "0")
+    monkeypatch.setenv("COMIC_TEST_FORMAT", "webp")
+    assert ReferencePolicy.from_env("COMIC_TEST", 1024, "JPEG", 85) == ReferencePolicy(None, "WEBP", 85)
+
+    monkeypatch.setenv("COMIC_TEST_FORMAT", "gif")
+    with pytest.raises(ValueError):
+        ReferencePolicy.from_env("COMIC_TEST", 1024, "JPEG", 85)
+
+
+def test_file_is_encoded_once_per_policy_until_it_changes(tmp_path):
+    path = tmp_path / "sketch.png"
+    path.write_bytes(png_bytes())
+    cache = ReferenceImageCache(max_bytes=1024 * 1024)
+
+    first = cache.load_file_encoded(str(path), SMALL_JPEG)
+    assert cache.load_file_encoded(str(path), SMALL_JPEG) == first
+    cache.load_file_encoded(str(path), ReferencePolicy(max_edge=50, format="PNG"))
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    path.write_bytes(png_bytes((300, 300)))
+    os.utime(path, ns=(0, 0))
+    assert decoded(cache.load_file_encoded(str(path), SMALL_JPEG)[0]).size == (100, 100)
+    assert cache.misses == 3
+
+
+def test_data_uris_are_keyed_by_payload():
+    cache = ReferenceImageCache(max_bytes=1024 * 1024)
+    payload = base64.b64encode(png_bytes()).decode("ascii")
+
+    cache.load_data_uri_encoded(f"data:image/png;base64,{payload}", SMALL_JPEG)
+    cache.load_data_uri_encoded(f"data:image/x-png;base64,{payload}", SMALL_JPEG)
+
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_objects_are_fetched_only_on_a_miss():
+    cache = ReferenceImageCache(max_bytes=1024 * 1024)
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return png_bytes()
+
+    for _ in range(3):
+        cache.load_object_encoded("aa/bb/page.png", fetch, SMALL_JPEG)
+    assert len(fetches) == 1
+
+
+def test_least_recently_used_entries_are_evicted_by_size():
+    policy = ReferencePolicy(format="PNG")
+    size = len(encode_image(decoded(png_bytes()), policy)[0])
+    cache = ReferenceImageCache(max_bytes=size * 2)
+
+    for name in ("a", "b", "a", "c"):
+        cache.load_object_encoded(name, png_bytes, policy)
+
+    assert cache.stats()["entries"] == 2 and cache.stats()["bytes"] <= size * 2
+    cache.load_object_encoded("a", png_bytes, policy)
+    assert cache.hits == 2
+    cache.load_object_encoded("b", png_bytes, policy)
+    assert cache.misses == 4
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", etag=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {"ETag": etag} if etag else {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+
+def test_urls_are_revalidated_with_their_etag(monkeypatch):
+    cache = ReferenceImageCache(max_bytes=1024 * 1024)
+    sent = []
+
+    def get(url, timeout=None, headers=None):
+        sent.append(headers or {})
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, png_bytes(), etag='"v1"')
+
+    monkeypatch.setattr(requests, "get", get)
+    first = cache.load_url_encoded("https://cdn.example/style.png", SMALL_JPEG)
+
+    assert cache.load_url_encoded("https://cdn.example/style.png", SMALL_JPEG) == first
+    assert cache.hits == 1
+    assert sent == [{}, {"If-None-Match": '"v1"'}]
+
+
+def test_urls_without_etag_are_not_cached(monkeypatch):
+    cache = ReferenceImageCache(max_bytes=1024 * 1024)
+    monkeypatch.setattr(requests, "get", lambda url, timeout=None, headers=None: FakeResponse(200, png_bytes()))
+
+    cache.load_url_encoded("https://cdn.example/style.png", SMALL_JPEG)
+    cache.load_url_encoded("https://cdn.example/style.png", SMALL_JPEG)
+
+    assert cache.stats()["entries"] == 0 and cache.misses == 2
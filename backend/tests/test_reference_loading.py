@@ -0,0 +1,54 @@
+import threading
+import time
+
+import comic_generator
+from comic_generator import _normalize_references, prepare_reference_images
+from utils.reference_cache import ROLE_SKETCH, ROLE_STYLE
+
+
+def test_references_are_normalized_to_image_and_role_pairs():
+    assert _normalize_references(None) == []
+    assert _normalize_references("data:image/png;base64,AA") == [("data:image/png;base64,AA", ROLE_STYLE)]
+    assert _normalize_references([
+        {"imageUrl": "sketch:abc", "role": ROLE_SKETCH},
+        {"imageUrl": "/backend/static/images/p1.png"},
+        "https://cdn.example/style.png",
+        {"title": "no image"},
+        42,
+    ]) == [
+        ("sketch:abc", ROLE_SKETCH),
+        ("/backend/static/images/p1.png", ROLE_STYLE),
+        ("https://cdn.example/style.png", ROLE_STYLE),
+    ]
+
+
+def test_references_load_concurrently_and_keep_their_order(monkeypatch):
+    barrier = threading.Barrier(3, timeout=2)
+
+    def load(url, role, timeout):
+        # Every load waits for the others, so this only passes if they run at once
+        barrier.wait()
+        return f"part:{url}:{role}"
+
+    monkeypatch.setattr(comic_generator, "load_reference_part", load)
+    references = [("a", ROLE_SKETCH), ("b", ROLE_STYLE), ("c", ROLE_STYLE)]
+
+    assert prepare_reference_images(references, deadline=5) == ["part:a:sketch", "part:b:style", "part:c:style"]
+
+
+def test_failed_unknown_and_late_references_are_skipped(monkeypatch):
+    def load(url, role, timeout):
+        if url == "broken":
+            raise ValueError("Unknown sketch handle")
+        if url == "slow":
+            time.sleep(0.5)
+        if url == "unknown":
+            return None
+        return f"part:{url}"
+
+    monkeypatch.setattr(comic_generator, "load_reference_part", load)
+    references = [(url, ROLE_STYLE) for url in ("first", "broken", "slow", "unknown", "last")]
+
+    started = time.monotonic()
+    assert prepare_reference_images(references, deadline=0.1) == ["part:first", "part:last"]
+    assert time.monotonic() - started < 0.4
@@ -0,0 +1,50 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+pytest.importorskip("google.genai")
+
+import comic_generator  # noqa: E402
+from comic_generator import load_reference_part  # noqa: E402
+from utils.reference_cache import ROLE_SKETCH, ROLE_STYLE, ReferenceImageCache  # noqa: E402
+
+
+def data_uri(size=(1600, 1200)):
+    buffer = io.BytesIO()
+    Image.new("RGBA", size, (20, 120, 200, 255)).save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    cache = ReferenceImageCache(max_bytes=64 * 1024 * 1024)
+    monkeypatch.setattr(comic_generator, "reference_cache", cache)
+    return cache
+
+
+def uploaded(part):
+    img = Image.open(io.BytesIO(part.inline_data.data))
+    return part.inline_data.mime_type, img.format, img.size
+
+
+@pytest.mark.parametrize("role, expected", [
+    (ROLE_STYLE, ("image/jpeg", "JPEG", (1024, 768))),
+    (ROLE_SKETCH, ("image/png", "PNG", (1024, 768))),
+])
+def test_references_are_shrunk_and_encoded_per_role(role, expected):
+    assert uploaded(load_reference_part(data_uri(), role)) == expected
+
+
+def test_each_role_is_encoded_once(fresh_cache):
+    uri = data_uri()
+    for role in (ROLE_STYLE, ROLE_SKETCH, ROLE_STYLE, ROLE_SKETCH):
+        load_reference_part(uri, role)
+    assert (fresh_cache.hits, fresh_cache.misses) == (2, 2)
+
+
+def test_unknown_sketch_handle_and_format():
+    with pytest.raises(ValueError):
+        load_reference_part("sketch:" + "0" * 64, ROLE_SKETCH)
+    assert load_reference_part("ftp://example/a.png") is None
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.response_cache import (
+    MemoryResponseBackend, ResponseCache, SQLiteResponseBackend, create_response_cache, make_response_key,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryResponseBackend(max_entries=2)
+    return SQLiteResponseBackend(str(tmp_path / "responses.db"))
+
+
+def counter(value):
+    """A compute function returning ``value`` that counts its calls"""
+    def compute():
+        compute.calls += 1
+        return value
+    compute.calls = 0
+    return compute
+
+
+def test_make_response_key_normalizes_text_and_order():
+    key = make_response_key("script", prompt="A  cat\n story", page_count=3, api_key="k1")
+    assert key == make_response_key("script", page_count=3, api_key="k1", prompt="A cat story")
+    assert key == make_response_key("script", prompt="Ａ cat story", page_count=3, api_key="k1")
+    assert key != make_response_key("script", prompt="A cat story", page_count=4, api_key="k1")
+    assert key != make_response_key("script", prompt="A cat story", page_count=3, api_key="k2")
+    assert key != make_response_key("social", prompt="A cat story", page_count=3, api_key="k1")
+
+
+def test_get_or_compute_caches_responses(backend):
+    cache = ResponseCache(backend)
+    compute = counter({"pages": [1, 2]})
+
+    assert cache.get_or_compute("k", compute) == {"pages": [1, 2]}
+    assert cache.get_or_compute("k", compute) == {"pages": [1, 2]}
+    assert compute.calls == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_bypass_recomputes_and_refreshes_the_entry(backend):
+    cache = ResponseCache(backend)
+    cache.get_or_compute("k", counter("old"))
+
+    assert cache.get_or_compute("k", counter("new"), bypass=True) == "new"
+    assert cache.get_or_compute("k", counter("unused")) == "new"
+    assert cache.stats()["bypasses"] == 1
+
+
+def test_expired_entries_are_recomputed(backend):
+    cache = ResponseCache(backend, ttl_seconds=-1)
+    compute = counter("value")
+    cache.get_or_compute("k", compute)
+    cache.get_or_compute("k", compute)
+    assert compute.calls == 2
+
+
+def test_cached_values_are_copies():
+    cache = ResponseCache(MemoryResponseBackend())
+    cache.get_or_compute("k", counter({"pages": []}))["pages"].append("mutated")
+    assert cache.get_or_compute("k", counter(None)) == {"pages": []}
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryResponseBackend(max_entries=2)
+    for key in ("a", "b"):
+        backend.set(key, key, 60)
+    backend.get("a")
+    backend.set("c", "c", 60)
+    assert backend.get("b") is None
+    assert backend.get("a") == "a"
+
+
+def test_failed_compute_is_not_cached(backend):
+    cache = ResponseCache(backend)
+
+    def fail():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", fail)
+    assert cache.get_or_compute("k", counter("ok")) == "ok"
+
+
+def test_broken_backend_falls_back_to_compute():
+    class BrokenBackend:
+        def get(self, key):
+            raise OSError("disk gone")
+
+        def set(self, key, value, ttl_seconds):
+            raise OSError("disk gone")
+
+        def size(self):
+            raise OSError("disk gone")
+
+    cache = ResponseCache(BrokenBackend())
+    assert cache.get_or_compute("k", counter("ok")) == "ok"
+    assert cache.stats()["errors"] == 2
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = ResponseCache(MemoryResponseBackend())
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["coalesced"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["value"] * 4
+    assert len(calls) == 1
+
+
+def test_aget_or_compute_coalesces_coroutines(backend):
+    cache = ResponseCache(backend)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*(cache.aget_or_compute("k", compute) for _ in range(3)))
+
+    assert asyncio.run(run()) == ["value"] * 3
+    assert len(calls) == 1
+
+
+def test_cache_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("COMIC_RESPONSE_CACHE", raising=False)
+    assert create_response_cache() is None
+
+    monkeypatch.setenv("COMIC_RESPONSE_CACHE", "memory")
+    assert isinstance(create_response_cache().backend, MemoryResponseBackend)
+
+    monkeypatch.setenv("COMIC_RESPONSE_CACHE", "redis")
+    with pytest.raises(ValueError):
+        create_response_cache()
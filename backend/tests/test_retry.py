@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+
+from utils import retry
+from utils.retry import (
+    ContentBlockedError, NoImageError, RetryableError, RetryBudget, RetryPolicy, TerminalError, acall_with_retry,
+    attempt_timeout, call_with_retry, cancel_retry_waits, is_retryable,
+)
+
+NO_WAIT = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class APIConnectionError(Exception):
+    """Stands in for openai.APIConnectionError, matched by name"""
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def fresh_budget(monkeypatch):
+    monkeypatch.setattr(retry, "retry_budget", RetryBudget())
+
+
+def flaky(*outcomes):
+    """A callable raising or returning ``outcomes`` in turn, recording its calls"""
+    calls = []
+
+    def fn():
+        calls.append(len(calls) + 1)
+        outcome = outcomes[len(calls) - 1]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    fn.calls = calls
+    return fn
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (TerminalError("no"), False),
+    (ContentBlockedError("SAFETY"), False),
+    (StatusError(400), False),
+    (StatusError(404), False),
+    (StatusError(408), True),
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (ConnectionError("reset"), True),
+    (TimeoutError("read timed out"), True),
+    (APIConnectionError("connection refused"), True),
+    (NoImageError("No image generated in response"), True),
+    (RetryableError("short outline"), True),
+    (ValueError("odd response"), False),
+    (KeyError("candidates"), False),
+])
+def test_is_retryable(exc, expected):
+    assert is_retryable(exc) is expected
+
+
+def test_is_retryable_reads_status_from_response():
+    exc = Exception("bad request")
+    exc.response = Response(401)
+    assert is_retryable(exc) is False
+
+
+def test_content_blocked_error_keeps_reason_and_is_a_value_error():
+    exc = ContentBlockedError("IMAGE_SAFETY")
+    assert exc.reason == "IMAGE_SAFETY"
+    assert isinstance(exc, ValueError)
+
+
+def test_budget_spends_tokens_and_refills_from_requests():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    budget.record_request()
+    budget.record_request()
+    assert budget.try_spend()
+
+
+def test_call_with_retry_retries_until_success():
+    fn = flaky(ConnectionError("reset"), StatusError(503), "ok")
+    retries = []
+
+    result = call_with_retry(fn, NO_WAIT, name="test", on_retry=lambda attempt, e, delay: retries.append(attempt))
+
+    assert result == "ok"
+    assert fn.calls == [1, 2, 3]
+    assert retries == [1, 2]
+
+
+def test_call_with_retry_stops_on_terminal_error():
+    fn = flaky(StatusError(400), "ok")
+    with pytest.raises(StatusError):
+        call_with_retry(fn, NO_WAIT, name="test")
+    assert fn.calls == [1]
+
+
+def test_call_with_retry_raises_last_error_after_max_attempts():
+    fn = flaky(ConnectionError("1"), ConnectionError("2"), ConnectionError("3"), "ok")
+    with pytest.raises(ConnectionError, match="3"):
+        call_with_retry(fn, NO_WAIT, name="test")
+    assert fn.calls == [1, 2, 3]
+
+
+def test_call_with_retry_respects_the_budget(monkeypatch):
+    monkeypatch.setattr(retry, "retry_budget", RetryBudget(ratio=0, min_per_second=0, max_tokens=0))
+    fn = flaky(ConnectionError("reset"), "ok")
+    with pytest.raises(ConnectionError):
+        call_with_retry(fn, NO_WAIT, name="test")
+    assert fn.calls == [1]
+
+
+def test_call_with_retry_respects_the_deadline():
+    policy = RetryPolicy(max_attempts=5, base_delay=1, max_delay=1, deadline=0.5)
+    fn = flaky(ConnectionError("reset"), "ok")
+    with pytest.raises(ConnectionError):
+        call_with_retry(fn, policy, name="test")
+    assert fn.calls == [1]
+
+
+def test_acall_with_retry_retries_until_success():
+    fn = flaky(StatusError(429), "ok")
+
+    async def attempt():
+        return fn()
+
+    assert asyncio.run(acall_with_retry(attempt, NO_WAIT, name="test")) == "ok"
+    assert fn.calls == [1, 2]
+
+
+def test_call_with_retry_fails_fast_on_unexpected_errors():
+    fn = flaky(AttributeError("'NoneType' object has no attribute 'parts'"), "ok")
+    with pytest.raises(AttributeError):
+        call_with_retry(fn, NO_WAIT, name="test")
+    assert fn.calls == [1]
+
+
+def test_attempt_timeout_is_cut_to_the_remaining_deadline():
+    assert attempt_timeout(120) == 120
+    policy = RetryPolicy(max_attempts=1, deadline=30)
+    assert 29 < call_with_retry(lambda: attempt_timeout(120), policy, name="test") <= 30
+    assert call_with_retry(lambda: attempt_timeout(10), policy, name="test") == 10
+    assert asyncio.run(acall_with_retry(lambda: asyncio.sleep(0, attempt_timeout(120)), policy, name="test")) <= 30
+    assert attempt_timeout(120) == 120
+
+
+def test_cancelled_waits_raise_the_last_error(monkeypatch):
+    monkeypatch.setattr(retry, "_stop_waiting", retry.threading.Event())
+    policy = RetryPolicy(max_attempts=3, base_delay=30, max_delay=30)
+    fn = flaky(ConnectionError("reset"), "ok")
+    retry.threading.Timer(0.05, cancel_retry_waits).start()
+    with pytest.raises(ConnectionError):
+        call_with_retry(fn, policy, name="test")
+    assert fn.calls == [1]
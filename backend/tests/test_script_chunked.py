@@ -0,0 +1,117 @@
+import asyncio
+import threading
+
+import pytest
+
+from services import comic_service
+from services.comic_service import ComicOutline, ComicPage, ComicService, PageOutline, _fit_outline
+from utils.rate_limit import Governor
+from utils.retry import RetryableError
+
+
+def outline(page_count):
+    return ComicOutline(
+        summary="A robot learns to paint",
+        pages=[PageOutline(title=f"Page {i + 1}", beats=["beat"]) for i in range(page_count)]
+    )
+
+
+def test_fit_outline_drops_extra_pages():
+    fitted = _fit_outline(outline(5), 3)
+    assert [page.title for page in fitted.pages] == ["Page 1", "Page 2", "Page 3"]
+    assert _fit_outline(outline(3), 3).pages == outline(3).pages
+
+
+def test_fit_outline_retries_a_short_outline():
+    with pytest.raises(RetryableError):
+        _fit_outline(outline(2), 3)
+
+
+class ScriptModels:
+    """Stands in for the structured outline and page models; page messages carry the page index"""
+
+    def __init__(self, outlines, fail_page=None):
+        self.outlines = list(outlines)
+        self.fail_page = fail_page
+        self.outline_calls = 0
+        self.page_calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, api_key, base_url, model, schema, **kwargs):
+        return _Model(self, schema)
+
+    def answer(self, schema, messages):
+        if schema is ComicOutline:
+            self.outline_calls += 1
+            return self.outlines.pop(0)
+        with self.lock:
+            self.page_calls.append(messages)
+        if messages == self.fail_page:
+            raise ValueError("bad page")
+        return ComicPage(title=f"Page {messages + 1}", rows=[])
+
+
+class _Model:
+    def __init__(self, models, schema):
+        self.models = models
+        self.schema = schema
+
+    def invoke(self, input, timeout=None):
+        return self.models.answer(self.schema, input)
+
+    async def ainvoke(self, input, timeout=None):
+        return self.models.answer(self.schema, input)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("COMIC_LLM_RETRY_DELAY", "0")
+    monkeypatch.setattr(comic_service, "get_response_cache", lambda: None)
+    monkeypatch.setattr(comic_service, "llm_governor", Governor("test", requests_per_minute=0, max_in_flight=0))
+    monkeypatch.setattr(ComicService, "_build_outline_messages", lambda self, prompt, page_count: "outline")
+    monkeypatch.setattr(ComicService, "_build_page_messages", lambda self, prompt, outline, index: index)
+    return ComicService("sk-test", "https://llm.example/v1", "gpt-4o-mini")
+
+
+def titles(pages):
+    return [page["title"] for page in pages]
+
+
+def test_chunked_script_writes_one_call_per_page_in_order(monkeypatch, service):
+    models = ScriptModels([outline(4)])
+    monkeypatch.setattr(comic_service, "get_structured_model", models)
+
+    pages = service.generate_comic_script_chunked("A robot learns to paint", page_count=4)
+
+    assert titles(pages) == ["Page 1", "Page 2", "Page 3", "Page 4"]
+    assert sorted(models.page_calls) == [0, 1, 2, 3]
+
+
+def test_short_outline_is_requested_again(monkeypatch, service):
+    models = ScriptModels([outline(2), outline(3)])
+    monkeypatch.setattr(comic_service, "get_structured_model", models)
+
+    pages = list(service.iter_comic_script_chunked("A robot learns to paint", page_count=3))
+
+    assert models.outline_calls == 2
+    assert titles(pages) == ["Page 1", "Page 2", "Page 3"]
+
+
+def test_async_chunked_script_matches_the_sync_one(monkeypatch, service):
+    models = ScriptModels([outline(5)])
+    monkeypatch.setattr(comic_service, "get_structured_model", models)
+
+    pages = asyncio.run(service.agenerate_comic_script_chunked("A robot learns to paint", page_count=3))
+
+    assert titles(pages) == ["Page 1", "Page 2", "Page 3"]
+    assert sorted(models.page_calls) == [0, 1, 2]
+
+
+def test_failed_page_fails_the_script(monkeypatch, service):
+    models = ScriptModels([outline(3)], fail_page=1)
+    monkeypatch.setattr(comic_service, "get_structured_model", models)
+
+    with pytest.raises(Exception, match="AI generation failed: bad page"):
+        service.generate_comic_script_chunked("A robot learns to paint", page_count=3)
+    # ValueError is terminal, so the page is not retried
+    assert models.page_calls.count(1) == 1
@@ -0,0 +1,93 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from pydantic import ValidationError
+
+from services import comic_service
+from services.comic_service import ComicService, _PageStreamParser
+
+
+def page(title):
+    return {"title": title, "rows": [{"height": "180px", "panels": [{"text": f"{title} panel"}]}]}
+
+
+SCRIPT = json.dumps({"pages": [page("One"), page("Two"), page("Three")]})
+
+
+def chunked(text, size=7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_page_is_yielded_once_the_next_page_starts():
+    parser = _PageStreamParser()
+    first = json.dumps({"pages": [page("One")]})[:-2]
+
+    assert list(parser.feed(first)) == []
+    assert list(parser.feed(', {"title": "Tw')) == [page("One")]
+    assert list(parser.feed('o", "rows": []}]}')) == []
+    assert list(parser.finish()) == [{"title": "Two", "rows": []}]
+
+
+def test_small_chunks_yield_every_page_exactly_once():
+    parser = _PageStreamParser()
+    pages = []
+    for text in chunked(SCRIPT):
+        pages.extend(parser.feed(text))
+    assert [p["title"] for p in pages] == ["One", "Two"]
+
+    pages.extend(parser.finish())
+    assert pages == [page("One"), page("Two"), page("Three")]
+
+
+def test_incomplete_page_waits_for_the_end_of_the_document():
+    parser = _PageStreamParser()
+    # "rows" is still missing when the second page starts
+    list(parser.feed('{"pages": [{"title": "One"}, {"title": "Two", "rows": []}'))
+    assert parser.emitted == 0
+
+    list(parser.feed("]}"))
+    with pytest.raises(ValidationError):
+        list(parser.finish())
+
+
+def test_truncated_document_raises():
+    parser = _PageStreamParser()
+    list(parser.feed(SCRIPT[:-10]))
+    with pytest.raises(ValueError):
+        list(parser.finish())
+
+
+class StreamingModel:
+    def __init__(self, texts):
+        self.texts = texts
+        self.timeouts = []
+
+    def stream(self, messages, timeout=None):
+        self.timeouts.append(timeout)
+        return iter(SimpleNamespace(text=text) for text in self.texts)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(comic_service, "get_response_cache", lambda: None)
+    return ComicService("sk-test", "https://llm.example/v1", "gpt-4o-mini")
+
+
+def test_stream_comic_script_yields_pages_as_they_complete(monkeypatch, service):
+    model = StreamingModel(chunked(SCRIPT))
+    monkeypatch.setattr(comic_service, "get_json_stream_model", lambda *args, **kwargs: model)
+
+    pages = service.stream_comic_script("A robot learns to paint", page_count=3)
+
+    assert next(pages) == page("One")
+    assert list(pages) == [page("Two"), page("Three")]
+    assert len(model.timeouts) == 1 and model.timeouts[0] > 0
+
+
+def test_stream_comic_script_wraps_parse_errors(monkeypatch, service):
+    model = StreamingModel(chunked('{"pages": [{"title": "One"}]}'))
+    monkeypatch.setattr(comic_service, "get_json_stream_model", lambda *args, **kwargs: model)
+
+    with pytest.raises(Exception, match="AI generation failed"):
+        list(service.stream_comic_script("A robot learns to paint"))
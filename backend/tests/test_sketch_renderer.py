@@ -0,0 +1,64 @@
+import io
+
+import pytest
+from PIL import Image
+
+from utils.sketch_renderer import (
+    DEFAULT_ROW_HEIGHT, PAGE_PADDING, PAGE_WIDTH, ROW_GAP, layout_digest, page_layout, render_sketch,
+)
+
+
+def page(*rows, text="Hello"):
+    return {"rows": [
+        {"height": height, "panels": [{"text": text, **({"bg": bg} if bg else {})} for bg in colors]}
+        for height, colors in rows
+    ]}
+
+
+def test_page_layout_keeps_heights_and_colors_only():
+    data = page(("180px", [None, "#ff0000"]), (120, [None]))
+    assert page_layout(data) == [(180, [None, "#ff0000"]), (120, [None])]
+
+
+@pytest.mark.parametrize("height, expected", [
+    ("200px", 200), (" 90 PX ", 90), ("75.5", 75), (120, 120), ("auto", DEFAULT_ROW_HEIGHT),
+    (None, DEFAULT_ROW_HEIGHT), (-5, DEFAULT_ROW_HEIGHT), ("0px", DEFAULT_ROW_HEIGHT),
+])
+def test_page_layout_parses_row_heights(height, expected):
+    assert page_layout(page((height, [None])))[0][0] == expected
+
+
+@pytest.mark.parametrize("data", [{}, {"rows": []}, {"rows": "nope"}, None, page((9000, [None]), (9000, [None]))])
+def test_page_layout_rejects_empty_or_huge_pages(data):
+    with pytest.raises(ValueError):
+        page_layout(data)
+
+
+def test_layout_digest_ignores_text_but_not_layout():
+    digest = layout_digest(page((150, [None, None])))
+    assert digest == layout_digest(page((150, [None, None]), text="Different dialogue"))
+    assert digest != layout_digest(page((160, [None, None])))
+    assert digest != layout_digest(page((150, [None, "#000"])))
+    assert digest != layout_digest(page((150, [None, None])), scale=1)
+
+
+def test_render_sketch_is_deterministic_and_sized_like_the_page():
+    data = page((150, [None, None]), (200, ["#336699"]))
+    png = render_sketch(data)
+    assert png == render_sketch(page((150, [None, None]), (200, ["#336699"]), text="Other"))
+
+    image = Image.open(io.BytesIO(png))
+    assert image.format == "PNG"
+    assert image.size == (PAGE_WIDTH * 2, (2 * PAGE_PADDING + 150 + 200 + ROW_GAP) * 2)
+
+
+def test_render_sketch_draws_panel_colors_on_white():
+    image = Image.open(io.BytesIO(render_sketch(page((100, ["#336699"]), text=""), scale=1))).convert("RGB")
+    assert image.getpixel((2, 2)) == (255, 255, 255)
+    assert image.getpixel((PAGE_WIDTH // 2, PAGE_PADDING + 50)) == (0x33, 0x66, 0x99)
+
+
+def test_render_sketch_falls_back_to_gradient_for_bad_colors():
+    image = Image.open(io.BytesIO(render_sketch(page((100, ["not-a-color"])), scale=1))).convert("RGB")
+    r, g, b = image.getpixel((PAGE_WIDTH // 2, PAGE_PADDING + 50))
+    assert 0xE8 <= r <= 0xF5 and 0xE8 <= g <= 0xF5 and 0xED <= b <= 0xF7
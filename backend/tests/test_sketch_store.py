@@ -0,0 +1,93 @@
+import hashlib
+import io
+import os
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+from controllers import image_controller
+from services import image_service
+from utils.sketch_store import SketchStore
+
+
+def image_bytes(fmt="PNG", color=(255, 255, 255)):
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30), color).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SketchStore(str(tmp_path / "sketches"), max_bytes=1024 * 1024)
+
+
+def test_same_bytes_get_the_same_handle(store):
+    data = image_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+
+    result = store.save(data)
+
+    assert result == {
+        "handle": f"sketch:{digest}",
+        "digest": digest,
+        "url": f"/backend/static/images/sketches/{digest}.png",
+    }
+    assert store.save(data) == result
+    assert store.resolve(result["handle"]) == os.path.join(store.directory, f"{digest}.png")
+
+
+def test_jpeg_keeps_its_extension(store):
+    result = store.save(image_bytes("JPEG"))
+    assert store.resolve(result["handle"]).endswith(".jpg")
+
+
+@pytest.mark.parametrize("data", [b"", b"not an image", image_bytes("GIF"), b"\x00" * (1024 * 1024 + 1)])
+def test_invalid_sketches_are_rejected(store, data):
+    with pytest.raises(ValueError):
+        store.save(data)
+
+
+@pytest.mark.parametrize("handle", ["sketch:" + "0" * 64, "sketch:../../etc/passwd", "data:image/png;base64,AA"])
+def test_unknown_handles_do_not_resolve(store, handle):
+    assert store.resolve(handle) is None
+
+
+def test_rendered_layout_is_drawn_once(store):
+    renders = []
+
+    def render():
+        renders.append(1)
+        return image_bytes()
+
+    first = store.save_rendered("layout-a", render)
+    assert SketchStore(store.directory, store.max_bytes).save_rendered("layout-a", render) == first
+    assert len(renders) == 1
+
+    os.remove(store.resolve(first["handle"]))
+    assert store.save_rendered("layout-a", render) == first
+    assert len(renders) == 2
+
+
+@pytest.fixture
+def client(monkeypatch, store):
+    monkeypatch.setattr(image_service, "sketch_store", store)
+    app = Flask(__name__)
+    app.register_blueprint(image_controller.image_bp)
+    return app.test_client()
+
+
+def test_upload_accepts_multipart_and_raw_bodies(client, store):
+    data = image_bytes()
+
+    multipart = client.post("/api/sketches", data={"sketch": (io.BytesIO(data), "sketch.png")})
+    raw = client.post("/api/sketches", data=data, content_type="image/png")
+
+    assert multipart.status_code == raw.status_code == 200
+    assert multipart.get_json() == raw.get_json()
+    assert store.resolve(raw.get_json()["handle"])
+
+
+def test_upload_rejects_missing_or_invalid_sketches(client):
+    assert client.post("/api/sketches", data=b"text", content_type="text/plain").status_code == 400
+    assert client.post("/api/sketches", data=b"not an image", content_type="image/png").status_code == 400
@@ -0,0 +1,20 @@
+# Utils package
+from .client_pool import (
+    ClientPool,
+    client_pool,
+    hash_api_key,
+    get_genai_client,
+    get_chat_model,
+    get_structured_model,
+    get_json_stream_model,
+    get_openai_client,
+    get_async_openai_client,
+)
+from .jobs import InMemoryJobStore, SQLiteJobStore, JobManager, get_job_manager
+
+__all__ = [
+    'ClientPool', 'client_pool', 'hash_api_key',
+    'get_genai_client', 'get_chat_model', 'get_structured_model', 'get_json_stream_model',
+    'get_openai_client', 'get_async_openai_client',
+    'InMemoryJobStore', 'SQLiteJobStore', 'JobManager', 'get_job_manager',
+]
@@ -0,0 +1,240 @@
+"""Process-wide pool of reusable API clients (Gemini, OpenAI, LangChain)"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+# httpx and the SDKs are imported when the first client is built
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+GEMINI_TIMEOUT_MS = 120000
+# Point the Gemini SDK at another endpoint, e.g. benchmarks/fake_upstream.py
+GEMINI_BASE_URL = os.getenv("COMIC_GEMINI_BASE_URL")
+LLM_TIMEOUT_SECONDS = 120.0
+
+
+def hash_api_key(api_key: Optional[str]) -> str:
+    """Return a short, non-reversible fingerprint of an API key"""
+    if not api_key:
+        return "anonymous"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _http_limits() -> "httpx.Limits":
+    """Connection limits shared by every pooled HTTP client"""
+    import httpx
+
+    return httpx.Limits(
+        max_connections=int(os.getenv("COMIC_HTTP_MAX_CONNECTIONS", 20)),
+        max_keepalive_connections=int(os.getenv("COMIC_HTTP_MAX_KEEPALIVE", 10)),
+        keepalive_expiry=float(os.getenv("COMIC_HTTP_KEEPALIVE_SECONDS", 60)),
+    )
+
+
+class ClientPool:
+    """
+    Thread-safe LRU pool of API clients
+
+    Clients are keyed by (provider, api_key hash, base_url, model) so that
+    every request sharing the same credentials and endpoint reuses one
+    client and its keep-alive connections. Entries idle for longer than
+    ``idle_seconds`` are evicted, and the pool never holds more than
+    ``max_size`` clients.
+    """
+
+    def __init__(self, max_size: int = 32, idle_seconds: float = 600.0):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self._entries: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(provider: str, api_key: Optional[str], base_url: Optional[str] = None,
+                 model: Optional[str] = None) -> Tuple:
+        """Build the pool key; the raw API key is never stored"""
+        return (provider, hash_api_key(api_key), base_url or "", model or "")
+
+    def get(self, key: Tuple, factory: Callable[[], Any]) -> Any:
+        """
+        Return the pooled client for ``key``, creating it with ``factory`` on a miss
+
+        Args:
+            key: Key built by ``make_key``
+            factory: Zero-argument callable that builds a new client
+
+        Returns:
+            The pooled client
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["last_used"] = now
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["client"]
+            self.misses += 1
+
+        # Build outside the lock; client construction can be slow
+        client = factory()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Another thread won the race, keep its client
+                entry["last_used"] = now
+                return entry["client"]
+            self._entries[key] = {"client": client, "last_used": now}
+            while len(self._entries) > self.max_size:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self.evictions += 1
+                logger.info(f"Client pool full, evicted {evicted_key[0]} client")
+        return client
+
+    def _evict_idle(self, now: float) -> None:
+        """Drop clients that have not been used for ``idle_seconds`` (lock held)"""
+        expired = [k for k, e in self._entries.items() if now - e["last_used"] > self.idle_seconds]
+        for key in expired:
+            # Evicted clients are dropped rather than closed: a request that
+            # fetched the client just before eviction may still be using it,
+            # and the HTTP connections are released when it is collected.
+            del self._entries[key]
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove every pooled client"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return pool counters"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+client_pool = ClientPool(
+    max_size=int(os.getenv("COMIC_CLIENT_POOL_SIZE", 32)),
+    idle_seconds=float(os.getenv("COMIC_CLIENT_POOL_IDLE_SECONDS", 600)),
+)
+
+
+def get_genai_client(api_key: str):
+    """Return a pooled ``google.genai.Client`` for the given API key"""
+    from google import genai
+
+    def factory():
+        http_options = {
+            'timeout': GEMINI_TIMEOUT_MS,
+            'client_args': {'limits': _http_limits()},
+        }
+        if GEMINI_BASE_URL:
+            http_options['base_url'] = GEMINI_BASE_URL
+        return genai.Client(api_key=api_key, vertexai=False, http_options=http_options)
+
+    return client_pool.get(ClientPool.make_key("gemini", api_key, GEMINI_BASE_URL), factory)
+
+
+def get_chat_model(api_key: str, base_url: str, model: str, temperature: float = 0.7,
+                   max_tokens: int = 3000):
+    """Return a pooled LangChain ``ChatOpenAI`` model"""
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+    def factory():
+        return ChatOpenAI(
+            model=model,
+            openai_api_key=api_key,
+            base_url=base_url,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=LLM_TIMEOUT_SECONDS,
+            # Retries are handled by utils.retry so they share the retry budget
+            max_retries=0,
+            http_client=httpx.Client(limits=_http_limits(), timeout=LLM_TIMEOUT_SECONDS),
+            # Used by ainvoke/astream; pooled so async callers keep their connections too
+            http_async_client=httpx.AsyncClient(limits=_http_limits(), timeout=LLM_TIMEOUT_SECONDS),
+        )
+
+    key = ClientPool.make_key(f"langchain-openai:{temperature}:{max_tokens}", api_key, base_url, model)
+    return client_pool.get(key, factory)
+
+
+def get_structured_model(api_key: str, base_url: str, model: str, schema: type,
+                         temperature: float = 0.7, max_tokens: int = 3000):
+    """Return a pooled ``with_structured_output`` wrapper so the schema is compiled once"""
+    def factory():
+        llm = get_chat_model(api_key, base_url, model, temperature, max_tokens)
+        return llm.with_structured_output(schema)
+
+    key = ClientPool.make_key(
+        f"langchain-structured:{schema.__name__}:{temperature}:{max_tokens}", api_key, base_url, model
+    )
+    return client_pool.get(key, factory)
+
+
+def get_json_stream_model(api_key: str, base_url: str, model: str, schema: type,
+                          temperature: float = 0.7, max_tokens: int = 3000):
+    """Return a pooled chat model bound to ``schema`` as its JSON response format, for streaming"""
+    def factory():
+        llm = get_chat_model(api_key, base_url, model, temperature, max_tokens)
+        return llm.bind(response_format=schema)
+
+    key = ClientPool.make_key(
+        f"langchain-json-stream:{schema.__name__}:{temperature}:{max_tokens}", api_key, base_url, model
+    )
+    return client_pool.get(key, factory)
+
+
+def get_openai_client(api_key: str, base_url: str):
+    """Return a pooled ``openai.OpenAI`` client"""
+    import httpx
+    import openai
+
+    def factory():
+        return openai.OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=LLM_TIMEOUT_SECONDS,
+            max_retries=0,
+            http_client=httpx.Client(limits=_http_limits(), timeout=LLM_TIMEOUT_SECONDS),
+        )
+
+    return client_pool.get(ClientPool.make_key("openai", api_key, base_url), factory)
+
+
+def get_async_openai_client(api_key: str, base_url: str):
+    """
+    Return a pooled ``openai.AsyncOpenAI`` client
+
+    The async connection pool binds to the event loop that first uses it,
+    so this is meant for the single long-lived loop of an ASGI worker.
+    """
+    import httpx
+    import openai
+
+    def factory():
+        return openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=LLM_TIMEOUT_SECONDS,
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=_http_limits(), timeout=LLM_TIMEOUT_SECONDS),
+        )
+
+    return client_pool.get(ClientPool.make_key("openai-async", api_key, base_url), factory)
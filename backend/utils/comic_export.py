@@ -0,0 +1,321 @@
+"""
+Comic export builders: long-strip PNG/WebP, multi-page PDF and CBZ
+
+These functions run in a worker process (see services/export_service.py).
+They take local image files and write the export to ``output_path``,
+decoding one page at a time so memory stays bounded by a single page
+(and, for WebP, the down-scaled strip) however many pages there are.
+"""
+import os
+import struct
+import threading
+import zlib
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from utils.image_storage import sniff_mime, IMAGE_EXTENSIONS
+from utils.image_writer import encode, resize_to_width
+
+# PIL and zipfile are imported where used so importing this module stays cheap
+if TYPE_CHECKING:
+    from PIL import Image
+
+EXPORT_FORMATS = ("pdf", "cbz", "png", "webp")
+CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "cbz": "application/vnd.comicbook+zip",
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+# Largest width or height libwebp can encode
+WEBP_MAX_DIMENSION = 16383
+
+# Uncompressed scanline bytes handed to zlib at a time by the PNG strip writer
+_PNG_BUFFER_BYTES = 4 * 1024 * 1024
+
+
+def _open_page(path: str, width: Optional[int] = None) -> "Image.Image":
+    """Decode one page as RGB, scaled down to ``width`` if it is wider (never up)"""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img.load()
+        if img.mode in ("RGBA", "LA", "P"):
+            rgba = img.convert("RGBA")
+            page = Image.new("RGB", rgba.size, (255, 255, 255))
+            page.paste(rgba, mask=rgba.getchannel("A"))
+        else:
+            page = img.convert("RGB")
+    if width and page.width > width:
+        page = resize_to_width(page, width)
+    return page
+
+
+def _page_sizes(paths: List[str]) -> List[tuple]:
+    """Read (width, height) of every page from its header without decoding it"""
+    from PIL import Image
+
+    sizes = []
+    for path in paths:
+        with Image.open(path) as img:
+            sizes.append(img.size)
+    return sizes
+
+
+def _strip_layout(paths: List[str], width: Optional[int], max_height: Optional[int]) -> tuple:
+    """
+    Return the strip width and the height of every page scaled to it
+
+    The strip is at most as wide as the narrowest page, so pages are only
+    ever scaled down.
+    """
+    sizes = _page_sizes(paths)
+    narrowest = min(w for w, _ in sizes)
+    strip_width = min(width, narrowest) if width else narrowest
+    heights = [max(1, round(h * strip_width / w)) for w, h in sizes]
+    if max_height and sum(heights) > max_height:
+        scale = max_height / sum(heights)
+        strip_width = max(1, int(strip_width * scale))
+        heights = [max(1, int(h * scale)) for h in heights]
+    return strip_width, heights
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def write_png_strip(paths: List[str], output_path: str, width: Optional[int] = None) -> Dict[str, int]:
+    """
+    Stack pages vertically into one PNG, streamed to ``output_path``
+
+    PIL can only encode a whole image at once, which for a 10-page 2K comic
+    means a ~130 MB canvas; this writes the PNG chunks directly instead,
+    one page of scanlines at a time. Rows use the PNG "Up" filter, computed
+    in C with ImageChops against the page shifted down by one row.
+    """
+    from PIL import Image, ImageChops
+
+    strip_width, heights = _strip_layout(paths, width, None)
+    stride = strip_width * 3
+    compressor = zlib.compressobj(6)
+    with open(output_path, "wb") as out:
+        out.write(b"\x89PNG\r\n\x1a\n")
+        out.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", strip_width, sum(heights), 8, 2, 0, 0, 0)))
+        previous_row: Optional["Image.Image"] = None
+        for path, height in zip(paths, heights):
+            page = _open_page(path, strip_width)
+            if page.height != height:
+                page = page.resize((strip_width, height))
+            # Row above each row; the first row continues from the previous page
+            above = Image.new("RGB", page.size)
+            if previous_row is not None:
+                above.paste(previous_row, (0, 0))
+            above.paste(page.crop((0, 0, strip_width, height - 1)), (0, 1))
+            filtered = ImageChops.subtract_modulo(page, above).tobytes()
+            previous_row = page.crop((0, height - 1, strip_width, height))
+            del page, above
+
+            buffer = bytearray()
+            for offset in range(0, len(filtered), stride):
+                buffer += b"\x02"
+                buffer += filtered[offset:offset + stride]
+                if len(buffer) >= _PNG_BUFFER_BYTES:
+                    data = compressor.compress(bytes(buffer))
+                    if data:
+                        out.write(_png_chunk(b"IDAT", data))
+                    buffer.clear()
+            data = compressor.compress(bytes(buffer))
+            if data:
+                out.write(_png_chunk(b"IDAT", data))
+        out.write(_png_chunk(b"IDAT", compressor.flush()))
+        out.write(_png_chunk(b"IEND", b""))
+    return {"width": strip_width, "height": sum(heights), "pages": len(paths)}
+
+
+def write_webp_strip(paths: List[str], output_path: str, width: Optional[int] = None,
+                     quality: int = 90) -> Dict[str, int]:
+    """
+    Stack pages vertically into one WebP
+
+    WebP images are limited to 16383 pixels per side, so a strip taller than
+    that is scaled down as a whole to fit.
+    """
+    from PIL import Image
+
+    strip_width, heights = _strip_layout(paths, width, WEBP_MAX_DIMENSION)
+    strip = Image.new("RGB", (strip_width, sum(heights)), (255, 255, 255))
+    top = 0
+    for path, height in zip(paths, heights):
+        page = _open_page(path, strip_width)
+        if page.height != height:
+            page = page.resize((strip_width, height))
+        strip.paste(page, (0, top))
+        top += height
+        del page
+    with open(output_path, "wb") as out:
+        out.write(encode(strip, "WEBP", quality, lossless=False))
+    return {"width": strip_width, "height": strip.height, "pages": len(paths)}
+
+
+def write_pdf(paths: List[str], output_path: str, quality: int = 90, dpi: int = 150,
+              title: Optional[str] = None) -> Dict[str, int]:
+    """
+    Write one PDF page per image, streamed to ``output_path``
+
+    Pages are embedded as JPEG (DCTDecode) image objects sized at ``dpi``.
+    Objects are written as each page is encoded and the cross-reference
+    table is appended at the end, so only one page is held in memory.
+    """
+    offsets: List[int] = []
+    page_ids: List[int] = []
+
+    with open(output_path, "wb") as out:
+        def start_object() -> int:
+            offsets.append(out.tell())
+            object_id = len(offsets)
+            out.write(f"{object_id} 0 obj\n".encode("ascii"))
+            return object_id
+
+        out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        # Catalog (1) and page tree (2) are referenced before they are written
+        offsets.extend([0, 0])
+        for path in paths:
+            page = _open_page(path)
+            data = encode(page, "JPEG", quality)
+            pixel_width, pixel_height = page.size
+            del page
+            page_width = pixel_width * 72 / dpi
+            page_height = pixel_height * 72 / dpi
+
+            image_id = start_object()
+            out.write(
+                f"<< /Type /XObject /Subtype /Image /Width {pixel_width} /Height {pixel_height} "
+                f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode /Length {len(data)} >>\n"
+                "stream\n".encode("ascii")
+            )
+            out.write(data)
+            out.write(b"\nendstream\nendobj\n")
+
+            content = f"q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q".encode("ascii")
+            content_id = start_object()
+            out.write(f"<< /Length {len(content)} >>\nstream\n".encode("ascii"))
+            out.write(content)
+            out.write(b"\nendstream\nendobj\n")
+
+            page_id = start_object()
+            out.write(
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+                f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>\n"
+                "endobj\n".encode("ascii")
+            )
+            page_ids.append(page_id)
+
+        info_id = None
+        if title:
+            info_id = start_object()
+            # PDF text string in UTF-16BE so titles in any script survive
+            encoded_title = (b"\xfe\xff" + title.encode("utf-16-be")).hex().upper()
+            out.write(f"<< /Title <{encoded_title}> >>\nendobj\n".encode("ascii"))
+
+        offsets[0] = out.tell()
+        out.write(b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+        offsets[1] = out.tell()
+        kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+        out.write(f"2 0 obj\n<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>\nendobj\n".encode("ascii"))
+
+        xref_offset = out.tell()
+        out.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode("ascii"))
+        for offset in offsets:
+            out.write(f"{offset:010d} 00000 n \n".encode("ascii"))
+        info = f" /Info {info_id} 0 R" if info_id else ""
+        out.write(
+            f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R{info} >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode("ascii")
+        )
+    return {"pages": len(paths)}
+
+
+def write_cbz(paths: List[str], output_path: str, title: Optional[str] = None,
+              has_cover: bool = False) -> Dict[str, int]:
+    """
+    Pack the page files into a CBZ (zip) archive with a ComicInfo.xml
+
+    Pages are already compressed images, so they are stored as they are,
+    without recompression or decoding.
+    """
+    import zipfile
+    from xml.sax.saxutils import escape
+
+    pages_xml = []
+    with zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for index, path in enumerate(paths):
+            with open(path, "rb") as f:
+                header = f.read(12)
+            ext = IMAGE_EXTENSIONS.get(sniff_mime(header), "png")
+            archive.write(path, f"{index:03d}.{ext}")
+            page_type = ' Type="FrontCover"' if has_cover and index == 0 else ""
+            pages_xml.append(f'    <Page Image="{index}"{page_type} />')
+        comic_info = (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<ComicInfo xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            'xmlns:xsd="http://www.w3.org/2001/XMLSchema">\n'
+            + (f"  <Title>{escape(title)}</Title>\n" if title else "")
+            + f"  <PageCount>{len(paths)}</PageCount>\n"
+            "  <Pages>\n" + "\n".join(pages_xml) + "\n  </Pages>\n"
+            "</ComicInfo>\n"
+        )
+        archive.writestr("ComicInfo.xml", comic_info, compress_type=zipfile.ZIP_DEFLATED)
+    return {"pages": len(paths)}
+
+
+def _exit_after(seconds: float, timeout_path: Optional[str]) -> threading.Timer:
+    """Start a watchdog that ends this worker process once ``seconds`` have passed"""
+    def expire() -> None:
+        if timeout_path:
+            with open(timeout_path, "w", encoding="ascii"):
+                pass
+        os._exit(1)
+
+    timer = threading.Timer(seconds, expire)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+def build_export(export_format: str, paths: List[str], output_path: str, title: Optional[str] = None,
+                 has_cover: bool = False, width: Optional[int] = None, quality: int = 90,
+                 timeout: Optional[float] = None, timeout_path: Optional[str] = None) -> Dict[str, int]:
+    """
+    Build an export of ``paths`` (cover first, if any) at ``output_path``
+
+    Entry point for the export process pool. With ``timeout``, the worker
+    process exits if the build is still running after that many seconds,
+    first creating ``timeout_path`` so the caller can tell a timeout from
+    a crash. Only the worker running this export can end, never one that
+    has moved on to another export.
+
+    Returns:
+        Dict with the page count and, for strips, the strip size
+    """
+    watchdog = _exit_after(timeout, timeout_path) if timeout else None
+    try:
+        return _build_export(export_format, paths, output_path, title, has_cover, width, quality)
+    finally:
+        if watchdog is not None:
+            watchdog.cancel()
+
+
+def _build_export(export_format: str, paths: List[str], output_path: str, title: Optional[str],
+                  has_cover: bool, width: Optional[int], quality: int) -> Dict[str, int]:
+    if export_format == "pdf":
+        result = write_pdf(paths, output_path, quality=quality, title=title)
+    elif export_format == "cbz":
+        result = write_cbz(paths, output_path, title=title, has_cover=has_cover)
+    elif export_format == "png":
+        result = write_png_strip(paths, output_path, width=width)
+    elif export_format == "webp":
+        result = write_webp_strip(paths, output_path, width=width, quality=quality)
+    else:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    result["bytes"] = os.path.getsize(output_path)
+    return result
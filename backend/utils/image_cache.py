@@ -0,0 +1,170 @@
+"""Content-addressed on-disk cache for generated images"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from utils.image_storage import CONTENT_TYPES, IMAGE_EXTENSIONS, sniff_mime
+
+logger = logging.getLogger(__name__)
+
+
+def digest_reference(ref: str, static_root: str) -> str:
+    """
+    Return a stable digest for a reference image string
+
+    Data URIs are hashed by content, local static images by path, size and
+    mtime (generated files are never rewritten), and remote URLs by URL.
+    """
+    if ref.startswith("data:image"):
+        encoded = ref.split(",", 1)[1] if "," in ref else ref
+        return "data:" + hashlib.sha256(encoded.encode("ascii", "ignore")).hexdigest()
+    if ref.startswith("/backend/static/"):
+        path = os.path.join(static_root, ref[len("/backend/static/"):])
+        try:
+            st = os.stat(path)
+            return f"file:{ref}:{st.st_size}:{st.st_mtime_ns}"
+        except OSError:
+            return f"file:{ref}:missing"
+    return "url:" + ref
+
+
+def make_cache_key(prompt: str, model_id: str, aspect_ratio: str, image_size: str,
+                   reference_digests: List[str]) -> str:
+    """Hash every input that determines the generated image"""
+    payload = json.dumps(
+        {
+            "prompt": prompt,
+            "model": model_id,
+            "aspect_ratio": aspect_ratio,
+            "image_size": image_size,
+            "references": reference_digests,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ImageResultCache:
+    """
+    Size-bounded LRU of generated images, stored as ``<cache_dir>/<key>.<ext>``
+
+    The extension follows the stored bytes (png, jpg or webp), matching the
+    configured image format.
+
+    A hit is copied to a fresh key in the image storage by the caller, so
+    evicting a cache entry never breaks a URL that was already handed out.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU order from file mtimes (lock held)"""
+        if self._loaded:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = []
+        for name in os.listdir(self.cache_dir):
+            key, _, ext = name.partition(".")
+            if ext in CONTENT_TYPES:
+                st = os.stat(os.path.join(self.cache_dir, name))
+                files.append((st.st_mtime, key, ext, st.st_size))
+        for _, key, ext, size in sorted(files):
+            self._discard(key)
+            self._entries[key] = (ext, size)
+            self._total_bytes += size
+        self._loaded = True
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{ext}")
+
+    def _discard(self, key: str) -> None:
+        """Forget ``key`` and delete its file (lock held)"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        ext, size = entry
+        self._total_bytes -= size
+        try:
+            os.remove(self._path(key, ext))
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up ``key`` and return the path of the cached image
+
+        Returns:
+            Path inside ``cache_dir`` (copy it before use, it may be evicted), or None on a miss
+        """
+        with self._lock:
+            self._load_index()
+            entry = self._entries.get(key)
+            if entry is None or not os.path.exists(self._path(key, entry[0])):
+                self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        source = self._path(key, entry[0])
+        now = time.time()
+        try:
+            os.utime(source, (now, now))
+        except OSError:
+            pass
+        return source
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store the encoded bytes of a freshly generated image under ``key``"""
+        ext = IMAGE_EXTENSIONS.get(sniff_mime(data[:12]), "png")
+        target = self._path(key, ext)
+        with self._lock:
+            self._load_index()
+            tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, target)
+            except OSError as e:
+                logger.warning(f"Failed to cache image {key}: {e}")
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                return
+            old = self._entries.get(key)
+            if old is not None and old[0] != ext:
+                self._discard(key)
+            self._total_bytes -= self._entries.pop(key, (ext, 0))[1]
+            self._entries[key] = (ext, len(data))
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until under ``max_bytes`` (lock held)"""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._discard(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        """Return cache counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,564 @@
+"""Generated-image storage: hash-sharded keys, pluggable backends and a retention sweeper"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+URL_PREFIX = "/backend/static/images/"
+
+# Top-level directories under the images root with their own eviction
+RESERVED_DIRS = frozenset({"cache", "sketches", "variants"})
+
+IMAGE_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+CONTENT_TYPES = {ext: mime for mime, ext in IMAGE_EXTENSIONS.items()}
+
+_KEY_RE = re.compile(r"^[\w-]+(?:\.[\w-]+)*(?:/[\w-]+(?:\.[\w-]+)*)*$")
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process sweeps anyway
+    fcntl = None
+
+
+class StoredObject(NamedTuple):
+    key: str
+    size: int
+    mtime: float
+
+
+def shard_key(filename: str) -> str:
+    """Place ``filename`` under two levels of 256 directories, e.g. ``3f/a2/<filename>``"""
+    digest = hashlib.sha256(filename.encode("utf-8")).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{filename}"
+
+
+def key_from_url(url: str) -> Optional[str]:
+    """Return the storage key of a ``/backend/static/images/...`` URL, or None"""
+    if not url.startswith(URL_PREFIX):
+        return None
+    key = url[len(URL_PREFIX):].split("?", 1)[0]
+    if not _KEY_RE.match(key) or key.split("/", 1)[0] in RESERVED_DIRS:
+        return None
+    return key
+
+
+def url_for_key(key: str) -> str:
+    return f"{URL_PREFIX}{key}"
+
+
+def content_type_for_key(key: str) -> str:
+    return CONTENT_TYPES.get(key.rsplit(".", 1)[-1].lower(), "application/octet-stream")
+
+
+def new_key(mime_type: str = "image/png") -> str:
+    """Return a fresh sharded key with the extension for ``mime_type``"""
+    return shard_key(f"{uuid.uuid4()}.{IMAGE_EXTENSIONS.get(mime_type, 'png')}")
+
+
+def derivative_key(key: str, width: int, ext: str) -> str:
+    """Key of the ``width``-pixel variant of ``key``, stored next to it, e.g. ``3f/a2/<uuid>.w400.webp``"""
+    return f"{key.rsplit('.', 1)[0]}.w{width}.{ext}"
+
+
+def sniff_mime(header: bytes) -> Optional[str]:
+    """Detect PNG, JPEG or WebP from the first 12 bytes of a file"""
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class LocalImageBackend:
+    """
+    Stores images as files under ``root``
+
+    ``root`` is static/images by default, so the frontend's static file
+    server keeps resolving the URLs directly.
+    """
+
+    name = "local"
+    # Files are readable by the static file server as soon as they are written
+    is_local = True
+
+    def __init__(self, root: str):
+        self.root = root
+        self._dirs: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def _ensure_dir(self, directory: str, refresh: bool = False) -> None:
+        # Shard directories are created once per process, not on every save
+        with self._lock:
+            if refresh:
+                self._dirs.discard(directory)
+            if directory in self._dirs:
+                return
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._dirs.add(directory)
+
+    def _write(self, key: str, write) -> None:
+        """Call ``write(tmp_path)`` next to the target, then move it into place atomically"""
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        self._ensure_dir(directory)
+        try:
+            try:
+                write(tmp)
+            except FileNotFoundError:
+                # The shard directory was removed behind our back
+                self._ensure_dir(directory, refresh=True)
+                write(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def put(self, key: str, data: bytes) -> None:
+        def write(tmp: str) -> None:
+            with open(tmp, "wb") as f:
+                f.write(data)
+        self._write(key, write)
+
+    def put_file(self, key: str, source: str) -> None:
+        def write(tmp: str) -> None:
+            try:
+                os.link(source, tmp)
+            except OSError as e:
+                if isinstance(e, FileNotFoundError) and not os.path.exists(source):
+                    raise ValueError(f"Source image disappeared: {source}")
+                shutil.copyfile(source, tmp)
+        self._write(key, write)
+
+    def read(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        return path if os.path.isfile(path) else None
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self) -> Iterator[StoredObject]:
+        if not os.path.isdir(self.root):
+            return
+        for directory, subdirs, files in os.walk(self.root):
+            if directory == self.root:
+                subdirs[:] = [name for name in subdirs if name not in RESERVED_DIRS]
+            for name in files:
+                if name.rsplit(".", 1)[-1].lower() not in CONTENT_TYPES:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                yield StoredObject(key, st.st_size, st.st_mtime)
+
+
+class S3ImageBackend:
+    """
+    Stores images in an S3-compatible bucket (AWS S3, MinIO, R2, ...)
+
+    boto3 is imported when the backend is created. Credentials come from the
+    usual AWS environment variables or config files.
+    """
+
+    name = "s3"
+    is_local = False
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, url_expiry: int = 3600):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("COMIC_IMAGE_STORAGE=s3 requires boto3; run `uv sync --extra s3`")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.url_expiry = url_expiry
+        self._client = boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def put(self, key: str, data: bytes) -> None:
+        self._client.put_object(
+            Bucket=self.bucket, Key=self._object_key(key), Body=data,
+            ContentType=content_type_for_key(key), CacheControl="public, max-age=31536000, immutable",
+        )
+
+    def put_file(self, key: str, source: str) -> None:
+        self._client.upload_file(source, self.bucket, self._object_key(key), ExtraArgs={
+            "ContentType": content_type_for_key(key), "CacheControl": "public, max-age=31536000, immutable",
+        })
+
+    def read(self, key: str) -> bytes:
+        response = self._client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        with response["Body"] as body:
+            return body.read()
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key: str) -> None:
+        self._client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def presigned_url(self, key: str) -> str:
+        return self._client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._object_key(key)}, ExpiresIn=self.url_expiry
+        )
+
+    def list(self) -> Iterator[StoredObject]:
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                key = item["Key"][len(self.prefix):]
+                if key.split("/", 1)[0] in RESERVED_DIRS or key.rsplit(".", 1)[-1].lower() not in CONTENT_TYPES:
+                    continue
+                yield StoredObject(key, item["Size"], item["LastModified"].timestamp())
+
+
+class ImageStorage:
+    """
+    Saves generated images under sharded keys and enforces a retention policy
+
+    ``stage`` makes an image readable under its final URL before the final
+    bytes are written: local backends write it in place, remote backends
+    keep it in ``staging_dir`` (served from there by ``local_path``) until
+    ``commit`` uploads it. Staged files are looked up on disk, so every
+    worker sharing ``staging_dir`` finds them, not only the one that wrote
+    them. Staged files left behind by a crash are picked up again with
+    ``recover_staged``.
+
+    Images older than ``max_age_seconds`` are deleted, then the oldest are
+    deleted until the total is under ``max_bytes`` (0 disables either
+    limit). Sweeps run on a background thread every ``sweep_interval``
+    seconds; with several workers on one host a lock file makes sure only
+    one of them sweeps at a time.
+    """
+
+    def __init__(self, backend, max_age_seconds: float = 0, max_bytes: int = 0,
+                 sweep_interval: float = 3600, lock_path: Optional[str] = None,
+                 staging_dir: Optional[str] = None):
+        self.backend = backend
+        self.staging_dir = staging_dir
+        self._staged: Dict[str, str] = {}
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.lock_path = lock_path
+        self.saved = 0
+        self.sweeps = 0
+        self.deleted = 0
+        self.deleted_bytes = 0
+        self.last_sweep: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def retention_enabled(self) -> bool:
+        return bool(self.max_age_seconds or self.max_bytes)
+
+    def save(self, data: bytes, mime_type: str = "image/png") -> str:
+        """Store encoded image bytes under a new sharded key and return their URL"""
+        key = new_key(mime_type)
+        self.backend.put(key, data)
+        with self._lock:
+            self.saved += 1
+        return url_for_key(key)
+
+    def save_file(self, path: str, mime_type: str = "image/png") -> str:
+        """Store a copy of a local image file (hard link when possible) and return its URL"""
+        key = new_key(mime_type)
+        self.backend.put_file(key, path)
+        with self._lock:
+            self.saved += 1
+        return url_for_key(key)
+
+    def _staging_path(self, key: str) -> str:
+        return os.path.join(self.staging_dir, key.replace("/", "__"))
+
+    def stage(self, key: str, data: bytes) -> None:
+        """Make ``data`` readable under ``key`` until ``commit`` stores the final bytes"""
+        if self.backend.is_local or not self.staging_dir:
+            self.backend.put(key, data)
+            return
+        os.makedirs(self.staging_dir, exist_ok=True)
+        path = self._staging_path(key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._staged[key] = path
+
+    def commit(self, key: str, data: bytes) -> None:
+        """Store the final bytes for ``key`` and drop its staged copy"""
+        self.backend.put(key, data)
+        with self._lock:
+            self.saved += 1
+            paths = {self._staged.pop(key, None)}
+        if self.staging_dir and not self.backend.is_local:
+            paths.add(self._staging_path(key))
+        for path in paths - {None}:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _staged_file(self, key: str) -> Optional[str]:
+        """Path of the staged copy of ``key`` in ``staging_dir``, written by any worker"""
+        with self._lock:
+            claimed = self._staged.get(key)
+        if claimed is not None and os.path.isfile(claimed):
+            return claimed
+        if self.backend.is_local or not self.staging_dir:
+            return None
+        path = self._staging_path(key)
+        if os.path.isfile(path):
+            return path
+        # Claimed for re-upload by a worker recovering after a crash
+        prefix = f"{os.path.basename(path)}."
+        try:
+            for name in os.listdir(self.staging_dir):
+                if name.startswith(prefix) and name.endswith(".claim"):
+                    return os.path.join(self.staging_dir, name)
+        except OSError:
+            pass
+        return None
+
+    def staged_path(self, url: str) -> Optional[str]:
+        """
+        Return the file holding the staged bytes of a stored image URL, or None once it is committed
+
+        Local backends stage in place, so there the file counts as staged
+        while its format differs from the key's (Gemini's PNG under a .webp
+        or .jpg key).
+        """
+        key = key_from_url(url)
+        if key is None:
+            return None
+        staged = self._staged_file(key)
+        if staged is not None or not self.backend.is_local:
+            return staged
+        path = self.backend.local_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                mime_type = sniff_mime(f.read(12))
+        except OSError:
+            return None
+        return path if mime_type and mime_type != content_type_for_key(key) else None
+
+    def recover_staged(self) -> List[Tuple[str, bytes]]:
+        """
+        Claim staged images left behind by a previous process
+
+        Returns:
+            List of (key, staged bytes) to commit again
+        """
+        if not self.staging_dir or not os.path.isdir(self.staging_dir):
+            return []
+        recovered = []
+        for name in os.listdir(self.staging_dir):
+            if name.endswith((".tmp", ".claim")):
+                continue
+            path = os.path.join(self.staging_dir, name)
+            claimed = f"{path}.{os.getpid()}.claim"
+            try:
+                # Rename is atomic, so only one worker claims each file
+                os.rename(path, claimed)
+                with open(claimed, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            key = name.replace("__", "/")
+            with self._lock:
+                self._staged[key] = claimed
+            recovered.append((key, data))
+        return recovered
+
+    def local_path(self, url: str) -> Optional[str]:
+        """Return the file behind a stored image URL if it is on local disk (or still staged)"""
+        key = key_from_url(url)
+        if key is None:
+            return None
+        return self._staged_file(key) or self.backend.local_path(key)
+
+    def read(self, url: str) -> bytes:
+        """Return the bytes behind a stored image URL"""
+        key = key_from_url(url)
+        if key is None:
+            raise ValueError(f"Not a stored image URL: {url}")
+        staged = self._staged_file(key)
+        if staged is not None:
+            try:
+                with open(staged, "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass
+        return self.backend.read(key)
+
+    def sweep(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Apply the retention policy once and return what was deleted"""
+        now = time.time() if now is None else now
+        started = time.monotonic()
+        objects = sorted(self.backend.list(), key=lambda obj: obj.mtime)
+        total = sum(obj.size for obj in objects)
+        deleted = freed = 0
+        for obj in objects:
+            expired = self.max_age_seconds and now - obj.mtime > self.max_age_seconds
+            over_size = self.max_bytes and total > self.max_bytes
+            if not expired and not over_size:
+                # Sorted oldest first: nothing newer is expired, and we are under the size limit
+                break
+            try:
+                self.backend.delete(obj.key)
+            except Exception as e:
+                logger.warning(f"Failed to delete stored image {obj.key}: {e}")
+                continue
+            total -= obj.size
+            deleted += 1
+            freed += obj.size
+
+        result = {
+            "objects": len(objects) - deleted,
+            "bytes": total,
+            "deleted": deleted,
+            "freed_bytes": freed,
+            "seconds": round(time.monotonic() - started, 3),
+            "finished_at": now,
+        }
+        with self._lock:
+            self.sweeps += 1
+            self.deleted += deleted
+            self.deleted_bytes += freed
+            self.last_sweep = result
+        if deleted:
+            logger.info(f"Image retention sweep deleted {deleted} images ({freed / (1024 * 1024):.1f} MB)")
+        return result
+
+    def _sweep_exclusive(self) -> None:
+        """Sweep unless another process on this host holds the sweep lock"""
+        if fcntl is None or not self.lock_path:
+            self.sweep()
+            return
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+            try:
+                self.sweep()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _run(self, initial_delay: float) -> None:
+        delay = initial_delay
+        while not self._stop.wait(delay):
+            try:
+                self._sweep_exclusive()
+            except Exception as e:
+                logger.warning(f"Image retention sweep failed: {e}")
+            delay = self.sweep_interval
+
+    def start_sweeper(self, initial_delay: float = 60) -> None:
+        """Start the background sweeper if a retention limit is configured"""
+        if not self.retention_enabled:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(initial_delay,), name="comic-image-sweeper", daemon=True
+            )
+            self._thread.start()
+
+    def stop_sweeper(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return storage counters and the result of the last sweep"""
+        with self._lock:
+            return {
+                "backend": self.backend.name,
+                "staged": len(self._staged),
+                "max_age_seconds": self.max_age_seconds,
+                "max_bytes": self.max_bytes,
+                "saved": self.saved,
+                "sweeps": self.sweeps,
+                "deleted": self.deleted,
+                "deleted_bytes": self.deleted_bytes,
+                "last_sweep": self.last_sweep,
+            }
+
+
+def storage_from_env(images_dir: str, data_dir: str) -> ImageStorage:
+    """Build the image storage from COMIC_IMAGE_* / COMIC_S3_* settings"""
+    kind = os.getenv("COMIC_IMAGE_STORAGE", "local").lower()
+    if kind == "s3":
+        bucket = os.getenv("COMIC_S3_BUCKET")
+        if not bucket:
+            raise RuntimeError("COMIC_IMAGE_STORAGE=s3 requires COMIC_S3_BUCKET")
+        backend = S3ImageBackend(
+            bucket,
+            prefix=os.getenv("COMIC_S3_PREFIX", "images"),
+            endpoint_url=os.getenv("COMIC_S3_ENDPOINT_URL"),
+            region=os.getenv("COMIC_S3_REGION"),
+            url_expiry=int(os.getenv("COMIC_S3_URL_EXPIRY", 3600)),
+        )
+    elif kind == "local":
+        backend = LocalImageBackend(images_dir)
+    else:
+        raise RuntimeError(f"Unknown COMIC_IMAGE_STORAGE: {kind} (expected local or s3)")
+
+    return ImageStorage(
+        backend,
+        max_age_seconds=float(os.getenv("COMIC_IMAGE_MAX_AGE_DAYS", 0)) * 86400,
+        max_bytes=int(float(os.getenv("COMIC_IMAGE_MAX_GB", 0)) * 1024 ** 3),
+        sweep_interval=float(os.getenv("COMIC_IMAGE_SWEEP_SECONDS", 3600)),
+        lock_path=os.path.join(data_dir, "image_sweep.lock"),
+        staging_dir=os.path.join(data_dir, "image_staging"),
+    )
@@ -0,0 +1,159 @@
+"""On-demand resized variants of generated images, cached on disk"""
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+
+from utils.image_storage import CONTENT_TYPES
+from utils.image_writer import encode, resize_to_width
+
+logger = logging.getLogger(__name__)
+
+# ``fmt`` query values: PIL format and file extension
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+    "jpg": ("JPEG", "jpg"),
+    "png": ("PNG", "png"),
+}
+
+
+def snap_width(width: int, widths: Sequence[int]) -> int:
+    """
+    Round ``width`` up to the nearest configured variant width
+
+    Keeps the number of distinct variants (and cache entries) per image
+    small whatever sizes clients ask for; above the largest configured
+    width the largest one is used.
+    """
+    for candidate in widths:
+        if candidate >= width:
+            return candidate
+    return widths[-1]
+
+
+def variant_id(key: str, width: Optional[int], image_format: str, quality: int) -> str:
+    """Stable identifier of one variant of a stored image, also used as its strong ETag"""
+    payload = f"{key}|{width or 'full'}|{image_format}|{quality}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def render_variant(data: bytes, width: Optional[int], image_format: str, quality: int) -> bytes:
+    """
+    Decode ``data``, scale it down to ``width`` pixels wide and encode it
+
+    Images are never scaled up. JPEG sources are decoded at a reduced DCT
+    scale first (``draft``), which is much cheaper than a full decode.
+    """
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    if width and img.format == "JPEG":
+        img.draft("RGB", (width, max(1, img.height * width // img.width)))
+    img.load()
+    if width and width < img.width:
+        img = resize_to_width(img, width)
+    return encode(img, image_format, quality, lossless=False)
+
+
+class ImageVariantCache:
+    """
+    Size-bounded LRU of image variants, stored as ``<cache_dir>/<variant_id>.<ext>``
+
+    Stored images are never rewritten once committed, so a variant never
+    goes stale; its identifier doubles as a strong ETag.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU order from file mtimes (lock held)"""
+        if self._loaded:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.rsplit(".", 1)[-1] in CONTENT_TYPES:
+                st = os.stat(os.path.join(self.cache_dir, name))
+                files.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._loaded = True
+
+    def get(self, name: str) -> Optional[str]:
+        """Return the path of the cached variant file ``name``, or None on a miss"""
+        path = os.path.join(self.cache_dir, name)
+        with self._lock:
+            self._load_index()
+            if name not in self._entries or not os.path.exists(path):
+                self._entries.pop(name, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return path
+
+    def put(self, name: str, data: bytes) -> Optional[str]:
+        """Store variant bytes under ``name`` and return their path (None if the write failed)"""
+        target = os.path.join(self.cache_dir, name)
+        with self._lock:
+            self._load_index()
+            self.stored += 1
+            tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, target)
+            except OSError as e:
+                logger.warning(f"Failed to cache image variant {name}: {e}")
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                return None
+            self._total_bytes -= self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+        return target
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until under ``max_bytes`` (lock held)"""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stored": self.stored,
+            }
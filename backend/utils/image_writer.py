@@ -0,0 +1,291 @@
+"""Background encoding and persistence of generated images"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from utils.image_storage import ImageStorage, derivative_key, key_from_url, new_key, url_for_key
+from utils.metrics import span
+
+# PIL is imported where used so importing this module stays cheap
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+}
+_EXTENSIONS = {"PNG": "png", "WEBP": "webp", "JPEG": "jpg"}
+
+
+@dataclass(frozen=True)
+class OutputPolicy:
+    """
+    How generated images are stored
+
+    ``format`` is PNG (optimized, lossless), WEBP (lossless) or JPEG
+    (``quality``). Derivatives are ``derivative_widths``-pixel wide copies
+    in ``derivative_format`` at ``derivative_quality``; pages narrower than
+    a width get no derivative for it.
+    """
+    format: str = "PNG"
+    quality: int = 90
+    derivative_widths: Tuple[int, ...] = (400, 1024)
+    derivative_format: str = "WEBP"
+    derivative_quality: int = 80
+
+    @property
+    def mime_type(self) -> str:
+        return _FORMATS[self.format.lower()][1]
+
+    @classmethod
+    def from_env(cls) -> "OutputPolicy":
+        """Read COMIC_IMAGE_FORMAT, COMIC_IMAGE_QUALITY and COMIC_IMAGE_DERIVATIVE_*"""
+        def image_format(name: str, default: str) -> str:
+            value = os.getenv(name, default).lower()
+            if value not in _FORMATS:
+                raise ValueError(f"Unsupported {name}: {value} (expected png, webp or jpeg)")
+            return _FORMATS[value][0]
+
+        widths = os.getenv("COMIC_IMAGE_DERIVATIVE_WIDTHS", "400,1024")
+        return cls(
+            format=image_format("COMIC_IMAGE_FORMAT", "png"),
+            quality=int(os.getenv("COMIC_IMAGE_QUALITY", 90)),
+            derivative_widths=tuple(sorted({int(w) for w in widths.split(",") if w.strip()})),
+            derivative_format=image_format("COMIC_IMAGE_DERIVATIVE_FORMAT", "webp"),
+            derivative_quality=int(os.getenv("COMIC_IMAGE_DERIVATIVE_QUALITY", 80)),
+        )
+
+
+def _prepare_mode(img: "Image.Image", image_format: str) -> "Image.Image":
+    """Convert ``img`` to a mode ``image_format`` can store"""
+    from PIL import Image
+
+    if image_format == "JPEG":
+        if img.mode in ("RGBA", "LA", "P"):
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            return background
+        return img if img.mode == "RGB" else img.convert("RGB")
+    if img.mode not in ("RGB", "RGBA", "L", "LA"):
+        return img.convert("RGBA")
+    return img
+
+
+def encode(img: "Image.Image", image_format: str, quality: int, lossless: bool = True) -> bytes:
+    """
+    Encode ``img`` as PNG, WEBP or JPEG
+
+    With ``lossless`` PNG is optimized and WebP is lossless; JPEG (and
+    lossy WebP) use ``quality``.
+    """
+    img = _prepare_mode(img, image_format)
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        img.save(buffer, format="PNG", optimize=lossless)
+    elif image_format == "WEBP":
+        if lossless:
+            # For lossless WebP quality is compression effort; higher settings
+            # take about 50% longer on a 2K page for about 1% smaller files
+            img.save(buffer, format="WEBP", lossless=True, quality=50, method=2)
+        else:
+            img.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def resize_to_width(img: "Image.Image", width: int) -> "Image.Image":
+    """
+    Scale ``img`` to ``width`` pixels wide, keeping its aspect ratio
+
+    reducing_gap lets PIL box-reduce by an integer factor before the
+    Lanczos pass, which is several times faster for large downscales with
+    no visible difference.
+    """
+    from PIL import Image
+
+    height = max(1, round(img.height * width / img.width))
+    return img.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+class ImageWriter:
+    """
+    Encodes and persists generated images on a background pool
+
+    ``write`` stages the bytes Gemini returned under the final key and
+    returns the URL right away; a pool thread then re-encodes them in the
+    configured format, commits the result under the same key, and stores
+    the smaller derivatives next to it. When more than ``max_pending``
+    writes are queued the caller does the work itself, so a burst cannot
+    hold an unbounded number of decoded pages in memory.
+    """
+
+    def __init__(self, storage: ImageStorage, policy: OutputPolicy, max_workers: int = 2,
+                 max_pending: int = 32):
+        self.storage = storage
+        self.policy = policy
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._closed = False
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.written = 0
+        self.inline = 0
+        self.failures = 0
+        self.derivatives = 0
+
+    def _get_executor(self) -> Optional[ThreadPoolExecutor]:
+        with self._lock:
+            if self._closed:
+                return None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="comic-image-writer"
+                )
+            return self._executor
+
+    def write(self, data: bytes, on_encoded: Optional[Callable[[bytes], None]] = None) -> str:
+        """
+        Stage ``data`` and schedule encoding and persistence
+
+        Args:
+            data: Image bytes as returned by Gemini
+            on_encoded: Called with the final encoded bytes once they are stored
+
+        Returns:
+            URL path of the image, readable immediately
+        """
+        key = new_key(self.policy.mime_type)
+        with span("image_stage"):
+            self.storage.stage(key, data)
+        self._submit(key, data, on_encoded)
+        return url_for_key(key)
+
+    def _submit(self, key: str, data: bytes, on_encoded: Optional[Callable[[bytes], None]] = None) -> None:
+        executor = self._get_executor()
+        if executor is None or not self._slots.acquire(blocking=False):
+            # Queue full or shutting down: finish the write on this thread
+            with self._lock:
+                self.inline += 1
+            self._persist(key, data, on_encoded)
+            return
+        try:
+            future = executor.submit(self._persist, key, data, on_encoded, True)
+        except RuntimeError:
+            self._slots.release()
+            self._persist(key, data, on_encoded)
+            return
+        with self._lock:
+            self._pending[key] = future
+        future.add_done_callback(lambda _: self._done(key))
+
+    def _done(self, key: str) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _persist(self, key: str, data: bytes, on_encoded: Optional[Callable[[bytes], None]],
+                 release: bool = False) -> None:
+        from PIL import Image
+
+        try:
+            with span("image_encode"):
+                img = Image.open(io.BytesIO(data))
+                img.load()
+                encoded = encode(img, self.policy.format, self.policy.quality)
+            # Gemini already returns PNG: keep its bytes if optimizing did not make them smaller
+            if key.endswith(".png") and data.startswith(b"\x89PNG") and len(data) <= len(encoded):
+                encoded = data
+            self.storage.commit(key, encoded)
+            with self._lock:
+                self.written += 1
+            if on_encoded is not None:
+                on_encoded(encoded)
+            self._write_derivatives(key, img)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            # The staged bytes stay readable under the key, only the optimization is lost
+            logger.warning(f"Failed to encode and store image {key}: {e}")
+        finally:
+            if release:
+                self._slots.release()
+
+    def _write_derivatives(self, key: str, img: "Image.Image") -> None:
+        policy = self.policy
+        ext = _EXTENSIONS[policy.derivative_format]
+        for width in policy.derivative_widths:
+            if width >= img.width:
+                continue
+            with span("image_derivative"):
+                resized = resize_to_width(img, width)
+                data = encode(resized, policy.derivative_format, policy.derivative_quality, lossless=False)
+            self.storage.backend.put(derivative_key(key, width, ext), data)
+            with self._lock:
+                self.derivatives += 1
+
+    def derivative_urls(self, url: str) -> Dict[int, str]:
+        """URLs the derivatives of ``url`` are (or will be) stored under, by width"""
+        key = key_from_url(url)
+        if key is None:
+            return {}
+        ext = _EXTENSIONS[self.policy.derivative_format]
+        return {width: url_for_key(derivative_key(key, width, ext)) for width in self.policy.derivative_widths}
+
+    def recover(self) -> int:
+        """Re-queue images a previous process staged but never committed"""
+        recovered = self.storage.recover_staged()
+        for key, data in recovered:
+            self._submit(key, data)
+        if recovered:
+            logger.info(f"Re-queued {len(recovered)} staged images")
+        return len(recovered)
+
+    def wait(self, key: str, timeout: Optional[float] = None) -> None:
+        """Wait until the final bytes of ``key`` are stored, if it is still queued"""
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Wait until every queued write has finished"""
+        with self._lock:
+            futures: List[Future] = list(self._pending.values())
+        for future in futures:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Finish queued writes (when ``wait``) and stop the pool"""
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return writer counters"""
+        with self._lock:
+            return {
+                "format": self.policy.format,
+                "pending": len(self._pending),
+                "written": self.written,
+                "inline": self.inline,
+                "failures": self.failures,
+                "derivatives": self.derivatives,
+            }
@@ -0,0 +1,299 @@
+"""Background job queue with in-memory and SQLite-backed stores"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+TERMINAL_STATUSES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+class InMemoryJobStore:
+    """Job store kept in process memory (jobs are lost on restart)"""
+
+    def __init__(self, ttl_seconds: float = 3600.0):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, kind: str) -> Dict[str, Any]:
+        now = time.time()
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "status": JOB_QUEUED,
+            "progress": None,
+            "attempts": 0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._lock:
+            self._purge_expired(now)
+            self._jobs[job_id] = job
+            self._events[job_id] = []
+        return dict(job)
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+                job["updated_at"] = time.time()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def append_event(self, job_id: str, event_type: str, data: Dict[str, Any]) -> int:
+        with self._lock:
+            events = self._events.setdefault(job_id, [])
+            seq = len(events) + 1
+            events.append({"seq": seq, "type": event_type, "data": data, "created_at": time.time()})
+            return seq
+
+    def events_since(self, job_id: str, after_seq: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(e) for e in self._events.get(job_id, []) if e["seq"] > after_seq]
+
+    def _purge_expired(self, now: float) -> None:
+        """Forget finished jobs older than the TTL (lock held)"""
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in TERMINAL_STATUSES and now - job["updated_at"] > self.ttl_seconds
+        ]
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
+            self._events.pop(job_id, None)
+
+
+class SQLiteJobStore:
+    """
+    Job store persisted in SQLite
+
+    Jobs survive restarts and can be polled from any worker process that
+    points at the same database file.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 86400.0):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_events (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                data TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            );
+        """)
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (sqlite3 connections are not shared)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id: str, kind: str) -> Dict[str, Any]:
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN (?, ?) AND updated_at < ?)",
+                (*TERMINAL_STATUSES, now - self.ttl_seconds),
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (*TERMINAL_STATUSES, now - self.ttl_seconds),
+            )
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, JOB_QUEUED, now, now),
+            )
+        return self.get(job_id)
+
+    def update(self, job_id: str, **fields) -> None:
+        if not fields:
+            return
+        columns = []
+        values = []
+        for name, value in fields.items():
+            if name in ("progress", "result"):
+                value = json.dumps(value, ensure_ascii=False) if value is not None else None
+            columns.append(f"{name} = ?")
+            values.append(value)
+        columns.append("updated_at = ?")
+        values.append(time.time())
+        conn = self._connect()
+        with conn:
+            conn.execute(f"UPDATE jobs SET {', '.join(columns)} WHERE id = ?", (*values, job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for name in ("progress", "result"):
+            job[name] = json.loads(job[name]) if job[name] else None
+        return job
+
+    def append_event(self, job_id: str, event_type: str, data: Dict[str, Any]) -> int:
+        conn = self._connect()
+        with conn:
+            row = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            seq = row[0]
+            conn.execute(
+                "INSERT INTO job_events (job_id, seq, type, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, seq, event_type, json.dumps(data, ensure_ascii=False), time.time()),
+            )
+        return seq
+
+    def events_since(self, job_id: str, after_seq: int = 0) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT seq, type, data, created_at FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after_seq),
+        ).fetchall()
+        return [
+            {"seq": r["seq"], "type": r["type"], "data": json.loads(r["data"]) if r["data"] else {},
+             "created_at": r["created_at"]}
+            for r in rows
+        ]
+
+
+class JobManager:
+    """Runs jobs on a bounded worker pool and records their progress in a store"""
+
+    def __init__(self, store, max_workers: int = 4):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="comic-job")
+        self._changed = threading.Condition()
+
+    def submit(self, kind: str, fn: Callable[..., Any], **kwargs) -> str:
+        """
+        Queue ``fn(progress_callback=..., **kwargs)`` and return the job id immediately
+
+        ``fn`` receives a ``progress_callback(event_type, data)`` it can call to
+        publish progress; its return value becomes the job result.
+        """
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, kind)
+        self._publish(job_id, JOB_QUEUED, {})
+        self._executor.submit(self._run, job_id, fn, kwargs)
+        return job_id
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting jobs and, if ``wait``, let queued and running jobs finish"""
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job_id: str, fn: Callable[..., Any], kwargs: Dict[str, Any]) -> None:
+        self.store.update(job_id, status=JOB_RUNNING)
+        self._publish(job_id, JOB_RUNNING, {})
+
+        def progress_callback(event_type: str, data: Optional[Dict[str, Any]] = None) -> None:
+            data = data or {}
+            fields = {"progress": {"event": event_type, **data}}
+            if event_type == "attempt" and "attempt" in data:
+                fields["attempts"] = data["attempt"]
+            self.store.update(job_id, **fields)
+            self._publish(job_id, event_type, data)
+
+        try:
+            result = fn(progress_callback=progress_callback, **kwargs)
+        except Exception as e:
+            logger.warning(f"Job {job_id} failed: {e}")
+            self.store.update(job_id, status=JOB_FAILED, error=str(e))
+            self._publish(job_id, JOB_FAILED, {"error": str(e)})
+            return
+        self.store.update(job_id, status=JOB_SUCCEEDED, result=result)
+        self._publish(job_id, JOB_SUCCEEDED, {"result": result})
+
+    def _publish(self, job_id: str, event_type: str, data: Dict[str, Any]) -> None:
+        self.store.append_event(job_id, event_type, data)
+        with self._changed:
+            self._changed.notify_all()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def wait_for_events(self, job_id: str, after_seq: int, timeout: float) -> List[Dict[str, Any]]:
+        """
+        Return events newer than ``after_seq``, waiting up to ``timeout`` seconds for one
+
+        Jobs running in this process wake waiters immediately; the timeout
+        doubles as the polling interval for jobs run by other processes
+        sharing a SQLite store.
+        """
+        events = self.store.events_since(job_id, after_seq)
+        if events:
+            return events
+        with self._changed:
+            self._changed.wait(timeout)
+        return self.store.events_since(job_id, after_seq)
+
+
+_job_manager: Optional[JobManager] = None
+_job_manager_lock = threading.Lock()
+
+
+def create_job_store():
+    """Build the job store selected by COMIC_JOB_STORE (memory or sqlite)"""
+    backend = os.getenv("COMIC_JOB_STORE", "memory").lower()
+    if backend == "sqlite":
+        default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "jobs.db")
+        return SQLiteJobStore(os.getenv("COMIC_JOB_DB", default_path))
+    if backend != "memory":
+        raise ValueError(f"Unknown job store: {backend}")
+    return InMemoryJobStore()
+
+
+def get_job_manager() -> JobManager:
+    """Return the process-wide job manager"""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager(create_job_store(), max_workers=int(os.getenv("COMIC_JOB_WORKERS", 4)))
+        return _job_manager
+
+
+def shutdown_job_manager(wait: bool = True) -> None:
+    """Drain the process-wide job manager if one was started"""
+    with _job_manager_lock:
+        manager = _job_manager
+    if manager is not None:
+        manager.shutdown(wait=wait)
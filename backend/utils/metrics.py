@@ -0,0 +1,399 @@
+"""In-process counters, histograms and timing spans with Prometheus text exposition"""
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Upstream calls take seconds to minutes; local phases take milliseconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+logger = logging.getLogger(__name__)
+
+# (labels, value) pairs of one metric family, used by scrape-time collectors
+Sample = Tuple[Dict[str, Any], float]
+# (name, type, help, samples) metric family computed at scrape time
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """Monotonic count per label set"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {"type": self.type_name, "help": self.documentation, "labelnames": list(self.labelnames),
+                "values": values}
+
+    def merge(self, data: Dict[str, Any]) -> None:
+        """Add the values of another process's ``snapshot``"""
+        with self._lock:
+            for key, value in data["values"]:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = self.header()
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Bucketed distribution per label set"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum, count]
+        self._values: Dict[Tuple, List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the wall time of the ``with`` block, including when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[2] if entry else 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            values = [[list(key), list(entry[0]), entry[1], entry[2]] for key, entry in self._values.items()]
+        return {"type": self.type_name, "help": self.documentation, "labelnames": list(self.labelnames),
+                "buckets": list(self.buckets), "values": values}
+
+    def merge(self, data: Dict[str, Any]) -> None:
+        """Add the observations of another process's ``snapshot`` (same buckets only)"""
+        if tuple(data["buckets"]) != self.buckets:
+            return
+        with self._lock:
+            for key, counts, total, count in data["values"]:
+                entry = self._values.setdefault(tuple(key), [[0] * (len(self.buckets) + 1), 0.0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, [list(entry[0]), entry[1], entry[2]]) for key, entry in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide set of metrics
+
+    Each worker process keeps its own values; with several workers behind
+    one port, ``SharedMetricsDir`` merges them for a scrape. Metrics are
+    created once and are cheap to update (one lock and, for histograms,
+    one bisect per observation).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Every metric's values, as JSON-serializable data"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def merge(self, snapshot: Dict[str, Dict[str, Any]]) -> None:
+        """Add another process's ``snapshot`` to this registry"""
+        for name, data in snapshot.items():
+            if data["type"] == Histogram.type_name:
+                metric = self.histogram(name, data["help"], data["labelnames"], data["buckets"])
+            else:
+                metric = self.counter(name, data["help"], data["labelnames"])
+            metric.merge(data)
+
+    def render(self, collected: Iterable[Family] = ()) -> str:
+        """
+        Render every metric in the Prometheus text format (version 0.0.4)
+
+        Args:
+            collected: Extra (name, type, help, samples) families computed at
+                scrape time, e.g. from existing stats() counters
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for name, type_name, documentation, samples in collected:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class SharedMetricsDir:
+    """
+    Metrics of every worker process, exchanged through a directory they share
+
+    Behind one port, each scrape reaches a single worker, so every worker
+    writes a snapshot of its metrics to ``<path>/<pid>-<id>.json`` every
+    ``interval`` seconds and just before it answers a scrape, which then
+    merges all snapshots. Registry counters and histograms are summed,
+    keeping the last snapshot of workers that exited so totals never go
+    back. Scrape-time stats families are per worker (labeled ``worker``)
+    and only come from workers that wrote recently. Clear the directory
+    when the server starts.
+    """
+
+    def __init__(self, path: str, interval: float = 5.0):
+        self.path = path
+        self.interval = interval
+        self._pid: Optional[int] = None
+        self._file: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _own_file(self) -> str:
+        # Forked workers inherit this object: name the file per process
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._file = os.path.join(self.path, f"{self._pid}-{uuid.uuid4().hex[:8]}.json")
+        return self._file
+
+    def write(self, registry: MetricsRegistry, collected: Iterable[Family] = ()) -> None:
+        """Publish this process's metrics"""
+        path = self._own_file()
+        snapshot = {
+            "pid": os.getpid(),
+            "written_at": time.time(),
+            "metrics": registry.snapshot(),
+            "collected": [list(family) for family in collected],
+        }
+        os.makedirs(self.path, exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+
+    def read(self) -> List[Dict[str, Any]]:
+        """Return the snapshots of every worker, including exited ones"""
+        snapshots = []
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return snapshots
+        for name in sorted(names):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.path, name), "r", encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self, registry: MetricsRegistry, collect: Callable[[], Iterable[Family]]) -> str:
+        """Publish this process's metrics, then render those of all workers"""
+        self.write(registry, collect())
+        merged = MetricsRegistry()
+        families: Dict[str, Family] = {}
+        live_after = time.time() - max(3 * self.interval, 30.0)
+        for snapshot in self.read():
+            merged.merge(snapshot["metrics"])
+            if snapshot["written_at"] < live_after:
+                continue
+            for name, type_name, documentation, samples in snapshot["collected"]:
+                family = families.setdefault(name, (name, type_name, documentation, []))
+                family[3].extend(({**labels, "worker": snapshot["pid"]}, value) for labels, value in samples)
+        return merged.render(families.values())
+
+    def clear(self) -> None:
+        """Delete every snapshot (call before the workers start)"""
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return
+        for name in names:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+    def start(self, registry: MetricsRegistry, collect: Callable[[], Iterable[Family]]) -> None:
+        """Publish this process's metrics every ``interval`` seconds on a background thread"""
+        def run():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.write(registry, collect())
+                except Exception as e:
+                    logger.warning(f"Failed to publish metrics: {e}")
+
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=run, name="comic-metrics", daemon=True)
+            self._thread.start()
+
+    def stop(self, registry: MetricsRegistry, collect: Callable[[], Iterable[Family]]) -> None:
+        """Stop publishing, after a last snapshot so nothing counted is lost"""
+        self._stop.set()
+        try:
+            self.write(registry, collect())
+        except Exception as e:
+            logger.warning(f"Failed to publish metrics: {e}")
+
+
+metrics = MetricsRegistry()
+
+# Set when several workers serve one port (see gunicorn.conf.py)
+shared_metrics: Optional[SharedMetricsDir] = (
+    SharedMetricsDir(os.environ["COMIC_METRICS_DIR"], float(os.getenv("COMIC_METRICS_INTERVAL", 5)))
+    if os.getenv("COMIC_METRICS_DIR") else None
+)
+
+
+def render_metrics(collect: Callable[[], Iterable[Family]]) -> str:
+    """Render the metrics of every worker when they share a directory, else of this process"""
+    if shared_metrics is None:
+        return metrics.render(collect())
+    return shared_metrics.render(metrics, collect)
+
+
+PHASE_SECONDS = metrics.histogram(
+    "comic_phase_seconds", "Time spent in each hot-path phase of a generation", ["phase"]
+)
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "comic_http_request_seconds", "Time until the response starts, per endpoint", ["endpoint", "method", "status"]
+)
+UPSTREAM_ATTEMPT_SECONDS = metrics.histogram(
+    "comic_upstream_attempt_seconds", "Duration of each Gemini/LLM attempt, retries included",
+    ["operation", "outcome"]
+)
+RATE_LIMIT_WAIT_SECONDS = metrics.histogram(
+    "comic_rate_limit_wait_seconds", "Time spent queued for a rate-limit slot", ["governor"]
+)
+GEMINI_ERRORS = metrics.counter(
+    "comic_gemini_errors_total", "Gemini responses without an image, by finish reason", ["finish_reason"]
+)
+
+
+def span(phase: str):
+    """Time a ``with`` block as ``phase`` in comic_phase_seconds"""
+    return PHASE_SECONDS.time(phase=phase)
+
+
+def timed(phase: str) -> Callable:
+    """Decorator form of ``span`` for functions that are a phase on their own"""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(phase):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_request(endpoint: Optional[str], method: str, status: int, seconds: float) -> None:
+    """Record one HTTP request in comic_http_request_seconds"""
+    HTTP_REQUEST_SECONDS.observe(seconds, endpoint=endpoint or "unmatched", method=method, status=status)
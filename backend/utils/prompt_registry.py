@@ -0,0 +1,167 @@
+"""Style registry and precompiled prompt templates loaded from backend/prompts"""
+import json
+import logging
+import os
+from functools import lru_cache
+from string import Formatter
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROMPT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts")
+
+
+class PromptTemplate:
+    """
+    A ``str.format``-style template parsed once into literal and field segments
+
+    Rendering joins the segments instead of re-parsing the template string
+    on every call. Only plain ``{name}`` fields are supported.
+    """
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self._segments: List[Tuple[str, str]] = []
+        for literal, field, spec, conversion in Formatter().parse(text):
+            if field is not None and (not field.isidentifier() or spec or conversion):
+                raise ValueError(f"Unsupported field {{{field}}} in prompt template {name}")
+            self._segments.append((literal, field))
+        self.fields = {field for _, field in self._segments if field}
+
+    def render(self, **values: Any) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Prompt template {self.name} is missing values for: {', '.join(sorted(missing))}")
+        parts = []
+        for literal, field in self._segments:
+            parts.append(literal)
+            if field:
+                parts.append(str(values[field]))
+        return "".join(parts)
+
+
+class PromptRegistry:
+    """
+    Comic styles, language instructions and prompt templates
+
+    ``registry.json`` lists styles and languages and ``templates/*.txt``
+    holds the prompt templates, so a new style is a data change rather than
+    a code change. Prompts that only depend on (style, language, page_count)
+    are rendered once and memoized.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "registry.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.defaults: Dict[str, str] = data["defaults"]
+        self.styles: Dict[str, Dict[str, str]] = data["styles"]
+        self.languages: Dict[str, Dict[str, str]] = data["languages"]
+        self.templates: Dict[str, PromptTemplate] = {}
+        template_dir = os.path.join(directory, "templates")
+        for filename in sorted(os.listdir(template_dir)):
+            if filename.endswith(".txt"):
+                name = filename[:-4]
+                with open(os.path.join(template_dir, filename), "r", encoding="utf-8") as f:
+                    self.templates[name] = PromptTemplate(name, f.read())
+        logger.info(f"Loaded {len(self.styles)} styles and {len(self.templates)} prompt templates from {directory}")
+
+    def render(self, template: str, **values: Any) -> str:
+        """Render a named template"""
+        return self.templates[template].render(**values)
+
+    def style_description(self, style: str) -> str:
+        entry = self.styles.get(style) or self.styles[self.defaults["style"]]
+        return entry["description"]
+
+    def language_instruction(self, language: str) -> str:
+        entry = self.languages.get(language) or self.languages[self.defaults["script_language"]]
+        return entry["script"]
+
+    def cover_language_requirement(self, language: str) -> str:
+        entry = self.languages.get(language) or self.languages[self.defaults["cover_language"]]
+        return entry["cover"]
+
+    @lru_cache(maxsize=1024)
+    def visual_guidelines(self, style: str, language: str) -> str:
+        """Row, panel and language rules shared by whole-script and per-page prompts"""
+        return self.render(
+            "visual_guidelines", comic_style=style, language_instruction=self.language_instruction(language)
+        )
+
+    @lru_cache(maxsize=1024)
+    def script_prompt(self, style: str, language: str, page_count: int) -> str:
+        """System prompt for generating a whole script in one call"""
+        return self.render(
+            "script",
+            page_count=page_count,
+            style_description=self.style_description(style),
+            language_instruction=self.language_instruction(language),
+            visual_guidelines=self.visual_guidelines(style, language),
+        )
+
+    @lru_cache(maxsize=1024)
+    def outline_prompt(self, style: str, language: str, page_count: int) -> str:
+        """System prompt for the outline call of chunked generation"""
+        return self.render(
+            "outline",
+            page_count=page_count,
+            style_description=self.style_description(style),
+            language_instruction=self.language_instruction(language),
+        )
+
+    def page_script_prompt(self, style: str, language: str, page_number: int, page_total: int,
+                           summary: str, outline: str, page_title: str) -> str:
+        """System prompt for one page of chunked generation"""
+        return self.render(
+            "page_script",
+            page_number=page_number,
+            page_total=page_total,
+            style_description=self.style_description(style),
+            language_instruction=self.language_instruction(language),
+            summary=summary,
+            outline=outline,
+            page_title=page_title,
+            visual_guidelines=self.visual_guidelines(style, language),
+        )
+
+    def page_image_prompt(self, style: str, title: str, panels: str) -> str:
+        """Image prompt for one comic page"""
+        return self.render("page_image", comic_style=style, title=title, panels=panels)
+
+    @lru_cache(maxsize=1024)
+    def cover_prompt(self, style: str, language: str) -> str:
+        """Image prompt for the comic cover"""
+        return self.render(
+            "cover_image", comic_style=style, language_requirement=self.cover_language_requirement(language)
+        )
+
+    def warm(self, max_page_count: int = 10) -> int:
+        """Pre-render every memoized prompt for the registered styles and languages"""
+        rendered = 0
+        for style in self.styles:
+            for language in self.languages:
+                self.cover_prompt(style, language)
+                for page_count in range(1, max_page_count + 1):
+                    self.script_prompt(style, language, page_count)
+                    self.outline_prompt(style, language, page_count)
+                    rendered += 2
+                rendered += 1
+        return rendered
+
+
+def _log_level() -> int:
+    level = logging.getLevelName(os.getenv("COMIC_PROMPT_LOG_LEVEL", "DEBUG").upper())
+    return level if isinstance(level, int) else logging.DEBUG
+
+
+PROMPT_LOG_LEVEL = _log_level()
+
+
+def log_prompt(log: logging.Logger, label: str, prompt: str) -> None:
+    """Log a rendered prompt at COMIC_PROMPT_LOG_LEVEL (DEBUG by default)"""
+    if log.isEnabledFor(PROMPT_LOG_LEVEL):
+        log.log(PROMPT_LOG_LEVEL, f"{label}:\n{prompt}")
+
+
+prompt_registry = PromptRegistry(os.getenv("COMIC_PROMPT_DIR", DEFAULT_PROMPT_DIR))
@@ -0,0 +1,236 @@
+"""Bounded on-disk cache for proxied images"""
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Heuristic freshness for responses with Last-Modified but no explicit lifetime
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX_SECONDS = 86400
+
+
+def _parse_http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Split a Cache-Control header into a directive -> argument dict"""
+    directives = {}
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers, now: float) -> Optional[float]:
+    """
+    Seconds an upstream response may be served without revalidation
+
+    Returns None if the response must not be stored at all.
+    """
+    directives = parse_cache_control(headers.get("Cache-Control"))
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name) and re.fullmatch(r"\d+", directives[name]):
+            return float(directives[name])
+    expires = _parse_http_date(headers.get("Expires"))
+    if expires is not None:
+        date = _parse_http_date(headers.get("Date")) or now
+        return max(0.0, expires - date)
+    last_modified = _parse_http_date(headers.get("Last-Modified"))
+    if last_modified is not None:
+        return min(HEURISTIC_MAX_SECONDS, max(0.0, (now - last_modified) * HEURISTIC_FRACTION))
+    return 0.0
+
+
+class ProxyCache:
+    """
+    LRU of proxied responses stored as ``<sha256(url)>.body`` plus ``.json`` metadata
+
+    Entries keep the upstream ETag / Last-Modified so stale entries can be
+    revalidated with a conditional request instead of refetched.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_object_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def body_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.body")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU order from file mtimes (lock held)"""
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".body"):
+                st = os.stat(os.path.join(self.directory, name))
+                files.append((st.st_mtime, name[:-5], st.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._loaded = True
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the stored metadata for ``url``, or None"""
+        key = self.key_for(url)
+        with self._lock:
+            self._load_index()
+            if key not in self._entries:
+                return None
+        try:
+            with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or not os.path.exists(self.body_path(key)):
+            return None
+        meta["key"] = key
+        meta["path"] = self.body_path(key)
+        return meta
+
+    def touch(self, meta: Dict[str, Any], hit_type: str = "hit") -> None:
+        """Mark an entry as recently used"""
+        with self._lock:
+            if meta["key"] in self._entries:
+                self._entries.move_to_end(meta["key"])
+            if hit_type == "revalidated":
+                self.revalidated += 1
+            else:
+                self.hits += 1
+        now = time.time()
+        try:
+            os.utime(meta["path"], (now, now))
+        except OSError:
+            pass
+
+    def refresh(self, meta: Dict[str, Any], headers, now: float) -> None:
+        """Extend an entry's lifetime after a 304 revalidation"""
+        lifetime = freshness_lifetime(headers, now)
+        meta["expires_at"] = now + (lifetime or 0.0)
+        if headers.get("ETag"):
+            meta["etag"] = headers["ETag"]
+        self._write_meta(meta["key"], meta)
+
+    def _write_meta(self, key: str, meta: Dict[str, Any]) -> None:
+        stored = {k: v for k, v in meta.items() if k not in ("key", "path")}
+        tmp = f"{self._meta_path(key)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(stored, f)
+        os.replace(tmp, self._meta_path(key))
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def tee(self, url: str, chunks: Iterator[bytes], headers, lifetime: float,
+            now: float) -> Iterator[bytes]:
+        """
+        Yield ``chunks`` unchanged while writing them to the cache
+
+        The entry is committed only if the whole body was streamed and fits
+        within ``max_object_bytes``; an aborted download leaves nothing behind.
+        """
+        key = self.key_for(url)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self.body_path(key)}.{uuid.uuid4().hex}.tmp"
+        size = 0
+        complete = False
+        f = open(tmp, "wb")
+        try:
+            for chunk in chunks:
+                if f is not None:
+                    size += len(chunk)
+                    if size > self.max_object_bytes:
+                        f.close()
+                        os.remove(tmp)
+                        f = None
+                    else:
+                        f.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            if f is not None:
+                f.close()
+                if complete:
+                    self._commit(key, tmp, size, {
+                        "url": url,
+                        "etag": headers.get("ETag"),
+                        "last_modified": headers.get("Last-Modified"),
+                        "content_type": headers.get("Content-Type", "image/png"),
+                        "size": size,
+                        "stored_at": now,
+                        "expires_at": now + lifetime,
+                    })
+                elif os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def _commit(self, key: str, tmp: str, size: int, meta: Dict[str, Any]) -> None:
+        try:
+            os.replace(tmp, self.body_path(key))
+            self._write_meta(key, meta)
+        except OSError as e:
+            logger.warning(f"Failed to store proxied image: {e}")
+            return
+        with self._lock:
+            self._load_index()
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted, evicted_size = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+                for path in (self.body_path(evicted), self._meta_path(evicted)):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+            }
@@ -0,0 +1,298 @@
+"""Per-API-key rate limiting and concurrency governance for upstream calls"""
+import asyncio
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+from utils.client_pool import hash_api_key
+from utils.metrics import RATE_LIMIT_WAIT_SECONDS
+from utils.retry import TerminalError
+
+logger = logging.getLogger(__name__)
+
+# Idle per-key limiters are pruned once the governor tracks more keys than this
+MAX_TRACKED_KEYS = 1000
+
+# How often async waiters re-check a limiter that is blocked on in-flight calls
+ASYNC_POLL_SECONDS = 0.05
+
+
+class QueueTimeoutError(TerminalError):
+    """Waited too long for a rate-limit slot"""
+
+
+class _KeyLimiter:
+    """Token bucket plus in-flight cap for one API key, served in FIFO order"""
+
+    def __init__(self, rate_per_second: float, burst: float, max_in_flight: int):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.waiters: deque = deque()
+        self.cond = threading.Condition()
+        # Callers between looking this limiter up and releasing it (guarded by the governor's lock)
+        self.leases = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_seconds_sum = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _refill(self, now: float) -> None:
+        if self.rate_per_second > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    def _blocked_for(self, now: float) -> Optional[float]:
+        """Seconds until the head waiter may proceed: 0 now, None if waiting on in-flight work"""
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return None
+        if self.rate_per_second > 0 and self.tokens < 1.0:
+            return (1.0 - self.tokens) / self.rate_per_second
+        return 0.0
+
+    def _try_admit(self, ticket: int) -> Optional[float]:
+        """
+        Admit ``ticket`` if it is at the head and a slot is free (lock held)
+
+        Returns:
+            None if admitted, otherwise a hint in seconds for when to check
+            again (inf when waiting on other callers rather than the clock)
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if self.waiters[0] != ticket:
+            return float("inf")
+        blocked_for = self._blocked_for(now)
+        if blocked_for is None:
+            return float("inf")
+        if blocked_for > 0:
+            return blocked_for
+        if self.rate_per_second > 0:
+            self.tokens -= 1.0
+        self.in_flight += 1
+        return None
+
+    def _record_wait(self, waited: float) -> None:
+        self.acquired += 1
+        self.wait_seconds_sum += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def _leave_queue(self, ticket: int) -> None:
+        self.waiters.remove(ticket)
+        # Wake the next waiter: it may be the new head
+        self.cond.notify_all()
+
+    def acquire(self, ticket: int, timeout: float) -> float:
+        """Block until this ticket reaches the head and a slot is free; return seconds waited"""
+        started = time.monotonic()
+        deadline = started + timeout
+        with self.cond:
+            self.waiters.append(ticket)
+            try:
+                while True:
+                    retry_in = self._try_admit(ticket)
+                    if retry_in is None:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise QueueTimeoutError(f"Timed out after {timeout}s waiting for a rate-limit slot")
+                    self.cond.wait(min(remaining, retry_in))
+            finally:
+                self._leave_queue(ticket)
+            waited = time.monotonic() - started
+            self._record_wait(waited)
+            return waited
+
+    async def aacquire(self, ticket: int, timeout: float) -> float:
+        """Async ``acquire``: waits in the same FIFO queue without holding a thread"""
+        started = time.monotonic()
+        deadline = started + timeout
+        with self.cond:
+            self.waiters.append(ticket)
+        try:
+            while True:
+                with self.cond:
+                    retry_in = self._try_admit(ticket)
+                if retry_in is None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self.cond:
+                        self.timeouts += 1
+                    raise QueueTimeoutError(f"Timed out after {timeout}s waiting for a rate-limit slot")
+                # Releases only notify threads, so poll for freed slots
+                await asyncio.sleep(min(remaining, retry_in, ASYNC_POLL_SECONDS))
+        finally:
+            with self.cond:
+                self._leave_queue(ticket)
+        waited = time.monotonic() - started
+        with self.cond:
+            self._record_wait(waited)
+        return waited
+
+    def release(self) -> None:
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def idle(self) -> bool:
+        with self.cond:
+            self._refill(time.monotonic())
+            return not self.waiters and self.in_flight == 0 and self.tokens >= self.burst
+
+    def stats(self) -> Dict[str, Any]:
+        with self.cond:
+            self._refill(time.monotonic())
+            return {
+                "queue_depth": len(self.waiters),
+                "in_flight": self.in_flight,
+                "tokens": round(self.tokens, 2),
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "wait_seconds_sum": round(self.wait_seconds_sum, 3),
+                "wait_seconds_max": round(self.wait_seconds_max, 3),
+            }
+
+
+class Governor:
+    """
+    Rate limiter and concurrency governor keyed by API key hash
+
+    Each key gets a token bucket (``requests_per_minute`` with ``burst``)
+    and a cap of ``max_in_flight`` concurrent calls. Callers for the same
+    key are admitted strictly in arrival order, so a burst from one user
+    queues up behind the quota instead of turning into 429 retry storms,
+    and other keys are unaffected.
+
+    Limits are kept in process memory. ``from_env`` therefore gives each
+    of the ``COMIC_WORKERS`` server processes an equal share of the
+    configured rate, burst and in-flight cap.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, burst: Optional[float] = None,
+                 max_in_flight: int = 0, queue_timeout: float = 300.0):
+        self.name = name
+        self.rate_per_second = requests_per_minute / 60.0
+        # Default burst: ten seconds' worth of requests
+        self.burst = burst if burst else float(max(1, round(requests_per_minute / 6)))
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self._limiters: Dict[str, _KeyLimiter] = {}
+        self._lock = threading.Lock()
+        self._tickets = itertools.count()
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, rpm: float, max_in_flight: int) -> "Governor":
+        """
+        Read ``<prefix>_RPM``, ``<prefix>_BURST`` and ``<prefix>_MAX_IN_FLIGHT`` (0 disables)
+
+        The values are totals for the server, split across ``COMIC_WORKERS``
+        processes (set by gunicorn.conf.py and ``serve.py --asgi``).
+        """
+        workers = max(1, int(os.getenv("COMIC_WORKERS", 1)))
+        burst = os.getenv(f"{prefix}_BURST")
+        max_in_flight = int(os.getenv(f"{prefix}_MAX_IN_FLIGHT", max_in_flight))
+        return cls(
+            name,
+            requests_per_minute=float(os.getenv(f"{prefix}_RPM", rpm)) / workers,
+            burst=max(1.0, float(burst) / workers) if burst else None,
+            max_in_flight=math.ceil(max_in_flight / workers),
+            queue_timeout=float(os.getenv("COMIC_LIMIT_QUEUE_TIMEOUT", 300)),
+        )
+
+    @contextmanager
+    def _lease(self, key_hash: str) -> Iterator[_KeyLimiter]:
+        """The limiter of ``key_hash``, kept from pruning until the block exits"""
+        with self._lock:
+            limiter = self._limiters.get(key_hash)
+            if limiter is None:
+                if len(self._limiters) >= MAX_TRACKED_KEYS:
+                    for idle_key in [k for k, v in self._limiters.items() if not v.leases and v.idle()]:
+                        del self._limiters[idle_key]
+                limiter = _KeyLimiter(self.rate_per_second, self.burst, self.max_in_flight)
+                self._limiters[key_hash] = limiter
+            limiter.leases += 1
+        try:
+            yield limiter
+        finally:
+            with self._lock:
+                limiter.leases -= 1
+
+    @contextmanager
+    def limit(self, api_key: Optional[str]) -> Iterator[float]:
+        """
+        Hold a slot for one upstream call made with ``api_key``
+
+        Yields:
+            Seconds spent waiting in the queue
+
+        Raises:
+            QueueTimeoutError: If no slot frees up within the queue timeout
+        """
+        if self.rate_per_second <= 0 and not self.max_in_flight:
+            yield 0.0
+            return
+        with self._lease(hash_api_key(api_key)) as limiter:
+            waited = limiter.acquire(next(self._tickets), self.queue_timeout)
+            RATE_LIMIT_WAIT_SECONDS.observe(waited, governor=self.name)
+            if waited > 1.0:
+                logger.info(f"[{self.name}] Waited {waited:.2f}s for a rate-limit slot")
+            try:
+                yield waited
+            finally:
+                limiter.release()
+
+    @asynccontextmanager
+    async def alimit(self, api_key: Optional[str]) -> AsyncIterator[float]:
+        """Async ``limit``: shares the per-key queue and counters with sync callers"""
+        if self.rate_per_second <= 0 and not self.max_in_flight:
+            yield 0.0
+            return
+        with self._lease(hash_api_key(api_key)) as limiter:
+            waited = await limiter.aacquire(next(self._tickets), self.queue_timeout)
+            RATE_LIMIT_WAIT_SECONDS.observe(waited, governor=self.name)
+            if waited > 1.0:
+                logger.info(f"[{self.name}] Waited {waited:.2f}s for a rate-limit slot")
+            try:
+                yield waited
+            finally:
+                limiter.release()
+
+    def awrap(self, api_key: Optional[str], fn: Callable[[], Awaitable[Any]]) -> Callable[[], Awaitable[Any]]:
+        """Async ``wrap`` for a zero-argument coroutine function"""
+        async def governed():
+            async with self.alimit(api_key):
+                return await fn()
+        return governed
+
+    def wrap(self, api_key: Optional[str], fn: Callable[[], Any]) -> Callable[[], Any]:
+        """Return a zero-argument callable running ``fn`` under ``limit(api_key)``"""
+        def governed():
+            with self.limit(api_key):
+                return fn()
+        return governed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-key queue depth, in-flight count and wait times"""
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {
+            "requests_per_minute": round(self.rate_per_second * 60, 2),
+            "burst": self.burst,
+            "max_in_flight": self.max_in_flight,
+            "keys": {key: limiter.stats() for key, limiter in limiters.items()},
+        }
+
+
+gemini_governor = Governor.from_env("gemini", "COMIC_GEMINI", rpm=20, max_in_flight=4)
+llm_governor = Governor.from_env("llm", "COMIC_LLM", rpm=60, max_in_flight=8)
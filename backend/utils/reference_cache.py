@@ -0,0 +1,229 @@
+"""Bounded in-memory cache of re-encoded reference images"""
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Optional, Tuple
+
+# PIL and requests are imported where used so importing this module stays cheap
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+ROLE_SKETCH = "sketch"
+ROLE_STYLE = "style"
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+@dataclass(frozen=True)
+class ReferencePolicy:
+    """How a reference image is shrunk and re-encoded before upload"""
+    max_edge: Optional[int] = None
+    format: str = "JPEG"
+    quality: int = 85
+
+    @classmethod
+    def from_env(cls, prefix: str, max_edge: int, format: str, quality: int) -> "ReferencePolicy":
+        """Read ``<prefix>_MAX_EDGE``, ``<prefix>_FORMAT`` and ``<prefix>_QUALITY``"""
+        edge = int(os.getenv(f"{prefix}_MAX_EDGE", max_edge))
+        fmt = os.getenv(f"{prefix}_FORMAT", format).upper()
+        if fmt not in _MIME_TYPES:
+            raise ValueError(f"Unsupported reference format: {fmt}")
+        return cls(
+            max_edge=edge or None,
+            format=fmt,
+            quality=int(os.getenv(f"{prefix}_QUALITY", quality)),
+        )
+
+
+def _image_bytes(img: "Image.Image") -> int:
+    """Approximate decoded size of an image in memory"""
+    return img.width * img.height * len(img.getbands())
+
+
+def _downscale(img: "Image.Image", max_edge: Optional[int]) -> "Image.Image":
+    """Shrink ``img`` so its long edge is at most ``max_edge`` pixels"""
+    from PIL import Image
+
+    if not max_edge or max(img.size) <= max_edge:
+        return img
+    scale = max_edge / max(img.size)
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.Resampling.LANCZOS)
+
+
+def encode_image(img: "Image.Image", policy: ReferencePolicy) -> Tuple[bytes, str]:
+    """
+    Downscale and re-encode an image according to ``policy``
+
+    Returns:
+        Tuple of (encoded_bytes, mime_type)
+    """
+    from PIL import Image
+
+    img = _downscale(img, policy.max_edge)
+    if policy.format == "JPEG":
+        if img.mode in ("RGBA", "LA", "P"):
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+        img = img.convert("RGBA")
+
+    buffer = io.BytesIO()
+    if policy.format == "PNG":
+        img.save(buffer, format="PNG")
+    elif policy.format == "WEBP":
+        img.save(buffer, format="WEBP", quality=policy.quality, method=4)
+    else:
+        img.save(buffer, format="JPEG", quality=policy.quality, optimize=True)
+    return buffer.getvalue(), _MIME_TYPES[policy.format]
+
+
+class ReferenceImageCache:
+    """
+    LRU cache of reference images shrunk and re-encoded for upload
+
+    Keys identify the source content without decoding it: local files by
+    path, mtime and size, remote URLs by URL and ETag (revalidated with
+    If-None-Match), stored objects by id, and data URIs by a digest of
+    their payload. Each key includes the ``ReferencePolicy``, so a source
+    is decoded and re-encoded once per policy and a hit skips both.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple[bytes, str], int]]" = OrderedDict()
+        self._etags: Dict[Tuple[str, ReferencePolicy], str] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: Hashable) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _put(self, key: Hashable, value: Tuple[bytes, str], size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and self._entries:
+                evicted_key, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+                if evicted_key[0] == "url":
+                    self._etags.pop((evicted_key[1], evicted_key[3]), None)
+
+    @staticmethod
+    def _decode(data: bytes) -> "Image.Image":
+        from PIL import Image
+
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        return img
+
+    @staticmethod
+    def _decode_file(path: str) -> "Image.Image":
+        from PIL import Image
+
+        img = Image.open(path)
+        img.load()
+        return img
+
+    @staticmethod
+    def _file_key(path: str) -> Tuple:
+        st = os.stat(path)
+        return ("file", path, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _data_key(data_uri: str) -> Tuple[Tuple, str]:
+        encoded = data_uri.split(",", 1)[1] if "," in data_uri else data_uri
+        return ("data", hashlib.sha256(encoded.encode("ascii", "ignore")).hexdigest()), encoded
+
+    def _encoded(self, source_key: Optional[Tuple], policy: ReferencePolicy,
+                 decode: Callable[[], "Image.Image"]) -> Tuple[bytes, str]:
+        """Return cached encoded bytes for ``source_key``, encoding ``decode()`` on a miss"""
+        if source_key is None:
+            # Nothing identifies the content (a URL without ETag), so it cannot be reused
+            with self._lock:
+                self.misses += 1
+            return encode_image(decode(), policy)
+        key = source_key + (policy,)
+        cached = self._get(key)
+        if cached is not None:
+            return cached
+        data, mime_type = encode_image(decode(), policy)
+        self._put(key, (data, mime_type), len(data))
+        return data, mime_type
+
+    def load_file_encoded(self, path: str, policy: ReferencePolicy) -> Tuple[bytes, str]:
+        """Load a local image as upload-ready bytes"""
+        return self._encoded(self._file_key(path), policy, lambda: self._decode_file(path))
+
+    def load_data_uri_encoded(self, data_uri: str, policy: ReferencePolicy) -> Tuple[bytes, str]:
+        """Load a data URI as upload-ready bytes"""
+        source_key, encoded = self._data_key(data_uri)
+        return self._encoded(source_key, policy, lambda: self._decode(base64.b64decode(encoded)))
+
+    def load_object_encoded(self, object_id: str, fetch: Callable[[], bytes],
+                            policy: ReferencePolicy) -> Tuple[bytes, str]:
+        """Load an immutable stored object (e.g. from S3) as upload-ready bytes, fetching only on a miss"""
+        return self._encoded(("object", object_id), policy, lambda: self._decode(fetch()))
+
+    def load_url_encoded(self, url: str, policy: ReferencePolicy, timeout: float = 30) -> Tuple[bytes, str]:
+        """Download a remote image as upload-ready bytes, revalidating a cached copy with its ETag"""
+        import requests
+
+        with self._lock:
+            etag = self._etags.get((url, policy))
+        headers = {"If-None-Match": etag} if etag else {}
+        resp = requests.get(url, timeout=timeout, headers=headers)
+        if resp.status_code == 304 and etag:
+            cached = self._get(("url", url, etag, policy))
+            if cached is not None:
+                return cached
+            # Entry was evicted after revalidation started, fetch it again
+            resp = requests.get(url, timeout=timeout)
+        resp.raise_for_status()
+        new_etag = resp.headers.get("ETag")
+        content = resp.content
+        result = self._encoded(("url", url, new_etag) if new_etag else None, policy, lambda: self._decode(content))
+        if new_etag:
+            with self._lock:
+                # Revalidate next time only if there is a cached copy to fall back on
+                if ("url", url, new_etag, policy) in self._entries:
+                    self._etags[(url, policy)] = new_etag
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
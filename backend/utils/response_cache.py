@@ -0,0 +1,355 @@
+"""Response cache for LLM calls with in-memory and SQLite backends"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Per-request cache mode ("cache": "bypass") that skips the lookup and refreshes the entry;
+# shared by the response cache and the generated-image cache
+CACHE_BYPASS = "bypass"
+
+
+def normalize_text(text: str) -> str:
+    """Normalize Unicode and collapse whitespace so trivially different prompts share a key"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_response_key(namespace: str, **params: Any) -> str:
+    """
+    Build a cache key from a namespace and request parameters
+
+    Strings are normalized (Unicode NFKC, collapsed whitespace) and the
+    parameters are serialized with sorted keys, so the key does not depend
+    on argument order or incidental formatting.
+    """
+    payload = json.dumps({"ns": namespace, "params": _normalize(params)},
+                         sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryResponseBackend:
+    """LRU of JSON-serializable responses kept in process memory"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            # Hand out a copy: callers may mutate the response
+            return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (json.dumps(value, ensure_ascii=False), time.time() + ttl_seconds)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteResponseBackend:
+    """
+    Responses persisted in SQLite
+
+    Entries survive restarts and are shared by every worker process that
+    points at the same database file.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+        """)
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (sqlite3 connections are not shared)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now + ttl_seconds, now)
+        )
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % 100 == 0
+        if prune:
+            self._prune(conn, now)
+
+    def _prune(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        conn.execute("""
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+        conn.commit()
+
+    def size(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    Cache of LLM responses keyed by ``make_response_key``
+
+    Concurrent misses for the same key are coalesced: the first caller
+    computes the response and the others wait for it, so a burst of
+    identical requests costs one LLM call.
+    """
+
+    def __init__(self, backend, ttl_seconds: float = 3600.0):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._ainflight: Dict[str, asyncio.Event] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            # A broken cache must never break generation
+            self._count("errors")
+            logger.warning(f"Response cache lookup failed: {e}")
+            return None
+
+    def _store(self, key: str, value: Any) -> None:
+        try:
+            self.backend.set(key, value, self.ttl_seconds)
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Response cache store failed: {e}")
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], bypass: bool = False) -> Any:
+        """
+        Return the cached response for ``key``, calling ``compute`` on a miss
+
+        Args:
+            key: Key built by ``make_response_key``
+            compute: Zero-argument callable producing a JSON-serializable response
+            bypass: Skip the lookup and refresh the entry with a new response
+
+        Returns:
+            The cached or freshly computed response
+        """
+        if bypass:
+            self._count("bypasses")
+            value = compute()
+            self._store(key, value)
+            return value
+
+        value = self._lookup(key)
+        if value is not None:
+            self._count("hits")
+            return value
+
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._inflight[key] = event
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            # Another request is computing this response; use its result
+            event.wait()
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            # It failed: compute on our own rather than failing too
+            self._count("misses")
+            return compute()
+
+        try:
+            value = compute()
+            self._store(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]], bypass: bool = False) -> Any:
+        """
+        Async ``get_or_compute`` for a zero-argument coroutine function
+
+        Backend I/O runs in a thread so SQLite never blocks the event loop.
+        Misses are coalesced between coroutines of the same event loop;
+        threaded callers are coalesced separately by ``get_or_compute``.
+        """
+        if bypass:
+            self._count("bypasses")
+            value = await compute()
+            await asyncio.to_thread(self._store, key, value)
+            return value
+
+        value = await asyncio.to_thread(self._lookup, key)
+        if value is not None:
+            self._count("hits")
+            return value
+
+        event = self._ainflight.get(key)
+        leader = event is None
+        if leader:
+            event = asyncio.Event()
+            self._ainflight[key] = event
+            self._count("misses")
+        else:
+            self._count("coalesced")
+            await event.wait()
+            value = await asyncio.to_thread(self._lookup, key)
+            if value is not None:
+                return value
+            self._count("misses")
+            return await compute()
+
+        try:
+            value = await compute()
+            await asyncio.to_thread(self._store, key, value)
+            return value
+        finally:
+            self._ainflight.pop(key, None)
+            event.set()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached response for ``key`` without computing it"""
+        value = self._lookup(key)
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a response computed outside ``get_or_compute``"""
+        self._store(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        try:
+            entries = self.backend.size()
+        except Exception:
+            entries = None
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "entries": entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_loaded = False
+_response_cache_lock = threading.Lock()
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Build the cache selected by COMIC_RESPONSE_CACHE (memory, sqlite or off, the default)"""
+    backend = os.getenv("COMIC_RESPONSE_CACHE", "off").lower()
+    ttl_seconds = float(os.getenv("COMIC_RESPONSE_CACHE_TTL", 3600))
+    max_entries = int(os.getenv("COMIC_RESPONSE_CACHE_MAX_ENTRIES", 512))
+    if backend in ("off", "0", "false", "none"):
+        return None
+    if backend == "sqlite":
+        default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "responses.db")
+        return ResponseCache(
+            SQLiteResponseBackend(os.getenv("COMIC_RESPONSE_CACHE_DB", default_path), max_entries), ttl_seconds
+        )
+    if backend != "memory":
+        raise ValueError(f"Unknown response cache: {backend}")
+    return ResponseCache(MemoryResponseBackend(max_entries), ttl_seconds)
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the process-wide response cache, or None if disabled"""
+    global _response_cache, _response_cache_loaded
+    with _response_cache_lock:
+        if not _response_cache_loaded:
+            _response_cache = create_response_cache()
+            _response_cache_loaded = True
+        return _response_cache
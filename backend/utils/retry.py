@@ -0,0 +1,340 @@
+"""Shared retry logic: error classification, jittered backoff, deadlines and a retry budget"""
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from utils.metrics import UPSTREAM_ATTEMPT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Gemini finish reasons that will not change on retry (policy / safety blocks)
+TERMINAL_FINISH_REASONS = {
+    "SAFETY", "RECITATION", "BLOCKLIST", "PROHIBITED_CONTENT", "SPII",
+    "IMAGE_SAFETY", "IMAGE_PROHIBITED_CONTENT", "IMAGE_RECITATION", "LANGUAGE",
+}
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# Transport failures of the SDKs, matched by class name so none has to be imported:
+# httpx / openai connection and timeout errors, requests' ConnectionError and Timeout,
+# and malformed structured output from LangChain / pydantic
+RETRYABLE_ERROR_NAMES = {
+    "TransportError", "TimeoutException", "APIConnectionError", "APITimeoutError",
+    "ConnectionError", "Timeout", "IncompleteRead", "OutputParserException", "ValidationError",
+}
+
+# Monotonic time by which the current call_with_retry must be done (None: no deadline)
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("retry_deadline", default=None)
+
+# Set on shutdown so backoff waits end at once instead of holding worker threads
+_stop_waiting = threading.Event()
+
+
+class TerminalError(Exception):
+    """An error that retrying cannot fix"""
+
+
+class RetryableError(Exception):
+    """A transient failure that another attempt may not repeat"""
+
+
+class ContentBlockedError(TerminalError, ValueError):
+    """The model refused to produce content (safety, recitation, ...)"""
+
+    def __init__(self, reason: Any):
+        self.reason = getattr(reason, "name", None) or str(reason)
+        super().__init__(f"Prompt Content Error: {reason}")
+
+
+class NoImageError(RetryableError, ValueError):
+    """The model finished without returning an image"""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How many times, how long and how far apart to retry"""
+    max_attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 20.0
+    deadline: Optional[float] = None
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """Extract an HTTP status code from SDK exceptions (google-genai, openai, requests, httpx)"""
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Classify an exception as retryable (True) or terminal (False)
+
+    Explicit terminal errors and 4xx responses other than timeouts,
+    conflicts and rate limits are terminal. ``RetryableError``, network
+    failures and timeouts, 5xx and 429 are retried. Anything else is
+    treated as a bug and fails at once.
+    """
+    if isinstance(exc, TerminalError):
+        return False
+    if isinstance(exc, RetryableError):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def attempt_timeout(limit: float) -> float:
+    """
+    Timeout for one upstream call: ``limit``, or less if the deadline of the
+    enclosing ``call_with_retry`` comes sooner (at least one second)
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return limit
+    return max(1.0, min(limit, deadline - time.monotonic()))
+
+
+def cancel_retry_waits() -> None:
+    """End every pending and future backoff wait (on shutdown); the last error is raised instead"""
+    _stop_waiting.set()
+
+
+class RetryBudget:
+    """
+    Process-wide token bucket limiting retries to a fraction of requests
+
+    Every first attempt deposits ``ratio`` tokens and every retry spends one,
+    with a small time-based allowance so low traffic can still retry. During
+    an upstream brownout retries stop once the budget is spent instead of
+    multiplying the load.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_tokens: float = 50.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def record_request(self) -> None:
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class RetryStats:
+    """Per-operation attempt counters and timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops: Dict[str, Dict[str, float]] = {}
+
+    def _op(self, name: str) -> Dict[str, float]:
+        return self._ops.setdefault(name, {
+            "calls": 0, "attempts": 0, "successes": 0, "retries": 0,
+            "retryable_errors": 0, "terminal_errors": 0,
+            "budget_exhausted": 0, "deadline_exceeded": 0,
+            "attempt_seconds_sum": 0.0, "attempt_seconds_max": 0.0,
+        })
+
+    def record(self, name: str, **increments: float) -> None:
+        with self._lock:
+            op = self._op(name)
+            for key, value in increments.items():
+                op[key] += value
+
+    def record_attempt(self, name: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            op = self._op(name)
+            op["attempts"] += 1
+            op["attempt_seconds_sum"] += seconds
+            op["attempt_seconds_max"] = max(op["attempt_seconds_max"], seconds)
+            if ok:
+                op["successes"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: dict(values) for name, values in self._ops.items()}
+
+
+retry_budget = RetryBudget(
+    ratio=float(os.getenv("COMIC_RETRY_BUDGET_RATIO", 0.2)),
+    min_per_second=float(os.getenv("COMIC_RETRY_BUDGET_MIN_PER_SECOND", 1.0)),
+    max_tokens=float(os.getenv("COMIC_RETRY_BUDGET_MAX", 50)),
+)
+retry_stats = RetryStats()
+
+
+def llm_retry_policy() -> RetryPolicy:
+    """Retry policy for OpenAI-compatible LLM calls"""
+    return RetryPolicy(
+        max_attempts=int(os.getenv("COMIC_LLM_MAX_ATTEMPTS", 3)),
+        base_delay=float(os.getenv("COMIC_LLM_RETRY_DELAY", 1.0)),
+        max_delay=float(os.getenv("COMIC_RETRY_MAX_DELAY", 20)),
+        deadline=float(os.getenv("COMIC_LLM_DEADLINE", 180)),
+    )
+
+
+def _record_attempt(name: str, seconds: float, ok: bool) -> None:
+    retry_stats.record_attempt(name, seconds, ok)
+    UPSTREAM_ATTEMPT_SECONDS.observe(seconds, operation=name, outcome="ok" if ok else "error")
+
+
+def _next_delay(policy: RetryPolicy, previous: float) -> float:
+    """Decorrelated jitter: uniform between the base delay and 3x the previous delay"""
+    return min(policy.max_delay, random.uniform(policy.base_delay, max(policy.base_delay, previous * 3)))
+
+
+def _should_retry(name: str, policy: RetryPolicy, exc: Exception, attempt: int, delay: float,
+                  started: float) -> bool:
+    """Decide whether a failed attempt gets another try (records why not)"""
+    if not is_retryable(exc):
+        retry_stats.record(name, terminal_errors=1)
+        logger.warning(f"[{name}] Terminal error, not retrying: {exc}")
+        return False
+    retry_stats.record(name, retryable_errors=1)
+    if attempt >= policy.max_attempts or _stop_waiting.is_set():
+        return False
+    if policy.deadline is not None and time.monotonic() - started + delay > policy.deadline:
+        retry_stats.record(name, deadline_exceeded=1)
+        logger.warning(f"[{name}] Retry would exceed the {policy.deadline}s deadline")
+        return False
+    if not retry_budget.try_spend():
+        retry_stats.record(name, budget_exhausted=1)
+        logger.warning(f"[{name}] Retry budget exhausted, not retrying")
+        return False
+    retry_stats.record(name, retries=1)
+    return True
+
+
+def call_with_retry(
+    fn: Callable[[], Any],
+    policy: RetryPolicy,
+    name: str,
+    on_attempt: Optional[Callable[[int, int], None]] = None,
+    on_retry: Optional[Callable[[int, Exception, float], None]] = None,
+) -> Any:
+    """
+    Call ``fn`` until it succeeds, a terminal error occurs or retries run out
+
+    Args:
+        fn: Zero-argument callable performing one attempt
+        policy: Attempts, backoff and overall deadline
+        name: Operation name used for logs and stats
+        on_attempt: Called with (attempt, max_attempts) before each attempt
+        on_retry: Called with (attempt, error, delay_seconds) before each wait
+
+    Returns:
+        The result of the first successful attempt
+
+    Raises:
+        The last attempt's exception
+
+    The backoff wait holds the calling thread, so long-retrying work
+    belongs on the /api/jobs workers or the async ``acall_with_retry``;
+    ``cancel_retry_waits`` ends the waits when the process shuts down.
+    ``fn`` should pass ``attempt_timeout(...)`` as its SDK timeout so the
+    last attempt does not outlive the deadline.
+    """
+    started = time.monotonic()
+    delay = policy.base_delay
+    retry_budget.record_request()
+    retry_stats.record(name, calls=1)
+    token = _deadline.set(started + policy.deadline if policy.deadline is not None else None)
+    try:
+        attempt = 0
+        while True:
+            attempt += 1
+            if on_attempt:
+                on_attempt(attempt, policy.max_attempts)
+            attempt_started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                _record_attempt(name, time.monotonic() - attempt_started, ok=False)
+                logger.warning(f"[{name}] Attempt {attempt}/{policy.max_attempts} failed: {e}")
+                delay = _next_delay(policy, delay)
+                if not _should_retry(name, policy, e, attempt, delay, started):
+                    raise
+                if on_retry:
+                    on_retry(attempt, e, delay)
+                logger.info(f"[{name}] Retrying in {delay:.2f} seconds...")
+                if _stop_waiting.wait(delay):
+                    raise
+                continue
+            _record_attempt(name, time.monotonic() - attempt_started, ok=True)
+            return result
+    finally:
+        _deadline.reset(token)
+
+
+async def acall_with_retry(
+    fn: Callable[[], Awaitable[Any]],
+    policy: RetryPolicy,
+    name: str,
+    on_attempt: Optional[Callable[[int, int], None]] = None,
+    on_retry: Optional[Callable[[int, Exception, float], None]] = None,
+) -> Any:
+    """Async variant of ``call_with_retry``; waits with ``asyncio.sleep``"""
+    started = time.monotonic()
+    delay = policy.base_delay
+    retry_budget.record_request()
+    retry_stats.record(name, calls=1)
+    token = _deadline.set(started + policy.deadline if policy.deadline is not None else None)
+    try:
+        attempt = 0
+        while True:
+            attempt += 1
+            if on_attempt:
+                on_attempt(attempt, policy.max_attempts)
+            attempt_started = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                _record_attempt(name, time.monotonic() - attempt_started, ok=False)
+                logger.warning(f"[{name}] Attempt {attempt}/{policy.max_attempts} failed: {e}")
+                delay = _next_delay(policy, delay)
+                if not _should_retry(name, policy, e, attempt, delay, started):
+                    raise
+                if on_retry:
+                    on_retry(attempt, e, delay)
+                logger.info(f"[{name}] Retrying in {delay:.2f} seconds...")
+                await asyncio.sleep(delay)
+                continue
+            _record_attempt(name, time.monotonic() - attempt_started, ok=True)
+            return result
+    finally:
+        _deadline.reset(token)
@@ -0,0 +1,139 @@
+"""Server-side rendering of page layout sketches from the comic page JSON"""
+import hashlib
+import io
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# PIL is imported where used so importing this module stays cheap
+
+# Bump when the drawing changes, so cached sketches are rendered again
+RENDERER_VERSION = 1
+
+# Geometry of #comic-page / .comic-row / .comic-panel in frontend/css/style.css (CSS pixels)
+PAGE_WIDTH = 600
+PAGE_PADDING = 24
+ROW_GAP = 14
+PANEL_GAP = 12
+PANEL_RADIUS = 10
+DEFAULT_ROW_HEIGHT = 150
+# Upper bound on the page height, so a malformed script cannot allocate a huge canvas
+MAX_PAGE_HEIGHT = 10000
+
+# Light theme colors
+PAGE_BACKGROUND = (255, 255, 255)
+PANEL_GRADIENT = ((0xF5, 0xF5, 0xF7), (0xE8, 0xE8, 0xED))
+# rgba(0, 0, 0, 0.08) over the panel background
+PANEL_BORDER = (0xDF, 0xDF, 0xE2)
+
+
+def _row_height(value: Any) -> int:
+    """Parse a row height the way the renderer's ``style.height`` does for px values"""
+    if isinstance(value, (int, float)) and value > 0:
+        return int(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text.endswith("px"):
+            text = text[:-2].strip()
+        try:
+            height = float(text)
+        except ValueError:
+            return DEFAULT_ROW_HEIGHT
+        if height > 0:
+            return int(height)
+    return DEFAULT_ROW_HEIGHT
+
+
+def page_layout(page_data: Dict[str, Any]) -> List[Tuple[int, List[Optional[str]]]]:
+    """
+    Reduce a comic page to what the sketch shows: row heights and panel colors
+
+    Panel text is not part of the sketch, so pages that differ only in
+    dialogue share one layout.
+
+    Raises:
+        ValueError: If the page has no rows or is taller than MAX_PAGE_HEIGHT
+    """
+    rows = page_data.get("rows") if isinstance(page_data, dict) else None
+    if not isinstance(rows, list) or not rows:
+        raise ValueError("Page data has no rows to sketch")
+    layout = []
+    for row in rows:
+        row = row if isinstance(row, dict) else {}
+        panels = row.get("panels") if isinstance(row.get("panels"), list) else []
+        colors = [panel.get("bg") if isinstance(panel, dict) and isinstance(panel.get("bg"), str) else None
+                  for panel in panels]
+        layout.append((_row_height(row.get("height")), colors))
+    height = 2 * PAGE_PADDING + sum(h for h, _ in layout) + ROW_GAP * (len(layout) - 1)
+    if height > MAX_PAGE_HEIGHT:
+        raise ValueError(f"Page layout is {height}px tall (at most {MAX_PAGE_HEIGHT}px)")
+    return layout
+
+
+def layout_digest(page_data: Dict[str, Any], scale: int = 2) -> str:
+    """Hash of everything that determines the rendered sketch"""
+    payload = json.dumps(
+        {"version": RENDERER_VERSION, "scale": scale, "layout": page_layout(page_data)},
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _panel_fill(size: Tuple[int, int], color: Optional[str]):
+    """A panel's flat ``bg`` color, or the default 135deg gradient"""
+    from PIL import Image, ImageChops, ImageColor
+
+    if color:
+        try:
+            return Image.new("RGB", size, ImageColor.getrgb(color)[:3])
+        except ValueError:
+            pass
+    # Top-left to bottom-right: average of a horizontal and a vertical ramp
+    vertical = Image.linear_gradient("L")
+    diagonal = ImageChops.add(vertical.rotate(90), vertical, scale=2).resize(size)
+    start, end = PANEL_GRADIENT
+    return Image.composite(Image.new("RGB", size, end), Image.new("RGB", size, start), diagonal)
+
+
+def render_sketch(page_data: Dict[str, Any], scale: int = 2) -> bytes:
+    """
+    Draw the panel grid of a page as a PNG
+
+    Mirrors the frontend canvas without text, as html2canvas captured it
+    (scale 2, so 1200 pixels wide): rows of equal-width rounded panels with
+    the CSS paddings and gaps. The output depends only on ``page_layout``.
+    """
+    from PIL import Image, ImageDraw
+
+    layout = page_layout(page_data)
+    width = PAGE_WIDTH * scale
+    height = (2 * PAGE_PADDING + sum(h for h, _ in layout) + ROW_GAP * (len(layout) - 1)) * scale
+    page = Image.new("RGB", (width, height), PAGE_BACKGROUND)
+    draw = ImageDraw.Draw(page)
+    inner_width = (PAGE_WIDTH - 2 * PAGE_PADDING) * scale
+
+    top = PAGE_PADDING * scale
+    for row_height, colors in layout:
+        panel_height = row_height * scale
+        if colors:
+            gaps = PANEL_GAP * scale * (len(colors) - 1)
+            left = PAGE_PADDING * scale
+            for index, color in enumerate(colors):
+                # flex: 1 splits the row evenly between its panels
+                right = PAGE_PADDING * scale + round((inner_width - gaps) * (index + 1) / len(colors)) \
+                    + PANEL_GAP * scale * index
+                size = (max(1, right - left), panel_height)
+                mask = Image.new("L", size, 0)
+                ImageDraw.Draw(mask).rounded_rectangle(
+                    (0, 0, size[0] - 1, size[1] - 1), radius=PANEL_RADIUS * scale, fill=255
+                )
+                page.paste(_panel_fill(size, color), (left, top), mask)
+                draw.rounded_rectangle(
+                    (left, top, left + size[0] - 1, top + size[1] - 1),
+                    radius=PANEL_RADIUS * scale, outline=PANEL_BORDER, width=scale
+                )
+                left = right + PANEL_GAP * scale
+        top += panel_height + ROW_GAP * scale
+
+    buffer = io.BytesIO()
+    page.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
@@ -0,0 +1,111 @@
+"""Content-addressed storage for uploaded page sketches"""
+import hashlib
+import io
+import os
+import re
+import uuid
+from typing import Callable, Optional
+
+HANDLE_PREFIX = "sketch:"
+
+_HANDLE_RE = re.compile(r"^sketch:([0-9a-f]{64})$")
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+_EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp"}
+
+
+class SketchStore:
+    """
+    Stores sketch images once under ``<directory>/<sha256>.<ext>``
+
+    The returned ``sketch:<sha256>`` handle can be passed anywhere a
+    reference image is accepted, so the same bytes are never uploaded or
+    decoded twice.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def save(self, data: bytes) -> dict:
+        """
+        Validate and store sketch bytes
+
+        Returns:
+            Dict with handle, digest and the public URL path
+
+        Raises:
+            ValueError: If the data is too large or not a PNG/JPEG/WebP image
+        """
+        if not data:
+            raise ValueError("Sketch data is empty")
+        if len(data) > self.max_bytes:
+            raise ValueError(f"Sketch exceeds {self.max_bytes // (1024 * 1024)} MB limit")
+        from PIL import Image
+
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                image_format = img.format
+        except Exception:
+            raise ValueError("Sketch is not a valid image")
+        if image_format not in _EXTENSIONS:
+            raise ValueError(f"Unsupported sketch format: {image_format}")
+
+        digest = hashlib.sha256(data).hexdigest()
+        filename = f"{digest}.{_EXTENSIONS[image_format]}"
+        path = os.path.join(self.directory, filename)
+        if not os.path.exists(path):
+            self._write(path, data)
+
+        return {
+            "handle": f"{HANDLE_PREFIX}{digest}",
+            "digest": digest,
+            "url": f"/backend/static/images/sketches/{filename}",
+        }
+
+    def _write(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def save_rendered(self, layout_key: str, render: Callable[[], bytes]) -> dict:
+        """
+        Return the sketch rendered for ``layout_key``, calling ``render`` only on first use
+
+        ``layouts/<layout_key>`` records the digest of the rendered bytes, so
+        every worker (and every restart) renders a given layout once.
+
+        Returns:
+            Same dict as ``save``
+        """
+        alias = os.path.join(self.directory, "layouts", layout_key)
+        try:
+            with open(alias, "r", encoding="ascii") as f:
+                digest = f.read().strip()
+        except (FileNotFoundError, UnicodeDecodeError):
+            digest = None
+        if digest and _DIGEST_RE.match(digest):
+            path = self.resolve(f"{HANDLE_PREFIX}{digest}")
+            if path is not None:
+                return {
+                    "handle": f"{HANDLE_PREFIX}{digest}",
+                    "digest": digest,
+                    "url": f"/backend/static/images/sketches/{os.path.basename(path)}",
+                }
+
+        result = self.save(render())
+        self._write(alias, result["digest"].encode("ascii"))
+        return result
+
+    def resolve(self, handle: str) -> Optional[str]:
+        """Return the file path for a ``sketch:<sha256>`` handle, or None if unknown"""
+        match = _HANDLE_RE.match(handle)
+        if not match:
+            return None
+        for ext in _EXTENSIONS.values():
+            path = os.path.join(self.directory, f"{match.group(1)}.{ext}")
+            if os.path.exists(path):
+                return path
+        return None
+
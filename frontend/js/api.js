@@ -47,6 +47,82 @@ class ComicAPI {
         }
     }
 
+    /**
+     * Generate comic script, receiving each page as soon as it is ready
+     * @param {string} apiKey - OpenAI API key
+     * @param {string} prompt - Comic description
+     * @param {number} pageCount - Number of pages
+     * @param {string} baseUrl - OpenAI API base URL
+     * @param {string} model - Model name
+     * @param {string} comicStyle - Comic style
+     * @param {string} language - Content language
+     * @param {Function} onPage - Called with (page, pageIndex) for each streamed page
+     * @param {string|null} cache - 'bypass' to skip the server's response cache
+     * @returns {Promise<Object>} Final summary ({done, success, page_count})
+     */
+    static async generateComicStream(apiKey, prompt, pageCount, baseUrl, model, comicStyle = 'doraemon', language = 'zh', onPage = null, cache = null) {
+        try {
+            const response = await fetch(`${API_BASE_URL}/generate-stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({
+                    api_key: apiKey,
+                    prompt: prompt,
+                    page_count: pageCount,
+                    base_url: baseUrl,
+                    model: model,
+                    comic_style: comicStyle,
+                    language: language,
+                    cache: cache
+                })
+            });
+
+            if (!response.ok) {
+                const errorData = await response.json();
+                throw new Error(errorData.error || `API request failed: ${response.status}`);
+            }
+
+            // Read newline-delimited JSON pages as they are streamed
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let summary = null;
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let newlineIndex;
+                while ((newlineIndex = buffer.indexOf('\n')) >= 0) {
+                    const line = buffer.slice(0, newlineIndex).trim();
+                    buffer = buffer.slice(newlineIndex + 1);
+                    if (!line) continue;
+
+                    const result = JSON.parse(line);
+                    if (result.done) {
+                        summary = result;
+                    } else if (onPage) {
+                        await onPage(result.page, result.page_index);
+                    }
+                }
+            }
+
+            if (!summary) {
+                throw new Error('Script stream ended unexpectedly');
+            }
+            if (!summary.success) {
+                throw new Error(summary.error || 'Script generation failed');
+            }
+            return summary;
+        } catch (error) {
+            console.error('Streaming API call failed:', error);
+            throw error;
+        }
+    }
+
     /**
      * Validate comic script format
      * @param {Object|Array} script - Comic script to validate
@@ -123,6 +199,72 @@ class ComicAPI {
         }
     }
 
+    /**
+     * Generate images for all pages in one streamed request
+     * @param {Array} pages - Comic pages data
+     * @param {string} googleApiKey - Google API key for image generation
+     * @param {Array} sketches - Per-page sketch references (aligned with pages)
+     * @param {string} comicStyle - Comic style
+     * @param {Function} onPageResult - Called with each page result as it arrives
+     * @param {number} anchorCount - Number of leading pages generated first for consistency
+     * @param {Array} previousPages - Pages generated earlier ({ pageIndex, imageUrl }), used as references
+     * @returns {Promise<Object>} Final summary ({ done, succeeded, total })
+     */
+    static async generateComicImagesBatch(pages, googleApiKey, sketches = null, comicStyle = 'doraemon', onPageResult = null, anchorCount = 1, previousPages = null) {
+        try {
+            const response = await fetch(`${API_BASE_URL}/generate-images`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({
+                    pages: pages,
+                    google_api_key: googleApiKey,
+                    sketches: sketches,
+                    comic_style: comicStyle,
+                    anchor_count: anchorCount,
+                    extra_body: previousPages
+                })
+            });
+
+            if (!response.ok) {
+                const errorData = await response.json();
+                throw new Error(errorData.error || `API request failed: ${response.status}`);
+            }
+
+            // Read newline-delimited JSON results as they are streamed
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let summary = null;
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let newlineIndex;
+                while ((newlineIndex = buffer.indexOf('\n')) >= 0) {
+                    const line = buffer.slice(0, newlineIndex).trim();
+                    buffer = buffer.slice(newlineIndex + 1);
+                    if (!line) continue;
+
+                    const result = JSON.parse(line);
+                    if (result.done) {
+                        summary = result;
+                    } else if (onPageResult) {
+                        await onPageResult(result);
+                    }
+                }
+            }
+
+            return summary;
+        } catch (error) {
+            console.error('Batch image generation failed:', error);
+            throw error;
+        }
+    }
+
     /**
      * Generate social media post content (Xiaohongshu or Twitter)
      * @param {string} apiKey - OpenAI API key
@@ -130,9 +272,10 @@ class ComicAPI {
      * @param {string} baseUrl - OpenAI API base URL
      * @param {string} model - Model name
      * @param {string} platform - Platform type ('xiaohongshu' or 'twitter')
+     * @param {string|null} cache - 'bypass' to skip the server's response cache
      * @returns {Promise<Object>} Generated social media content
      */
-    static async generateSocialMediaContent(apiKey, comicData, baseUrl, model, platform = 'xiaohongshu') {
+    static async generateSocialMediaContent(apiKey, comicData, baseUrl, model, platform = 'xiaohongshu', cache = null) {
         try {
             const response = await fetch(`${API_BASE_URL}/generate-xiaohongshu`, {
                 method: 'POST',
@@ -144,7 +287,8 @@ class ComicAPI {
                     comic_data: comicData,
                     base_url: baseUrl,
                     model: model,
-                    platform: platform
+                    platform: platform,
+                    cache: cache
                 })
             });
 
@@ -203,6 +347,76 @@ class ComicAPI {
             throw error;
         }
     }
+
+    /**
+     * Export generated pages as one file (PDF, CBZ or long-strip image) built by the backend
+     * @param {Array} pages - Page images ({ imageUrl, pageIndex } objects or URLs)
+     * @param {string} format - pdf, cbz, png or webp
+     * @param {string} cover - Optional cover image URL, placed first
+     * @param {string} title - Optional title for the file name
+     * @returns {Promise<Object>} { downloadUrl, filename }
+     */
+    static async exportComic(pages, format = 'pdf', cover = null, title = null) {
+        try {
+            const response = await fetch(`${API_BASE_URL}/export`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({
+                    pages: pages,
+                    format: format,
+                    cover: cover,
+                    title: title
+                })
+            });
+
+            if (!response.ok) {
+                const errorData = await response.json();
+                throw new Error(errorData.error || `API request failed: ${response.status}`);
+            }
+
+            // The export is built as a background job; poll until it is ready
+            const { job_id: jobId } = await response.json();
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const jobResponse = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+                if (!jobResponse.ok) {
+                    throw new Error(`API request failed: ${jobResponse.status}`);
+                }
+                const job = await jobResponse.json();
+                if (job.status === 'failed') {
+                    throw new Error(job.error || 'Export failed');
+                }
+                if (job.status === 'succeeded') {
+                    return {
+                        downloadUrl: `${API_BASE_URL}${job.result.download_url.replace(/^\/api/, '')}`,
+                        filename: job.result.download_name
+                    };
+                }
+            }
+        } catch (error) {
+            console.error('Export failed:', error);
+            throw error;
+        }
+    }
+
+    /**
+     * Build a srcset of resized WebP variants for a generated image
+     * @param {string} imageUrl - Generated image URL (/backend/static/images/...)
+     * @param {Array<number>} widths - Variant widths to offer
+     * @returns {string} srcset value, or '' for images that are not stored by the backend
+     */
+    static imageSrcset(imageUrl, widths = [400, 800, 1200]) {
+        const prefix = '/backend/static/images/';
+        if (typeof imageUrl !== 'string' || !imageUrl.startsWith(prefix)) {
+            return '';
+        }
+        const key = imageUrl.slice(prefix.length).split('?')[0];
+        return widths
+            .map(width => `${API_BASE_URL}/images/${key}?w=${width}&fmt=webp ${width}w`)
+            .join(', ');
+    }
 }
 
 // Export for use in other modules
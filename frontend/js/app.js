@@ -8,6 +8,9 @@ class UIController {
         this.renderer = new ComicRenderer('comic-page');
         this.isGenerating = false;
         this.generatedPagesImages = {}; // Store generated images by page index for reference
+        this.coverImageUrl = null; // Latest generated cover, included in exports
+        this.lastScriptRequest = null; // Repeating these requests bypasses the response cache
+        this.lastSocialRequest = null;
 
         // Initialize session manager
         this.sessionManager = new SessionManager();
@@ -293,46 +296,24 @@ class UIController {
             this.generateBtn.innerHTML = '<span class="spinner" style="margin-right: 0;"></span>';
             // this.showStatus(window.i18n.t('statusGenerating', { model: config.model }), 'info');
 
-            // Call API
-            const result = await ComicAPI.generateComic(
+            // Asking again for the same script is a regenerate: skip the server's response cache
+            const requestKey = JSON.stringify([prompt, pageCount, comicStyle, language, config.baseUrl, config.model]);
+            const cache = requestKey === this.lastScriptRequest ? 'bypass' : null;
+            this.lastScriptRequest = requestKey;
+
+            // Call API, showing each page as soon as it is streamed
+            const result = await ComicAPI.generateComicStream(
                 apiKey,
                 prompt,
                 pageCount,
                 config.baseUrl,
                 config.model,
                 comicStyle,
-                language
+                language,
+                (page, pageIndex) => this.onScriptPageStreamed(page, pageIndex),
+                cache
             );
 
-            // Reset generated images when loading new JSON
-            this.generatedPagesImages = {};
-
-            // Hide cover generation button
-            const coverBtn = document.getElementById('generate-cover-btn');
-            if (coverBtn) {
-                coverBtn.style.display = 'none';
-            }
-
-            // Update page manager
-            this.pageManager.setPages(result.pages);
-
-            // Show render current page button
-            if (this.renderCurrentBtn) {
-                this.renderCurrentBtn.style.display = 'inline-flex';
-            }
-
-            // Show navigation and generate all button if multiple pages
-            if (result.page_count > 1) {
-                this.pageNav.style.display = 'flex';
-                this.generateAllBtn.style.display = 'inline-flex';
-            } else {
-                this.pageNav.style.display = 'none';
-                this.generateAllBtn.style.display = 'none';
-            }
-
-            // Load first page
-            this.loadCurrentPage();
-
             // Show success
             this.showStatus(window.i18n.t('statusSuccess', { count: result.page_count }), 'success');
             setTimeout(() => this.hideStatus(), 3000);
@@ -356,6 +337,51 @@ class UIController {
         }
     }
 
+    /**
+     * Show a page of a streamed AI script as soon as it arrives
+     * @param {Object} page - Page data
+     * @param {number} pageIndex - Index of the page in the script
+     */
+    onScriptPageStreamed(page, pageIndex) {
+        if (pageIndex === 0) {
+            // Reset generated images when loading new JSON
+            this.generatedPagesImages = {};
+            this.coverImageUrl = null;
+
+            // Hide cover generation button
+            const coverBtn = document.getElementById('generate-cover-btn');
+            if (coverBtn) {
+                coverBtn.style.display = 'none';
+            }
+
+            // Update page manager
+            this.pageManager.setPages([page]);
+
+            // Show render current page button
+            if (this.renderCurrentBtn) {
+                this.renderCurrentBtn.style.display = 'inline-flex';
+            }
+
+            this.pageNav.style.display = 'none';
+            this.generateAllBtn.style.display = 'none';
+
+            // Load first page
+            this.loadCurrentPage();
+            return;
+        }
+
+        // Later pages extend the script without disturbing the page being viewed
+        this.pageManager.addPage(page);
+        const current = this.pageManager.getCurrentPageIndex() + 1;
+        const total = this.pageManager.getPageCount();
+        this.pageIndicator.innerText = ' (' + window.i18n.t('pageIndicator', { current, total }) + ')';
+        this.nextBtn.disabled = !this.pageManager.hasNextPage();
+
+        // Show navigation and generate all button once there are multiple pages
+        this.pageNav.style.display = 'flex';
+        this.generateAllBtn.style.display = 'inline-flex';
+    }
+
     /**
      * Render comic from JSON input
      */
@@ -538,10 +564,6 @@ class UIController {
 
             this.showStatus(window.i18n.t('statusPreparing'), 'info');
 
-            // Get current sketch as base64 (layout only, without text)
-            const element = this.renderer.getContainer();
-            const sketchBase64 = await ComicExporter.getBase64WithoutText(element);
-
             // Get current comic style
             const comicStyle = this.comicStyleSelect.value;
 
@@ -563,8 +585,8 @@ class UIController {
                 }
             }
 
-            // Call API to generate image with sketch as reference
-            const result = await ComicAPI.generateComicImage(pageData, googleApiKey, sketchBase64, previousPages, comicStyle);
+            // Call API to generate image; the backend draws the layout sketch from pageData
+            const result = await ComicAPI.generateComicImage(pageData, googleApiKey, null, previousPages, comicStyle);
 
             if (result.success && result.image_url) {
                 // Store the generated image for this page
@@ -626,80 +648,78 @@ class UIController {
             return;
         }
 
+        // Only pages without an image are generated; the others are kept as references
+        const pages = this.pageManager.getAllPages();
+        const missing = [];
+        for (let i = 0; i < totalPages; i++) {
+            if (!this.generatedPagesImages[i]) missing.push(i);
+        }
+        if (missing.length === 0) {
+            this.showStatus(window.i18n.t('statusAllSuccess', { total: totalPages }), 'success');
+            return;
+        }
+
         // Confirm with user
-        if (!confirm(window.i18n.t('alertGenerateAll', { total: totalPages }))) {
+        if (!confirm(window.i18n.t('alertGenerateAll', { total: missing.length }))) {
             return;
         }
 
-        // Clear and reset generated images storage for batch generation
-        this.generatedPagesImages = {};
         const comicStyle = this.comicStyleSelect.value;
         const originalPageIndex = this.pageManager.getCurrentPageIndex();
+        const previousPages = Object.values(this.generatedPagesImages)
+            .sort((a, b) => a.pageIndex - b.pageIndex)
+            .slice(-6);
 
         try {
             // Disable buttons during generation - only disable and add spinner, no text change
             this.generateAllBtn.disabled = true;
             this.generateAllBtn.classList.add('loading');
 
-            for (let i = 0; i < totalPages; i++) {
-                // Update status with spinner
-                this.showStatus(window.i18n.t('statusGeneratingPage', { current: i + 1, total: totalPages }), 'info');
-
-                // Navigate to the page
-                this.pageManager.setCurrentPageIndex(i);
-                this.loadCurrentPage();
-
-                // Wait for rendering
-                await this._delay(300);
-
-                // Get current page data
-                const pageData = this.pageManager.getCurrentPage();
-
-                // Get current sketch as base64 (layout only)
-                const element = this.renderer.getContainer();
-                const sketchBase64 = await ComicExporter.getBase64WithoutText(element);
+            this.showStatus(window.i18n.t('statusGeneratingPage', { current: 1, total: missing.length }), 'info');
 
-                // Prepare reference images (use previous 6 generated pages from member variable)
-                let previousPages = null;
-                const prevImages = Object.values(this.generatedPagesImages)
-                    .filter(img => img.pageIndex < i)
-                    .sort((a, b) => b.pageIndex - a.pageIndex)
-                    .slice(0, 6)
-                    .reverse();
-                if (prevImages.length > 0) {
-                    previousPages = prevImages;
-                }
+            // Generate the missing pages on the backend; results stream back as each page finishes.
+            // The backend draws each page's layout sketch, so only page data is sent
+            const failedPages = [];
+            let doneCount = 0;
+            const summary = await ComicAPI.generateComicImagesBatch(
+                missing.map(i => pages[i]),
+                googleApiKey,
+                null,
+                comicStyle,
+                async (result) => {
+                    const i = missing[result.page_index];
+                    if (!result.success || !result.image_url) {
+                        failedPages.push(i + 1);
+                        return;
+                    }
 
-                // Generate image with sketch and previous pages as reference
-                // Pass sketch as reference_img and previous pages as extra_body
-                const result = await ComicAPI.generateComicImage(
-                    pageData,
-                    googleApiKey,
-                    sketchBase64,
-                    previousPages,  // Pass previous pages as extra_body parameter
-                    comicStyle
-                );
-
-                if (result.success && result.image_url) {
-                    // Store in both local array and member variable
-                    const imageData = {
+                    this.generatedPagesImages[i] = {
                         pageIndex: i,
                         imageUrl: result.image_url,
-                        pageTitle: pageData.title || `Page ${i + 1}`
+                        pageTitle: pages[i].title || `Page ${i + 1}`
                     };
-                    this.generatedPagesImages[i] = imageData;
+
+                    doneCount++;
+                    this.showStatus(window.i18n.t('statusGeneratingPage', { current: Math.min(doneCount + 1, missing.length), total: missing.length }), 'info');
 
                     // Show the generated image on canvas with flip animation
+                    this.pageManager.setCurrentPageIndex(i);
+                    this.loadCurrentPage();
                     await this.showGeneratedImageOnCanvas(result.image_url);
 
                     // Save session state after each page generation
                     this.saveCurrentSessionState();
-                } else {
-                    throw new Error(`第 ${i + 1} 页生成失败`);
-                }
+                },
+                // Existing pages already fix the characters and style, so no new anchor is needed
+                previousPages.length > 0 ? 0 : 1,
+                previousPages
+            );
 
-                // Small delay between generations
-                await this._delay(500);
+            if (!summary) {
+                throw new Error('Batch generation was interrupted');
+            }
+            if (failedPages.length > 0) {
+                throw new Error(`第 ${failedPages.sort((a, b) => a - b).join(', ')} 页生成失败`);
             }
 
             // Restore original page
@@ -780,6 +800,12 @@ class UIController {
 
         // Create image
         const img = document.createElement('img');
+        // Let the browser pick a resized variant for the 600px canvas; the original stays the fallback
+        const srcset = ComicAPI.imageSrcset(imageUrl);
+        if (srcset) {
+            img.srcset = srcset;
+            img.sizes = '600px';
+        }
         img.src = imageUrl;
         img.className = 'generated-comic-image';
 
@@ -831,6 +857,12 @@ class UIController {
 
         // Create image
         const img = document.createElement('img');
+        // Let the browser pick a resized variant for the 600px canvas; the original stays the fallback
+        const srcset = ComicAPI.imageSrcset(imageUrl);
+        if (srcset) {
+            img.srcset = srcset;
+            img.sizes = '600px';
+        }
         img.src = imageUrl;
         img.className = 'generated-comic-image';
 
@@ -959,12 +991,18 @@ class UIController {
 
             const config = ConfigManager.getCurrentConfig();
 
+            // Same comic again is a regenerate: skip the server's response cache
+            const requestKey = JSON.stringify([comicData, platform, config.baseUrl, config.model]);
+            const cache = requestKey === this.lastSocialRequest ? 'bypass' : null;
+            this.lastSocialRequest = requestKey;
+
             const result = await ComicAPI.generateSocialMediaContent(
                 apiKey,
                 comicData,
                 config.baseUrl,
                 config.model,
-                platform
+                platform,
+                cache
             );
 
             if (result.success) {
@@ -988,6 +1026,45 @@ class UIController {
         }
     }
 
+    /**
+     * Export the generated pages (and cover) as one file built by the backend
+     * @param {string} format - pdf, cbz, png (long strip) or webp (long strip)
+     */
+    async exportComic(format) {
+        const pages = Object.values(this.generatedPagesImages || {})
+            .filter(page => page && page.imageUrl)
+            .sort((a, b) => a.pageIndex - b.pageIndex);
+
+        if (pages.length === 0) {
+            alert(window.i18n.t('alertNoGeneratedImages'));
+            return;
+        }
+
+        try {
+            this.showStatus(window.i18n.t('statusExporting'), 'info');
+
+            const session = this.sessionManager ? this.sessionManager.getCurrentSession() : null;
+            const { downloadUrl, filename } = await ComicAPI.exportComic(
+                pages,
+                format,
+                this.coverImageUrl,
+                session ? session.name : null
+            );
+
+            // The browser streams the attachment to disk itself
+            const link = document.createElement('a');
+            link.download = filename;
+            link.href = downloadUrl;
+            link.click();
+
+            this.hideStatus();
+        } catch (error) {
+            console.error('Export failed:', error);
+            this.showStatus(window.i18n.t('statusError', { error: error.message }), 'error');
+            alert(window.i18n.t('statusError', { error: error.message }));
+        }
+    }
+
     /**
      * Display social media content in a modal
      * @param {string} title - Post title
@@ -1264,6 +1341,7 @@ class UIController {
                 setTimeout(() => this.hideStatus(), 3000);
 
                 // Display result
+                this.coverImageUrl = result.image_url;
                 this.displayGeneratedImage(result.image_url);
             } else {
                 throw new Error(result.error || 'Generaton failed');
@@ -1358,6 +1436,7 @@ class UIController {
         }
 
         // Restore generated images
+        this.coverImageUrl = null;
         if (session.generatedImages) {
             this.generatedPagesImages = session.generatedImages;
 
@@ -1392,6 +1471,7 @@ class UIController {
 
         // Clear and reset current state
         this.generatedPagesImages = {};
+        this.coverImageUrl = null;
         this.pageManager.setPages([]);
         this.jsonInput.value = '';
 
@@ -1446,6 +1526,7 @@ class UIController {
 
         // Clear current state
         this.generatedPagesImages = {};
+        this.coverImageUrl = null;
         this.pageManager.setPages([]);
         this.jsonInput.value = '';
 
@@ -1676,6 +1757,10 @@ function generateXiaohongshuContent() {
     if (app) app.generateXiaohongshuContent();
 }
 
+function exportComic(format) {
+    if (app) app.exportComic(format);
+}
+
 function generateCover() {
     if (app) app.generateCover();
 }
@@ -123,47 +123,6 @@ class ComicExporter {
         }
     }
 
-    /**
-     * Get element as base64 data URL without text content (layout only)
-     * @param {HTMLElement} element - Element to convert
-     * @returns {Promise<string>} Base64 data URL
-     */
-    static async getBase64WithoutText(element) {
-        try {
-            if (!window.html2canvas) {
-                throw new Error('html2canvas library not loaded');
-            }
-
-            // Find all comic panels and temporarily hide their text
-            const panels = element.querySelectorAll('.comic-panel');
-            const originalTexts = [];
-            
-            // Store original text and clear it
-            panels.forEach(panel => {
-                originalTexts.push(panel.innerText);
-                panel.innerText = '';
-            });
-
-            // Generate canvas without text
-            const canvas = await html2canvas(element, {
-                backgroundColor: '#ffffff',
-                scale: 2,
-                logging: false,
-                useCORS: true
-            });
-
-            // Restore original text
-            panels.forEach((panel, index) => {
-                panel.innerText = originalTexts[index];
-            });
-
-            return canvas.toDataURL('image/png');
-        } catch (error) {
-            console.error('Get base64 without text failed:', error);
-            throw error;
-        }
-    }
-
     /**
      * Delay helper
      * @param {number} ms - Milliseconds to delay
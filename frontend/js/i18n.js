@@ -74,6 +74,11 @@ const i18n = {
             exportText: '导出',
             xiaohongshuMenuItem: '生成社媒文案',
             socialMediaContent: '生成社媒文案',
+            exportPdf: '导出 PDF',
+            exportCbz: '导出 CBZ 漫画包',
+            exportStrip: '导出长图',
+            statusExporting: '正在导出...',
+            alertNoGeneratedImages: '请先生成漫画图片',
 
             // Edit hint
             editHint: '💡 点击任意面板可直接编辑内容',
@@ -220,6 +225,11 @@ const i18n = {
             exportText: 'Export',
             xiaohongshuMenuItem: 'Generate Social Post',
             socialMediaContent: 'Generate Social Post',
+            exportPdf: 'Export PDF',
+            exportCbz: 'Export CBZ',
+            exportStrip: 'Export Long Image',
+            statusExporting: 'Exporting...',
+            alertNoGeneratedImages: 'Generate comic images first',
 
             // Edit hint
             editHint: '💡 Click any panel to edit content directly',
@@ -21,6 +21,14 @@ class PageManager {
         this.currentPageIndex = 0;
     }
 
+    /**
+     * Append a page without changing the current page
+     * @param {Object} page - Page data
+     */
+    addPage(page) {
+        this.pages.push(page);
+    }
+
     /**
      * Get current page data
      * @returns {Object|null} Current page data